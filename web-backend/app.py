@@ -1,16 +1,19 @@
 from flask import Flask
 from flask_cors import CORS
 from config import Config
-from extensions import db, migrate
+from extensions import db, migrate, sock
 from routes import register_routes
+from utils.video_jobs import video_job_manager
+from utils.rollups import ensure_rollups
+from utils.detection_writer import detection_writer
+from utils.training_jobs import training_job_manager
+from utils.dataset_ingest import dataset_ingest_manager
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
 import sqlite3
 
-def create_app():
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    
+def _init_db(app):
+    """初始化数据库（SQLite PRAGMA 和引擎参数）"""
     # 配置 SQLite 连接参数，解决数据库锁定问题
     # 使用事件监听器在每次创建连接时设置 PRAGMA
     @event.listens_for(Engine, "connect")
@@ -54,16 +57,47 @@ def create_app():
             except Exception as e:
                 print(f"Warning: Could not configure SQLite engine options: {e}")
                 # 即使配置失败，事件监听器中的 PRAGMA 设置仍然有效
+
+def create_worker_app():
+    """
+    训练进程使用的最小应用：只加载配置和数据库，不注册路由，
+    不启动检测写入、导入/训练调度等后台服务，也不做建表和统计回填（由 Web 进程负责）
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    _init_db(app)
+    return app
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    _init_db(app)
     
     migrate.init_app(app, db)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    sock.init_app(app)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-Detections'])  # 二进制JPEG响应的检测结果放在响应头中
     
     # Register routes
     register_routes(app)
     
+    # 异步视频检测任务（首个请求时恢复未完成的任务）
+    video_job_manager.init_app(app)
+    # 数据集后台导入（首个请求时恢复未完成的导入任务）
+    dataset_ingest_manager.init_app(app)
+    # 训练任务队列（首个请求时启动调度，恢复中断的训练任务）
+    training_job_manager.init_app(app)
+    # 检测记录延迟批量写入（按配置开启）
+    detection_writer.init_app(app)
+    
     # Create tables
     with app.app_context():
         db.create_all()
+        # create_all 不会为已存在的表补建新增的索引
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        # 升级后首次启动时根据已有检测记录生成统计聚合表
+        ensure_rollups()
     
     return app
 
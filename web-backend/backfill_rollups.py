@@ -0,0 +1,11 @@
+"""
+Rebuild detection statistics rollups from raw detection records
+"""
+from app import create_app
+from utils.rollups import backfill_rollups
+
+app = create_app()
+
+with app.app_context():
+    processed = backfill_rollups()
+    print(f'Detection rollups rebuilt from {processed} detections')
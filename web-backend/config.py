@@ -22,6 +22,8 @@ class Config:
     # File upload settings
     UPLOAD_FOLDER = Path('uploads')
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB
+    # 是否归档上传检测的原始图片到 uploads/images（用于审计），默认只在内存中处理
+    ARCHIVE_UPLOADED_IMAGES = os.environ.get('ARCHIVE_UPLOADED_IMAGES', 'false').lower() == 'true'
     
     # Model settings
     MODELS_FOLDER = Path('models')
@@ -31,6 +33,111 @@ class Config:
     CONFIDENCE_THRESHOLD = 0.25
     IOU_THRESHOLD = 0.45
     
+    # Model cache settings（进程内模型缓存，LRU淘汰）
+    MODEL_CACHE_MAX_MODELS = int(os.environ.get('MODEL_CACHE_MAX_MODELS', 4))  # 最多常驻的模型数量
+    MODEL_CACHE_MAX_MEMORY_MB = int(os.environ.get('MODEL_CACHE_MAX_MEMORY_MB', 1024))  # 按权重文件大小估算的内存预算，0表示不限制
+    MODEL_FILE_INDEX_TTL = 60  # 模型列表中文件存在性检查结果的缓存时间（秒），/api/models/sync 会立即刷新
+    
+    # Result cache settings（相同图片的检测结果缓存）
+    RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_MAX_MEMORY_MB = int(os.environ.get('RESULT_CACHE_MAX_MEMORY_MB', 256))  # 内存缓存上限（按结果JSON大小计算）
+    RESULT_CACHE_DISK_ENABLED = os.environ.get('RESULT_CACHE_DISK_ENABLED', 'false').lower() == 'true'  # 磁盘缓存（uploads/result_cache），进程重启后仍可命中
+    RESULT_CACHE_DISK_MAX_MB = int(os.environ.get('RESULT_CACHE_DISK_MAX_MB', 2048))  # 磁盘缓存上限，超过后删除最旧的结果
+    
+    # Model export settings（发布时导出CPU推理后端，需要安装 requirements-export.txt 中的可选依赖，默认关闭）
+    EXPORT_ON_PUBLISH = os.environ.get('EXPORT_ON_PUBLISH', 'false').lower() == 'true'
+    EXPORT_FORMATS = [f.strip() for f in os.environ.get('EXPORT_FORMATS', 'onnx').split(',') if f.strip()]  # 可选 onnx, openvino
+    EXPORT_INT8 = os.environ.get('EXPORT_INT8', 'false').lower() == 'true'  # 额外生成INT8量化的ONNX（需要 onnxruntime）
+    EXPORT_IMGSZ = 640
+    # 存在导出产物时优先使用，按顺序选择第一个可用的后端（加载失败的产物跳过，回退到 .pt）
+    PREFER_EXPORTED_BACKEND = os.environ.get('PREFER_EXPORTED_BACKEND', 'false').lower() == 'true'
+    INFERENCE_BACKEND_PREFERENCE = ['openvino', 'onnx_int8', 'onnx', 'pytorch']
+    BENCHMARK_RUNS = 20  # 后端延迟基准测试的推理次数
+    BENCHMARK_MAX_RUNS = 50  # 手动基准测试请求允许的最大推理次数（后台执行，仍会占用CPU）
+    EXPORT_TIMEOUT = 3600  # 导出开始后超过该时间（秒）仍未结束视为失败（例如进程在导出过程中重启）
+    BENCHMARK_TIMEOUT = 1800  # 基准测试开始后超过该时间（秒）仍未结束视为失败
+    
+    # Batch detection settings
+    BATCH_MAX_IMAGES = 32  # /api/detect/batch 单次请求最多图片数
+    BATCH_INFERENCE_SIZE = 8  # 每次前向推理的最大批量
+    # 微批处理：合并同一模型上并发的 /image 和 /realtime/frame 请求
+    MICRO_BATCH_ENABLED = os.environ.get('MICRO_BATCH_ENABLED', 'true').lower() == 'true'
+    MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 8))  # 单次合并的最大请求数
+    MICRO_BATCH_MAX_WAIT_MS = int(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 10))  # 收集请求的最长等待时间（毫秒）
+    
+    # 标注图片：JPEG 编码质量（1-100）和标签文字掩码缓存的条目数
+    ANNOTATION_JPEG_QUALITY = int(os.environ.get('ANNOTATION_JPEG_QUALITY', 75))
+    ANNOTATION_SPRITE_CACHE_SIZE = 1024
+    # 预览图尺寸（长边像素数），请求参数 preview=small/medium/large 时返回缩小的标注图片
+    PREVIEW_SIZES = {'small': 320, 'medium': 640, 'large': 1280}
+    
+    # Video pipeline settings（解码/推理/写入分阶段并行）
+    VIDEO_PIPELINE_QUEUE_SIZE = 16  # 阶段之间队列的最大帧数（背压）
+    VIDEO_INFERENCE_BATCH_SIZE = 4  # 视频推理阶段每批检测的帧数
+    # 跳帧跟踪：在未检测的帧上用IoU跟踪器预测框的位置，并按轨迹统计去重人数
+    VIDEO_TRACKING_ENABLED = True
+    TRACKER_IOU_THRESHOLD = 0.3  # 检测框与轨迹关联的最小IoU
+    TRACKER_MAX_AGE = 30  # 轨迹连续多少帧未匹配后删除
+    TRACKER_MIN_HITS = 2  # 轨迹至少匹配多少次才计入人数统计
+    TRACKER_PREDICT_MAX_MISSES = 1  # 跳过的帧只绘制最近连续未匹配不超过该检测帧数的已确认轨迹
+    
+    # 静止画面跳过推理（实时检测和视频检测）：缩小为灰度小图与上一次推理的帧比较，变化像素比例低于阈值时复用检测结果
+    SCENE_SKIP_ENABLED = os.environ.get('SCENE_SKIP_ENABLED', 'false').lower() == 'true'  # 会改变结果的精度，默认关闭
+    SCENE_CHANGE_THRESHOLD = float(os.environ.get('SCENE_CHANGE_THRESHOLD', 0.002))  # 变化像素比例阈值
+    SCENE_CHANGE_PIXEL_DELTA = 20  # 灰度差超过该值的像素计为变化像素
+    SCENE_CHANGE_SIZE = 96  # 比较用小图的宽度（像素）
+    SCENE_CHANGE_MAX_SKIP = 50  # 连续复用超过该帧数后强制推理一次
+    
+    # Realtime settings（实时检测会话与WebSocket流）
+    REALTIME_STREAM_CONFIG_TIMEOUT = 10  # 等待第一条配置消息的超时时间（秒）
+    REALTIME_STREAM_MAX_FRAME_AGE_MS = 1000  # 帧在服务端等待超过该时间则丢弃
+    REALTIME_SESSION_IDLE_TIMEOUT = 300  # 实时检测会话空闲超时（秒），超时后保存统计并移除
+    REALTIME_MAX_SESSIONS = 64  # 单进程最多同时存在的实时检测会话数，0表示不限制
+    
+    # Video job settings（异步视频检测任务）
+    VIDEO_JOB_WORKERS = int(os.environ.get('VIDEO_JOB_WORKERS', 2))  # 同时处理的视频任务数
+    VIDEO_JOB_MAX_PENDING = 20  # 排队和运行中的任务上限
+    VIDEO_JOB_PROGRESS_INTERVAL = 1.0  # 进度写入数据库的最小间隔（秒）
+    VIDEO_JOB_HEARTBEAT_INTERVAL = 15  # 处理任务的进程心跳间隔（秒）
+    VIDEO_JOB_HEARTBEAT_TIMEOUT = 120  # 心跳超时后认为处理进程已退出，任务重新排队
+    
+    # Dataset index settings（上传时扫描一次数据集，生成索引）
+    DATASET_INDEX_WORKERS = int(os.environ.get('DATASET_INDEX_WORKERS', 0))  # 扫描线程数，0表示按CPU核数自动选择
+    
+    # Dataset ingest settings（数据集ZIP导入）
+    DATASET_INGEST_WORKERS = 1  # 同时执行的后台导入任务数
+    DATASET_KEEP_ARCHIVE = os.environ.get('DATASET_KEEP_ARCHIVE', 'true').lower() == 'true'  # 导入后是否保留上传的ZIP（可由请求参数 keep_archive 覆盖）
+    DATASET_INGEST_CHUNK_SIZE = 1024 * 1024  # 上传写入和解压的块大小（字节）
+    DATASET_INGEST_PROGRESS_INTERVAL = 1.0  # 进度写入数据库的最小间隔（秒）
+    
+    # Training job settings（训练任务队列，由独立的训练进程执行）
+    TRAINING_MAX_CONCURRENT = int(os.environ.get('TRAINING_MAX_CONCURRENT', 1))  # 同时运行的训练进程数
+    TRAINING_CPU_THREADS = int(os.environ.get('TRAINING_CPU_THREADS', 0))  # 每个训练进程的CPU线程数，0表示按核数平均分配
+    TRAINING_PIN_CPUS = os.environ.get('TRAINING_PIN_CPUS', 'true').lower() == 'true'  # 将训练进程绑定到固定的CPU核心（Linux）
+    TRAINING_POLL_INTERVAL = 2  # 调度器检查队列的间隔（秒）
+    TRAINING_HEARTBEAT_INTERVAL = 15  # 训练进程心跳间隔（秒）
+    TRAINING_HEARTBEAT_TIMEOUT = 120  # 心跳超时后认为训练进程已退出，任务重新排队
+    TRAINING_CANCEL_GRACE = 60  # 取消后等待当前轮次结束的最长时间（秒），超时强制结束训练进程
+    TRAINING_STREAM_KEEPALIVE = 15  # 训练进度推送（SSE）的保活间隔（秒），同时按此间隔检查 results.csv 的新增轮次
+    TRAINING_STREAM_QUEUE_SIZE = 100  # 每个订阅连接缓存的进度事件上限
+    
+    # Detection record write settings（检测记录延迟批量写入）
+    DETECTION_WRITE_BEHIND = os.environ.get('DETECTION_WRITE_BEHIND', 'false').lower() == 'true'
+    DETECTION_WRITE_BATCH_SIZE = 100  # 每批最多写入的记录数
+    DETECTION_WRITE_FLUSH_MS = 200  # 距第一条未写入记录的最长等待时间（毫秒）
+    DETECTION_WRITE_QUEUE_SIZE = 10000  # 队列上限，写满后退化为同步写入
+    DETECTION_WRITE_RETRIES = 3  # 批量提交失败后的重试次数，仍失败时逐条提交
+    DETECTION_WRITE_RETRY_BACKOFF_MS = 200  # 第一次重试前的等待时间（毫秒），之后每次翻倍
+    
+    # Box storage settings（逐框检测结果存储，用于离线分析）
+    BOX_STORAGE_ENABLED = os.environ.get('BOX_STORAGE_ENABLED', 'false').lower() == 'true'
+    BOX_EXPORT_CHUNK_SIZE = 65536  # 导出时每次读取的记录数
+    
+    # Statistics settings
+    STATISTICS_MAX_BUCKETS = 2000  # 单次统计最多返回的时间段数量（如按小时统计约83天）
+    HISTORY_MAX_PAGE_SIZE = 500  # 检测历史每页最多记录数
+    HISTORY_EXPORT_BATCH_SIZE = 1000  # 导出检测历史时每次从数据库读取的记录数
+    
     # Create necessary directories
     UPLOAD_FOLDER.mkdir(exist_ok=True)
     MODELS_FOLDER.mkdir(exist_ok=True)
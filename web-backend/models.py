@@ -1,5 +1,7 @@
 from datetime import datetime
 from extensions import db
+from sqlalchemy.orm import declared_attr
+from utils.model_files import model_file_index
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 
@@ -60,25 +62,31 @@ class Model(db.Model):
         """设置训练参数"""
         self.training_params_json = json.dumps(params)
     
-    def to_dict(self):
+    @staticmethod
+    def load_dataset_names(models):
+        """一次 IN 查询获取多个模型训练参数中数据集的名称，返回 {数据集ID: 名称}"""
+        dataset_ids = set()
+        for model in models:
+            training_params = model.get_training_params()
+            if training_params and training_params.get('dataset_id'):
+                dataset_ids.add(training_params['dataset_id'])
+        if not dataset_ids:
+            return {}
+        rows = db.session.query(Dataset.id, Dataset.name).filter(Dataset.id.in_(dataset_ids)).all()
+        return dict(rows)
+    
+    def to_dict(self, dataset_names=None):
+        """dataset_names 为 load_dataset_names 的结果，列表接口传入以避免逐个查询数据集"""
         # 获取数据集名称（如果有训练参数）
-        dataset_name = None
+        if dataset_names is None:
+            dataset_names = Model.load_dataset_names([self])
         training_params = self.get_training_params()
+        dataset_name = None
         if training_params and training_params.get('dataset_id'):
-            dataset = Dataset.query.get(training_params.get('dataset_id'))
-            if dataset:
-                dataset_name = dataset.name
+            dataset_name = dataset_names.get(training_params.get('dataset_id'))
         
-        # 检查模型文件是否存在
-        from pathlib import Path
-        file_exists = False
-        if self.path:
-            file_exists = Path(self.path).exists()
-            # 如果文件不存在且状态是completed或published，更新状态
-            if not file_exists and self.status in ['completed', 'published']:
-                # 注意：这里不直接修改数据库，只标记在返回数据中
-                # 实际的数据库更新应该在API层面处理
-                pass
+        # 检查模型文件是否存在（使用缓存的文件索引）
+        file_exists = model_file_index.exists(self.path)
         
         return {
             'id': self.id,
@@ -136,6 +144,12 @@ class Detection(db.Model):
     total = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 统计接口按时间范围+检测类型分组查询；检测历史按 (created_at, id) 游标分页
+    __table_args__ = (
+        db.Index('ix_detections_created_at_type', 'created_at', 'detection_type'),
+        db.Index('ix_detections_created_at_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -148,3 +162,209 @@ class Detection(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+class DetectionRollupMixin:
+    """检测记录预聚合（按时间段、模型、用户、检测类型），统计接口读取聚合表而不是扫描原始记录"""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, nullable=False)  # 时间段起点（UTC）
+    # 不设外键：删除模型/用户后历史统计仍然保留，0 表示未知
+    model_id = db.Column(db.Integer, nullable=False, default=0)
+    user_id = db.Column(db.Integer, nullable=False, default=0)
+    detection_type = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)  # 检测记录数
+    with_helmet = db.Column(db.Integer, nullable=False, default=0)
+    without_helmet = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    
+    @declared_attr
+    def __table_args__(cls):
+        return (
+            db.UniqueConstraint('bucket_start', 'model_id', 'user_id', 'detection_type',
+                                name=f'uq_{cls.__tablename__}_key'),
+        )
+    
+    def to_dict(self):
+        return {
+            'bucket_start': self.bucket_start.isoformat(),
+            'model_id': self.model_id or None,
+            'user_id': self.user_id or None,
+            'detection_type': self.detection_type,
+            'count': self.count,
+            'with_helmet': self.with_helmet,
+            'without_helmet': self.without_helmet,
+            'total': self.total
+        }
+
+
+class DetectionRollupHourly(DetectionRollupMixin, db.Model):
+    __tablename__ = 'detection_rollups_hourly'
+
+
+class DetectionRollupDaily(DetectionRollupMixin, db.Model):
+    __tablename__ = 'detection_rollups_daily'
+
+
+class VideoJob(db.Model):
+    __tablename__ = 'video_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('models.id'), nullable=True)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed, cancelled
+    input_path = db.Column(db.String(255), nullable=False)  # 上传的原始视频
+    output_path = db.Column(db.String(255))  # 检测结果视频
+    result_path = db.Column(db.String(255))  # 检测结果JSON（关键帧、统计摘要）
+    confidence = db.Column(db.Float)
+    detection_fps = db.Column(db.Integer)
+    frames_done = db.Column(db.Integer, default=0)
+    frames_total = db.Column(db.Integer, default=0)
+    fps = db.Column(db.Float, default=0)  # 处理速度（帧/秒）
+    cancel_requested = db.Column(db.Boolean, default=False)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # 处理任务的进程定期更新，超时说明进程已退出
+    
+    def to_dict(self):
+        progress = 0
+        if self.frames_total:
+            progress = min(1.0, (self.frames_done or 0) / self.frames_total)
+        elif self.status == 'completed':
+            progress = 1.0
+        
+        # 根据当前处理速度估算剩余时间（秒）
+        eta = None
+        if self.status == 'running' and self.fps and self.frames_total:
+            eta = max(0, self.frames_total - (self.frames_done or 0)) / self.fps
+        
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'model_id': self.model_id,
+            'status': self.status,
+            'confidence': self.confidence,
+            'detection_fps': self.detection_fps,
+            'frames_done': self.frames_done or 0,
+            'frames_total': self.frames_total or 0,
+            'progress': progress,
+            'fps': self.fps or 0,
+            'eta': eta,
+            'cancel_requested': bool(self.cancel_requested),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class TrainingJob(db.Model):
+    __tablename__ = 'training_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('models.id'), nullable=False, index=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), nullable=True)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed, cancelled
+    params_json = db.Column(db.Text)  # 训练参数（epochs, batch, imgsz, base_model, device）
+    resume = db.Column(db.Boolean, default=False)  # 从 last.pt 继续训练
+    previous_model_status = db.Column(db.String(20))  # 取消训练后恢复的模型状态
+    epochs_done = db.Column(db.Integer, default=0)
+    epochs_total = db.Column(db.Integer, default=0)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    worker_pid = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, default=0)  # 启动次数（重启后恢复会增加）
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # 训练进程定期更新，超时说明进程已退出
+    finished_at = db.Column(db.DateTime)
+    
+    def get_params(self):
+        if self.params_json:
+            return json.loads(self.params_json)
+        return {}
+    
+    def set_params(self, params):
+        self.params_json = json.dumps(params)
+    
+    def to_dict(self):
+        progress = 0
+        if self.epochs_total:
+            progress = min(1.0, (self.epochs_done or 0) / self.epochs_total)
+        elif self.status == 'completed':
+            progress = 1.0
+        
+        return {
+            'id': self.id,
+            'model_id': self.model_id,
+            'dataset_id': self.dataset_id,
+            'status': self.status,
+            'params': self.get_params(),
+            'resume': bool(self.resume),
+            'epochs_done': self.epochs_done or 0,
+            'epochs_total': self.epochs_total or 0,
+            'progress': progress,
+            'cancel_requested': bool(self.cancel_requested),
+            'attempts': self.attempts or 0,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class DatasetIngestJob(db.Model):
+    __tablename__ = 'dataset_ingest_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed
+    archive_path = db.Column(db.String(255), nullable=False)  # 上传的ZIP（解压前的临时位置）
+    archive_name = db.Column(db.String(255))  # 原始文件名
+    archive_size = db.Column(db.BigInteger, default=0)
+    archive_sha256 = db.Column(db.String(64))
+    keep_archive = db.Column(db.Boolean, default=True)  # 解压后是否保留ZIP
+    files_done = db.Column(db.Integer, default=0)
+    files_total = db.Column(db.Integer, default=0)
+    bytes_done = db.Column(db.BigInteger, default=0)  # 已解压的字节数（解压后大小）
+    bytes_total = db.Column(db.BigInteger, default=0)
+    result_json = db.Column(db.Text)  # 导入结果（数量统计、警告、数据集索引摘要）
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def get_result(self):
+        if self.result_json:
+            return json.loads(self.result_json)
+        return None
+    
+    def set_result(self, result):
+        self.result_json = json.dumps(result, ensure_ascii=False)
+    
+    def to_dict(self):
+        progress = 0
+        if self.bytes_total:
+            progress = min(1.0, (self.bytes_done or 0) / self.bytes_total)
+        elif self.status == 'completed':
+            progress = 1.0
+        
+        return {
+            'id': self.id,
+            'dataset_id': self.dataset_id,
+            'status': self.status,
+            'archive_name': self.archive_name,
+            'archive_size': self.archive_size or 0,
+            'archive_sha256': self.archive_sha256,
+            'keep_archive': bool(self.keep_archive),
+            'files_done': self.files_done or 0,
+            'files_total': self.files_total or 0,
+            'bytes_done': self.bytes_done or 0,
+            'bytes_total': self.bytes_total or 0,
+            'progress': progress,
+            'result': self.get_result(),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
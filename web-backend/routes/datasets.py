@@ -1,15 +1,16 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
-from models import Dataset, db
+from models import Dataset, DatasetIngestJob, db
 from utils.auth import login_required, admin_required
 from pathlib import Path
 from config import Config
 from datetime import datetime
 import os
 import zipfile
-import shutil
-import tempfile
 import yaml
+import numpy as np
+from utils.dataset_index import build_dataset_index, dataset_index_cache, load_index_arrays, SPLIT_CODES
+from utils.dataset_ingest import dataset_ingest_manager, save_upload, inspect_archive, CLIENT_ERRORS, ERROR_DATASET_NOT_FOUND
 
 datasets_bp = Blueprint('datasets', __name__)
 
@@ -23,7 +24,70 @@ def get_datasets():
 @login_required
 def get_dataset(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
-    return jsonify(dataset.to_dict()), 200
+    result = dataset.to_dict()
+    # 数据集统计来自上传时生成的索引，不遍历数据集目录
+    result['index'] = dataset_index_cache.load(Config.UPLOAD_FOLDER / 'datasets' / str(dataset_id))
+    return jsonify(result), 200
+
+@datasets_bp.route('/<int:dataset_id>/index', methods=['GET'])
+@login_required
+def get_dataset_index(dataset_id):
+    """数据集索引摘要（按划分的图片/标签数量、类别分布、检测框大小分布），没有索引时扫描一次"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    if dataset.status != 'validated':
+        return jsonify({'message': '数据集未验证'}), 400
+    summary = dataset_index_cache.get_or_build(Config.UPLOAD_FOLDER / 'datasets' / str(dataset_id))
+    if summary is None:
+        return jsonify({'message': '数据集目录不存在'}), 404
+    return jsonify(summary), 200
+
+@datasets_bp.route('/<int:dataset_id>/index', methods=['POST'])
+@admin_required
+def rebuild_dataset_index(dataset_id):
+    """重新扫描数据集目录生成索引（手动修改数据集文件后调用）"""
+    Dataset.query.get_or_404(dataset_id)
+    dataset_dir = Config.UPLOAD_FOLDER / 'datasets' / str(dataset_id)
+    if not dataset_dir.is_dir():
+        return jsonify({'message': '数据集目录不存在'}), 404
+    summary = build_dataset_index(dataset_dir)
+    dataset_index_cache.invalidate(dataset_dir)
+    return jsonify(summary), 200
+
+@datasets_bp.route('/<int:dataset_id>/index/images', methods=['GET'])
+@login_required
+def get_dataset_index_images(dataset_id):
+    """
+    按索引分页列出图片（路径、尺寸、检测框数量、标签状态）
+    - 查询参数：split（train/val/test）、label_status（0 正常，1 缺少标签，2 空标签，3 格式错误）、page、per_page
+    """
+    Dataset.query.get_or_404(dataset_id)
+    arrays = load_index_arrays(Config.UPLOAD_FOLDER / 'datasets' / str(dataset_id))
+    if arrays is None:
+        return jsonify({'message': '数据集索引不存在'}), 404
+    
+    mask = np.ones(len(arrays['paths']), dtype=bool)
+    split = request.args.get('split')
+    if split:
+        if split not in SPLIT_CODES:
+            return jsonify({'message': 'split 只能是 train、val 或 test'}), 400
+        mask &= arrays['split'] == SPLIT_CODES[split]
+    label_status = request.args.get('label_status', type=int)
+    if label_status is not None:
+        mask &= arrays['label_status'] == label_status
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    selected = np.nonzero(mask)[0]
+    split_names = {code: name for name, code in SPLIT_CODES.items()}
+    items = [{
+        'path': str(arrays['paths'][i]),
+        'split': split_names[int(arrays['split'][i])],
+        'width': int(arrays['width'][i]),
+        'height': int(arrays['height'][i]),
+        'boxes': int(arrays['box_count'][i]),
+        'label_status': int(arrays['label_status'][i])
+    } for i in selected[(page - 1) * per_page:page * per_page]]
+    return jsonify({'items': items, 'total': int(len(selected)), 'page': page, 'per_page': per_page}), 200
 
 @datasets_bp.route('', methods=['POST'])
 @admin_required
@@ -82,6 +146,7 @@ def delete_dataset(dataset_id):
     if dataset_dir.exists():
         import shutil
         shutil.rmtree(dataset_dir)
+    dataset_index_cache.invalidate(dataset_dir)
     
     db.session.delete(dataset)
     db.session.commit()
@@ -97,62 +162,30 @@ def count_images_in_directory(directory):
                 count += 1
     return count
 
-def validate_dataset_structure(dataset_dir):
-    """验证数据集目录结构是否符合要求"""
-    errors = []
-    warnings = []
-    
-    # 检查data.yaml（可选，但推荐）
-    data_yaml = dataset_dir / 'data.yaml'
-    if not data_yaml.exists():
-        warnings.append('未找到data.yaml配置文件（可选）')
-    
-    # 检查必需的目录结构
-    required_dirs = {
-        'train/images': '训练图片目录',
-        'train/labels': '训练标签目录',
-        'valid/images': '验证图片目录',
-        'valid/labels': '验证标签目录'
-    }
-    
-    optional_dirs = {
-        'test/images': '测试图片目录',
-        'test/labels': '测试标签目录'
-    }
-    
-    for dir_path, desc in required_dirs.items():
-        full_path = dataset_dir / dir_path
-        if not full_path.exists() or not full_path.is_dir():
-            errors.append(f'缺少必需目录: {dir_path} ({desc})')
-    
-    for dir_path, desc in optional_dirs.items():
-        full_path = dataset_dir / dir_path
-        if not full_path.exists() or not full_path.is_dir():
-            warnings.append(f'缺少可选目录: {dir_path} ({desc})')
-    
-    return errors, warnings
-
-def analyze_dataset_structure(dataset_dir):
-    """分析数据集目录结构，返回训练/验证/测试集统计"""
+def analyze_dataset_structure(dataset_dir, index=None):
+    """分析数据集目录结构，返回训练/验证/测试集统计（标准结构的数量来自数据集索引）"""
     train_count = 0
     val_count = 0
     test_count = 0
     
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
-    
     # 优先检查标准结构: train/images, valid/images, test/images
-    train_images_dir = dataset_dir / 'train' / 'images'
-    valid_images_dir = dataset_dir / 'valid' / 'images'
-    test_images_dir = dataset_dir / 'test' / 'images'
-    
-    if train_images_dir.exists() and train_images_dir.is_dir():
-        train_count = count_images_in_directory(train_images_dir)
-    
-    if valid_images_dir.exists() and valid_images_dir.is_dir():
-        val_count = count_images_in_directory(valid_images_dir)
-    
-    if test_images_dir.exists() and test_images_dir.is_dir():
-        test_count = count_images_in_directory(test_images_dir)
+    if index is not None:
+        train_count = index['splits']['train']['images']
+        val_count = index['splits']['val']['images']
+        test_count = index['splits']['test']['images']
+    else:
+        train_images_dir = dataset_dir / 'train' / 'images'
+        valid_images_dir = dataset_dir / 'valid' / 'images'
+        test_images_dir = dataset_dir / 'test' / 'images'
+        
+        if train_images_dir.exists() and train_images_dir.is_dir():
+            train_count = count_images_in_directory(train_images_dir)
+        
+        if valid_images_dir.exists() and valid_images_dir.is_dir():
+            val_count = count_images_in_directory(valid_images_dir)
+        
+        if test_images_dir.exists() and test_images_dir.is_dir():
+            test_count = count_images_in_directory(test_images_dir)
     
     # 如果没有找到标准结构，尝试其他常见结构
     if train_count == 0 and val_count == 0 and test_count == 0:
@@ -186,8 +219,8 @@ def analyze_dataset_structure(dataset_dir):
     
     return train_count, val_count, test_count
 
-def update_data_yaml_paths(dataset_dir):
-    """更新data.yaml文件中的路径，使其指向正确的数据集目录"""
+def update_data_yaml_paths(dataset_dir, index=None):
+    """更新data.yaml文件中的路径，使其指向正确的数据集目录（类别数优先根据数据集索引推断）"""
     data_yaml_path = dataset_dir / 'data.yaml'
     
     if not data_yaml_path.exists():
@@ -200,9 +233,12 @@ def update_data_yaml_paths(dataset_dir):
         nc = 2  # 默认值
         names = ['helmet', 'no_helmet']  # 默认类别
         
-        # 尝试从现有标签文件推断类别
+        # 尝试从现有标签文件推断类别（有索引时使用全部标签中的最大类别ID）
         train_labels_dir = train_dir / 'labels'
-        if train_labels_dir.exists():
+        if index is not None:
+            if index.get('max_class_id') is not None:
+                nc = index['max_class_id'] + 1
+        elif train_labels_dir.exists():
             # 读取第一个标签文件来推断类别数
             for label_file in train_labels_dir.glob('*.txt'):
                 try:
@@ -282,142 +318,129 @@ def update_data_yaml_paths(dataset_dir):
         print(f"Warning: Failed to update data.yaml: {str(e)}")
         return False
 
-@datasets_bp.route('/<int:dataset_id>/upload', methods=['POST'])
-@admin_required
-def upload_dataset(dataset_id):
-    dataset = Dataset.query.get_or_404(dataset_id)
-    
-    if 'file' not in request.files and 'zip' not in request.files:
-        return jsonify({'message': '未提供文件'}), 400
-    
-    # 优先检查ZIP文件
-    zip_file = request.files.get('zip') or request.files.get('file')
-    if not zip_file or zip_file.filename == '':
-        return jsonify({'message': '未选择文件'}), 400
+def _receive_archive(dataset, keep_archive=None):
+    """
+    接收上传的ZIP并创建导入任务，返回 (任务, None) 或 (None, 错误响应)：
+    - multipart/form-data 的 zip 或 file 字段，或请求体直接为ZIP（Content-Type: application/zip，文件名由查询参数 filename 指定，
+      不经过 multipart 解析的临时文件）
+    - 上传流直接写入数据集目录（写入时计算SHA-256），读取ZIP中央目录检查目录结构，不符合要求时不解压
+    """
+    if request.mimetype in ('application/zip', 'application/x-zip-compressed', 'application/octet-stream'):
+        filename = secure_filename(request.args.get('filename', '') or 'dataset.zip')
+        stream = request.stream
+    else:
+        if 'file' not in request.files and 'zip' not in request.files:
+            return None, (jsonify({'message': '未提供文件'}), 400)
+        # 优先检查ZIP文件
+        zip_file = request.files.get('zip') or request.files.get('file')
+        if not zip_file or zip_file.filename == '':
+            return None, (jsonify({'message': '未选择文件'}), 400)
+        filename = secure_filename(zip_file.filename)
+        stream = zip_file.stream
     
     # 检查文件扩展名
-    filename = secure_filename(zip_file.filename)
     if not filename.lower().endswith('.zip'):
-        return jsonify({'message': '只支持ZIP格式文件'}), 400
+        return None, (jsonify({'message': '只支持ZIP格式文件'}), 400)
+    if dataset_ingest_manager.active_job(dataset.id):
+        return None, (jsonify({'message': '该数据集正在导入，请等待导入完成'}), 409)
     
-    dataset_dir = Config.UPLOAD_FOLDER / 'datasets' / str(dataset_id)
+    dataset_dir = Config.UPLOAD_FOLDER / 'datasets' / str(dataset.id)
     dataset_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 使用临时目录保存ZIP文件，避免触发Flask reloader
-    temp_dir = Path(tempfile.gettempdir())
-    temp_zip_path = temp_dir / f'dataset_{dataset_id}_{filename}'
-    
+    # 写入过程中不使用 .zip 扩展名，避免触发 Flask reloader
+    archive_path = dataset_dir / f'.{filename}.part'
     try:
-        # 先保存到临时目录
-        zip_file.save(str(temp_zip_path))
-        
-        # 计算ZIP文件大小
-        file_size = os.path.getsize(temp_zip_path)
-        
-        # 移动到最终位置（原子操作，减少触发reloader的机会）
-        zip_path = dataset_dir / filename
-        if zip_path.exists():
-            zip_path.unlink()
-        shutil.move(str(temp_zip_path), str(zip_path))
-        
-        # 解压ZIP文件
-        extract_dir = dataset_dir / 'extracted'
-        if extract_dir.exists():
-            shutil.rmtree(extract_dir)
-        extract_dir.mkdir(parents=True, exist_ok=True)
-        
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        
-        # 如果解压后的目录只有一个子目录，移动到dataset_dir根目录
-        extracted_items = list(extract_dir.iterdir())
-        if len(extracted_items) == 1 and extracted_items[0].is_dir():
-            # 将子目录内容移动到dataset_dir
-            for item in extracted_items[0].iterdir():
-                dest = dataset_dir / item.name
-                if item.is_dir():
-                    if dest.exists():
-                        shutil.rmtree(dest)
-                    shutil.move(str(item), str(dest))
-                else:
-                    shutil.move(str(item), str(dest))
-            shutil.rmtree(extract_dir)
-        else:
-            # 将extracted目录内容移动到dataset_dir
-            for item in extract_dir.iterdir():
-                dest = dataset_dir / item.name
-                if dest.exists():
-                    if dest.is_dir():
-                        shutil.rmtree(dest)
-                    else:
-                        dest.unlink()
-                shutil.move(str(item), str(dest))
-            shutil.rmtree(extract_dir)
-        
-        # 验证数据集结构
-        errors, warnings = validate_dataset_structure(dataset_dir)
-        if errors:
-            # 保存验证失败原因到数据库
-            error_reason = '；'.join(errors)  # 用分号连接多个错误
-            dataset.status = 'failed'
-            dataset.error_reason = error_reason
-            db.session.commit()
-            # 如果有必需目录缺失，返回错误
-            return jsonify({
-                'message': '数据集格式不符合要求',
-                'errors': errors,
-                'warnings': warnings
-            }), 400
-        
-        # 分析数据集结构
-        train_count, val_count, test_count = analyze_dataset_structure(dataset_dir)
-        total_count = train_count + val_count + test_count
-        
-        # 更新data.yaml文件中的路径，使其指向正确的数据集目录
-        update_data_yaml_paths(dataset_dir)
-        
-        # 更新数据集信息
-        dataset.image_count = total_count
-        dataset.file_size = file_size
-        dataset.train_count = train_count
-        dataset.val_count = val_count
-        dataset.test_count = test_count
-        if total_count > 0:
-            dataset.status = 'validated'
-            dataset.error_reason = None  # 验证通过，清除错误原因
-        else:
-            dataset.status = 'failed'
-            dataset.error_reason = '数据集中没有找到图片文件'
-        
-        db.session.commit()
-        
-        # 删除ZIP文件（可选，保留原始ZIP文件）
-        # zip_path.unlink()
-        
-        response_message = f'数据集上传成功，共 {total_count} 张图片'
-        if warnings:
-            response_message += f'（警告: {"; ".join(warnings)}）'
-        
-        return jsonify({
-            'message': response_message,
-            'image_count': total_count,
-            'train_count': train_count,
-            'val_count': val_count,
-            'test_count': test_count,
-            'file_size': file_size,
-            'status': dataset.status,
-            'warnings': warnings if warnings else []
-        }), 200
-        
-    except zipfile.BadZipFile:
-        # 清理临时文件
-        if temp_zip_path.exists():
-            temp_zip_path.unlink()
-        return jsonify({'message': 'ZIP文件格式错误或已损坏'}), 400
+        file_size, sha256 = save_upload(stream, archive_path)
+        plan, errors, warnings = inspect_archive(archive_path, dataset_dir)
+    except (zipfile.BadZipFile, ValueError) as e:
+        if archive_path.exists():
+            archive_path.unlink()
+        message = 'ZIP文件格式错误或已损坏' if isinstance(e, zipfile.BadZipFile) else str(e)
+        return None, (jsonify({'message': message}), 400)
     except Exception as e:
-        db.session.rollback()
-        # 清理临时文件
-        if temp_zip_path.exists():
-            temp_zip_path.unlink()
-        return jsonify({'message': f'处理ZIP文件失败: {str(e)}'}), 500
+        if archive_path.exists():
+            archive_path.unlink()
+        return None, (jsonify({'message': f'处理ZIP文件失败: {str(e)}'}), 500)
+    
+    if errors:
+        archive_path.unlink()
+        # 保存验证失败原因到数据库
+        dataset.status = 'failed'
+        dataset.error_reason = '；'.join(errors)  # 用分号连接多个错误
+        db.session.commit()
+        # 如果有必需目录缺失，返回错误
+        return None, (jsonify({
+            'message': '数据集格式不符合要求',
+            'errors': errors,
+            'warnings': warnings
+        }), 400)
+    
+    if keep_archive is None:
+        keep_archive = request.args.get('keep_archive', request.form.get('keep_archive'))
+    if keep_archive is None:
+        keep_archive = Config.DATASET_KEEP_ARCHIVE
+    elif isinstance(keep_archive, str):
+        keep_archive = keep_archive.lower() == 'true'
+    
+    job = DatasetIngestJob(
+        dataset_id=dataset.id,
+        status='queued',
+        archive_path=str(archive_path),
+        archive_name=filename,
+        archive_size=file_size,
+        archive_sha256=sha256,
+        keep_archive=keep_archive,
+        files_total=len(plan),
+        bytes_total=sum(info.file_size for info, _ in plan)
+    )
+    # 导入完成前数据集不可用于训练
+    dataset.status = 'pending'
+    dataset.error_reason = None
+    db.session.add(job)
+    db.session.commit()
+    return job, None
+
+@datasets_bp.route('/<int:dataset_id>/upload', methods=['POST'])
+@admin_required
+def upload_dataset(dataset_id):
+    """上传数据集ZIP并在请求中完成导入（大文件建议使用 /ingest 在后台导入）"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    job, error_response = _receive_archive(dataset)
+    if error_response:
+        return error_response
+    
+    dataset_ingest_manager.run(job.id)
+    db.session.expire_all()
+    job = DatasetIngestJob.query.get(job.id)
+    result = job.get_result() or {'message': job.error or '处理ZIP文件失败'}
+    if job.status != 'completed':
+        kind = result.get('error_kind')
+        status = 400 if kind in CLIENT_ERRORS else 404 if kind == ERROR_DATASET_NOT_FOUND else 500
+        return jsonify(result), status
+    return jsonify(result), 200
 
+@datasets_bp.route('/<int:dataset_id>/ingest', methods=['POST'])
+@admin_required
+def ingest_dataset(dataset_id):
+    """上传数据集ZIP，检查目录结构后在后台解压并生成索引，立即返回导入任务"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    job, error_response = _receive_archive(dataset)
+    if error_response:
+        return error_response
+    
+    dataset_ingest_manager.submit(job.id)
+    return jsonify({'message': '数据集已上传，正在后台导入', 'job': job.to_dict()}), 202
+
+@datasets_bp.route('/<int:dataset_id>/ingest', methods=['GET'])
+@admin_required
+def get_dataset_ingest_jobs(dataset_id):
+    """数据集的导入任务（最近的在前）"""
+    Dataset.query.get_or_404(dataset_id)
+    jobs = DatasetIngestJob.query.filter_by(dataset_id=dataset_id).order_by(DatasetIngestJob.id.desc()).limit(20).all()
+    return jsonify([job.to_dict() for job in jobs]), 200
+
+@datasets_bp.route('/ingest-jobs/<int:job_id>', methods=['GET'])
+@admin_required
+def get_dataset_ingest_job(job_id):
+    """导入任务进度（已解压的文件数和字节数）和结果"""
+    job = DatasetIngestJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict()), 200
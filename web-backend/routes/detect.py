@@ -1,30 +1,55 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 from pathlib import Path
 from config import Config
-from utils.auth import login_required, get_current_user
-from utils.detection import DetectionService
-from models import Detection, Model, db
+from utils.auth import login_required, admin_required, get_current_user, verify_token
+from utils.detection import DetectionService, load_yolo_model, decode_image_bytes
+from utils.model_registry import model_registry
+from utils.model_export import resolve_inference_path, load_inference_model, mark_backend_failed
+from utils.detection_writer import detection_writer
+from utils.box_store import box_store
+from utils.result_cache import result_cache, content_hash, make_key
+from utils.video_jobs import video_job_manager
+from utils.realtime_stream import LatestFrameSlot
+from utils.realtime_sessions import RealtimeSession, realtime_sessions
+from models import Detection, Model, User, VideoJob, db
+from extensions import sock
+from simple_websocket import ConnectionClosed
 from datetime import datetime
-import os
+import base64
+import json
+import threading
+import time
+import uuid
 
 detect_bp = Blueprint('detect', __name__)
 
-# Global detection service instance
-detection_service = None
-realtime_active = False
-realtime_stats = {}  # 存储实时检测的统计数据
-
-def get_detection_service(model_id=None):
-    global detection_service
+def get_detection_service(model_id=None, use_batcher=False, model=None):
+    """获取模型的检测服务，调用方已查询过模型时通过 model 传入，不再重复查询"""
     if model_id:
-        model = Model.query.get(model_id)
+        model = model if model is not None else Model.query.get(model_id)
         if not model:
             raise ValueError(f'模型 ID {model_id} 不存在')
         if not Path(model.path).exists():
             raise FileNotFoundError(f'模型文件不存在: {model.path}')
         try:
-            return DetectionService(model.path)
+            # 从进程级模型缓存获取已加载的模型，命中时不再重新加载权重
+            # 存在导出的ONNX/OpenVINO产物时优先使用，产物生成后缓存键随之变化并自动重新加载
+            inference_path = resolve_inference_path(model.path)
+            try:
+                entry = model_registry.get(model_id, inference_path, load_inference_model)
+            except Exception as e:
+                if inference_path == Path(model.path):
+                    raise
+                # 导出的后端无法加载（缺少 onnxruntime/openvino 或产物损坏），记录失败并回退到 .pt 权重
+                print(f"Exported backend {inference_path} failed for model {model_id}, falling back to .pt: {str(e)}")
+                mark_backend_failed(inference_path, e)
+                entry = model_registry.get(model_id, Path(model.path), load_yolo_model)
+            service = DetectionService(model.path, model=entry.model, inference_lock=entry.lock)
+            if use_batcher and Config.MICRO_BATCH_ENABLED:
+                # 同一模型共享一个微批处理器，合并并发的单图请求
+                service.batcher = model_registry.get_batcher(entry, service._predict)
+            return service
         except Exception as e:
             error_msg = str(e)
             # 处理常见的模型加载错误
@@ -38,6 +63,92 @@ def get_detection_service(model_id=None):
                 raise RuntimeError(f'无法加载模型: {error_msg}')
     raise ValueError('必须指定模型ID，不能使用默认模型')
 
+def _archive_upload(data, filename):
+    """按配置归档上传的原始图片（用于审计）"""
+    filename = secure_filename(filename) or 'image.jpg'
+    filepath = Config.UPLOAD_FOLDER / 'images' / f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{filename}"
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+def _result_cache_key(model, data, confidence, variant=''):
+    """检测结果缓存键，模型不存在或缓存未开启时返回 None（由 get_detection_service 返回错误）"""
+    if not result_cache.enabled or not model or not model.path:
+        return None
+    try:
+        # 权重标识与模型缓存相同（推理使用的文件路径、修改时间和大小）
+        weights_key = model_registry.weights_key(resolve_inference_path(model.path))
+    except OSError:
+        return None
+    return make_key(content_hash(data), model.id, weights_key, confidence, Config.IOU_THRESHOLD, variant)
+
+# 响应格式：json（标注图片为 base64）、boxes（只返回检测框，由客户端绘制）、
+# jpeg（响应体为二进制标注图片，检测结果在 X-Detections 响应头）、multipart（multipart/mixed，JSON 和 JPEG 两部分）
+RESPONSE_FORMATS = ('json', 'boxes', 'jpeg', 'multipart')
+ACCEPT_FORMATS = {'image/jpeg': 'jpeg', 'multipart/mixed': 'multipart'}
+
+def _get_output_options(formats=RESPONSE_FORMATS):
+    """
+    解析响应格式和预览图尺寸，返回 (格式, 预览图长边像素数, 错误信息)：
+    格式由参数 format 指定，未指定时按 Accept 请求头协商（默认 json，annotate=false 等同于 boxes）；
+    预览图尺寸由参数 preview 指定（PREVIEW_SIZES 中的名称），不指定时返回原图尺寸的标注图片
+    """
+    fmt = request.values.get('format')
+    if fmt is None:
+        best = request.accept_mimetypes.best_match(['application/json', *ACCEPT_FORMATS])
+        fmt = ACCEPT_FORMATS.get(best, 'json')
+        if request.values.get('annotate', 'true').lower() == 'false':
+            fmt = 'boxes'
+    if fmt not in formats:
+        return None, None, f'不支持的响应格式: {fmt}（可选 {", ".join(formats)}）'
+    preview = request.values.get('preview')
+    if preview and preview not in Config.PREVIEW_SIZES:
+        return None, None, f'不支持的预览图尺寸: {preview}（可选 {", ".join(Config.PREVIEW_SIZES)}）'
+    return fmt, Config.PREVIEW_SIZES.get(preview), None
+
+def _cache_variant(fmt, preview_size):
+    """同一检测结果的不同输出分别缓存（jpeg/multipart 与 json 共用 base64 标注图片）"""
+    if fmt == 'boxes':
+        return 'boxes'
+    return f'preview{preview_size}' if preview_size else ''
+
+def _compact_boxes(boxes):
+    """响应头中的检测框：沿用检测结果中按列保存的 boxes，坐标保留一位小数，控制响应头大小"""
+    return {
+        'class_id': boxes['class_id'],
+        'confidence': [round(conf, 3) for conf in boxes['confidence']],
+        'xyxy': [[round(v, 1) for v in bbox] for bbox in boxes['xyxy']]
+    }
+
+def _detection_response(result, fmt):
+    """按响应格式返回单张图片的检测结果"""
+    if fmt == 'json':
+        return jsonify(result), 200
+    meta = {key: value for key, value in result.items() if key != 'image'}
+    if fmt == 'boxes' or result.get('image') is None:
+        return jsonify(meta), 200
+    jpeg = base64.b64decode(result['image'])
+    if fmt == 'jpeg':
+        # 检测框很多时响应头可能超过代理的限制，建议使用 multipart
+        header = {key: value for key, value in meta.items() if key not in ('detections', 'boxes')}
+        header['boxes'] = _compact_boxes(result['boxes'])
+        response = Response(jpeg, content_type='image/jpeg')
+        response.headers['X-Detections'] = json.dumps(header, separators=(',', ':'))
+        return response, 200
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\nContent-Type: application/json\r\n\r\n'.encode(),
+        json.dumps(meta, separators=(',', ':')).encode(),
+        f'\r\n--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n'.encode(),
+        jpeg,
+        f'\r\n--{boundary}--\r\n'.encode()
+    ])
+    return Response(body, content_type=f'multipart/mixed; boundary={boundary}'), 200
+
+def _store_boxes(result, image_size, model_id, user_id, source):
+    """按配置保存单张图片/单帧的检测框，image_size 为原图的 (宽, 高)"""
+    box_store.append(result['detections'], model_id=model_id, user_id=user_id, source=source,
+                     image_size=tuple(image_size))
+
 @detect_bp.route('/image', methods=['POST'])
 @login_required
 def detect_image():
@@ -55,17 +166,40 @@ def detect_image():
     confidence = request.form.get('confidence', type=float)
     if confidence is None:
         confidence = Config.CONFIDENCE_THRESHOLD
+    fmt, preview_size, error = _get_output_options()
+    if error:
+        return jsonify({'message': error}), 400
     user = get_current_user()
+    model = Model.query.get(model_id)
     
-    # Save uploaded file
-    filename = secure_filename(file.filename)
-    filepath = Config.UPLOAD_FOLDER / 'images' / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-    file.save(filepath)
+    data = file.read()
+    # 相同图片（重复上传、客户端超时重试）命中结果缓存时不解码图片，也不调用模型
+    cache_key = _result_cache_key(model, data, confidence, _cache_variant(fmt, preview_size))
+    cached = result_cache.get(model_id, cache_key) if cache_key else None
+    if cached is None:
+        # 直接从请求流中解码，同一个数组用于推理和绘制，不落盘
+        image = decode_image_bytes(data)
+        if image is None:
+            return jsonify({'message': '无法解码图片'}), 400
+    if Config.ARCHIVE_UPLOADED_IMAGES:
+        _archive_upload(data, file.filename)
     
     try:
+        if cached is not None:
+            # 重复的请求已经记录过，不再保存检测记录和检测框，避免重复计入统计
+            result = cached['result']
+            result['cached'] = True
+            return _detection_response(result, fmt)
+        
         # Perform detection
-        service = get_detection_service(model_id)
-        result = service.detect_image(str(filepath), confidence=confidence)
+        service = get_detection_service(model_id, use_batcher=True, model=model)
+        result = service.detect_image(image, confidence=confidence, annotate=fmt != 'boxes',
+                                      preview_size=preview_size)
+        image_size = (image.shape[1], image.shape[0])
+        if cache_key:
+            result_cache.put(model_id, cache_key, {'result': result, 'image_size': image_size})
+        _store_boxes(result, image_size, model_id, user.id if user else None, 'image')
+        result['cached'] = False
         
         # Save detection record
         detection = Detection(
@@ -76,10 +210,9 @@ def detect_image():
             without_helmet=result['stats']['without_helmet'],
             total=result['stats']['total']
         )
-        db.session.add(detection)
-        db.session.commit()
+        detection_writer.write(detection)
         
-        return jsonify(result), 200
+        return _detection_response(result, fmt)
     except (ValueError, FileNotFoundError, RuntimeError) as e:
         # 模型相关错误
         import traceback
@@ -92,10 +225,120 @@ def detect_image():
         print(f"Detection error in detect_image: {str(e)}")
         print(traceback.format_exc())
         return jsonify({'message': f'检测失败: {str(e)}'}), 500
-    finally:
-        # Clean up uploaded file
-        if filepath.exists():
-            filepath.unlink()
+
+@detect_bp.route('/cache', methods=['GET'])
+@admin_required
+def get_result_cache_stats():
+    """获取检测结果缓存统计（总体和按模型的命中率、内存/磁盘占用）"""
+    return jsonify(result_cache.stats()), 200
+
+@detect_bp.route('/cache', methods=['DELETE'])
+@admin_required
+def clear_result_cache():
+    """清空检测结果的内存缓存"""
+    result_cache.clear()
+    return jsonify({'message': '检测结果缓存已清空'}), 200
+
+@detect_bp.route('/batch', methods=['POST'])
+@login_required
+def detect_batch():
+    """批量图片检测：一次请求上传多张图片，按批次进行前向推理"""
+    files = [f for f in request.files.getlist('images') if f and f.filename]
+    if not files:
+        return jsonify({'message': 'No image files provided'}), 400
+    if len(files) > Config.BATCH_MAX_IMAGES:
+        return jsonify({'message': f'单次最多上传 {Config.BATCH_MAX_IMAGES} 张图片'}), 400
+    
+    model_id = request.form.get('model_id', type=int)
+    if model_id is None:
+        return jsonify({'message': '请选择模型'}), 400
+    
+    confidence = request.form.get('confidence', type=float)
+    if confidence is None:
+        confidence = Config.CONFIDENCE_THRESHOLD
+    # 多张图片的结果只能以 JSON 返回
+    fmt, preview_size, error = _get_output_options(('json', 'boxes'))
+    if error:
+        return jsonify({'message': error}), 400
+    user = get_current_user()
+    model = Model.query.get(model_id)
+    
+    # 在内存中解码图片，无法解码的图片单独返回错误；命中结果缓存的图片不解码，也不参与推理
+    entries = []  # [文件名, 缓存键, 缓存的结果, 图片]
+    errors = []
+    for file in files:
+        data = file.read()
+        cache_key = _result_cache_key(model, data, confidence, _cache_variant(fmt, preview_size))
+        cached = result_cache.get(model_id, cache_key) if cache_key else None
+        image = None
+        if cached is None:
+            image = decode_image_bytes(data)
+            if image is None:
+                errors.append({'filename': file.filename, 'message': '无法解码图片'})
+                continue
+        if Config.ARCHIVE_UPLOADED_IMAGES:
+            _archive_upload(data, file.filename)
+        entries.append([file.filename, cache_key, cached, image])
+    
+    if not entries:
+        return jsonify({'message': '没有可检测的图片', 'errors': errors}), 400
+    
+    try:
+        pending = [entry for entry in entries if entry[2] is None]
+        if pending:
+            service = get_detection_service(model_id, model=model)
+            outputs = service.detect_images([entry[3] for entry in pending], confidence=confidence,
+                                            annotate=fmt != 'boxes', preview_size=preview_size)
+            for entry, output in zip(pending, outputs):
+                image = entry[3]
+                entry[2] = {'result': output, 'image_size': (image.shape[1], image.shape[0])}
+                if entry[1]:
+                    result_cache.put(model_id, entry[1], entry[2])
+                entry[2] = dict(entry[2], cached=False)
+        
+        results = []
+        summary = {'total': 0, 'with_helmet': 0, 'without_helmet': 0}
+        detections = []
+        for filename, _, value, _ in entries:
+            output = value['result']
+            output['filename'] = filename
+            output['cached'] = value.get('cached', True)
+            results.append(output)
+            for key in summary:
+                summary[key] += output['stats'][key]
+            if output['cached']:
+                # 命中缓存的图片已经记录过，不再保存检测记录和检测框
+                continue
+            _store_boxes(output, value['image_size'], model_id, user.id if user else None, 'image')
+            # 每张图片保存一条检测记录，与单图检测保持一致
+            detections.append(Detection(
+                user_id=user.id if user else None,
+                model_id=model_id,
+                detection_type='image',
+                with_helmet=output['stats']['with_helmet'],
+                without_helmet=output['stats']['without_helmet'],
+                total=output['stats']['total']
+            ))
+        # 同一批次的记录一起写入
+        if detections:
+            detection_writer.write(*detections)
+        
+        return jsonify({
+            'results': results,
+            'errors': errors,
+            'summary': summary
+        }), 200
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        import traceback
+        print(f"Model error in detect_batch: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'message': f'模型错误: {str(e)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        print(f"Detection error in detect_batch: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'message': f'检测失败: {str(e)}'}), 500
 
 @detect_bp.route('/video', methods=['POST'])
 @login_required
@@ -132,7 +375,8 @@ def detect_video():
         # 设置置信度阈值
         service.confidence_threshold = float(confidence)
         output_path = Config.UPLOAD_FOLDER / 'results' / f"result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-        result = service.detect_video(str(filepath), str(output_path), detection_fps=detection_fps)
+        result = service.detect_video(str(filepath), str(output_path), detection_fps=detection_fps,
+                                      detections_callback=box_store.video_callback(model_id, user.id if user else None))
         
         # Save detection record
         detection = Detection(
@@ -143,8 +387,7 @@ def detect_video():
             without_helmet=result['summary']['without_helmet'],
             total=result['summary']['total_detections']
         )
-        db.session.add(detection)
-        db.session.commit()
+        detection_writer.write(detection)
         
         return jsonify(result), 200
     except (ValueError, FileNotFoundError, RuntimeError) as e:
@@ -161,37 +404,180 @@ def detect_video():
         if filepath.exists():
             filepath.unlink()
 
+def _get_video_job_for_user(job_id):
+    """获取视频任务，普通用户只能访问自己的任务"""
+    job = VideoJob.query.get(job_id)
+    if not job:
+        return None
+    user = get_current_user()
+    if user.role != 'admin' and job.user_id != user.id:
+        return None
+    return job
+
+@detect_bp.route('/video/jobs', methods=['POST'])
+@login_required
+def submit_video_job():
+    """提交异步视频检测任务，立即返回任务ID"""
+    if 'video' not in request.files:
+        return jsonify({'message': 'No video file provided'}), 400
+    
+    file = request.files['video']
+    if file.filename == '':
+        return jsonify({'message': 'No file selected'}), 400
+    
+    model_id = request.form.get('model_id', type=int)
+    if model_id is None:
+        return jsonify({'message': '请选择模型'}), 400
+    model = Model.query.get(model_id)
+    if not model:
+        return jsonify({'message': f'模型错误: 模型 ID {model_id} 不存在'}), 400
+    if not Path(model.path).exists():
+        return jsonify({'message': f'模型错误: 模型文件不存在: {model.path}'}), 400
+    
+    confidence = request.form.get('confidence', type=float)
+    if confidence is None:
+        confidence = Config.CONFIDENCE_THRESHOLD
+    
+    detection_fps = request.form.get('detection_fps', type=int)
+    if detection_fps is None:
+        detection_fps = 10  # 默认10 FPS
+    
+    if video_job_manager.pending_count() >= Config.VIDEO_JOB_MAX_PENDING:
+        return jsonify({'message': '视频检测任务过多，请稍后再试'}), 429
+    
+    user = get_current_user()
+    
+    # Save uploaded file
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    filename = secure_filename(file.filename)
+    filepath = Config.UPLOAD_FOLDER / 'videos' / f"{timestamp}_{filename}"
+    file.save(filepath)
+    
+    job = VideoJob(
+        user_id=user.id if user else None,
+        model_id=model_id,
+        status='queued',
+        input_path=str(filepath),
+        output_path=str(Config.UPLOAD_FOLDER / 'results' / f"result_{timestamp}.mp4"),
+        confidence=float(confidence),
+        detection_fps=detection_fps
+    )
+    db.session.add(job)
+    db.session.commit()
+    
+    video_job_manager.submit(job.id)
+    return jsonify({'message': '视频检测任务已提交', 'job': job.to_dict()}), 202
+
+@detect_bp.route('/video/jobs', methods=['GET'])
+@login_required
+def get_video_jobs():
+    """获取当前用户的视频检测任务列表（管理员可查看全部）"""
+    user = get_current_user()
+    query = VideoJob.query
+    if user.role != 'admin':
+        query = query.filter(VideoJob.user_id == user.id)
+    jobs = query.order_by(VideoJob.created_at.desc()).limit(100).all()
+    return jsonify([j.to_dict() for j in jobs]), 200
+
+@detect_bp.route('/video/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_video_job(job_id):
+    """查询任务进度（已处理帧数/总帧数、处理速度、预计剩余时间）"""
+    job = _get_video_job_for_user(job_id)
+    if not job:
+        return jsonify({'message': '任务不存在'}), 404
+    return jsonify(job.to_dict()), 200
+
+@detect_bp.route('/video/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_video_job(job_id):
+    job = _get_video_job_for_user(job_id)
+    if not job:
+        return jsonify({'message': '任务不存在'}), 404
+    if job.status not in ['queued', 'running']:
+        return jsonify({'message': '任务已结束，无法取消'}), 400
+    video_job_manager.cancel(job)
+    return jsonify({'message': '已请求取消任务', 'job': job.to_dict()}), 200
+
+@detect_bp.route('/video/jobs/<int:job_id>/result', methods=['GET'])
+@login_required
+def get_video_job_result(job_id):
+    """获取已完成任务的检测结果（格式同同步视频检测接口）"""
+    job = _get_video_job_for_user(job_id)
+    if not job:
+        return jsonify({'message': '任务不存在'}), 404
+    if job.status != 'completed':
+        return jsonify({'message': '任务尚未完成', 'job': job.to_dict()}), 409
+    result = video_job_manager.load_result(job)
+    if result is None:
+        return jsonify({'message': '检测结果文件不存在'}), 404
+    return jsonify(result), 200
+
+def _get_session_id(data=None):
+    """从请求中获取实时检测会话ID，同一用户可以同时打开多个会话（多路摄像头）"""
+    session_id = None
+    if data:
+        session_id = data.get('session_id')
+    if not session_id:
+        session_id = request.form.get('session_id') or request.args.get('session_id')
+    return str(session_id) if session_id else 'default'
+
+def _save_realtime_session(session):
+    """保存会话的统计数据到数据库（类型为 'realtime'）"""
+    stats = session.stats
+    if stats.get('total', 0) <= 0 or not session.model_id:
+        return
+    try:
+        detection = Detection(
+            user_id=session.user_id,
+            model_id=session.model_id,
+            detection_type='realtime',  # 使用 'realtime' 类型
+            with_helmet=stats.get('with_helmet', 0),
+            without_helmet=stats.get('without_helmet', 0),
+            total=stats.get('total', 0)
+        )
+        detection_writer.write(detection)
+        print(f"Saved realtime detection record (session {session.user_id}/{session.session_id})")
+    except Exception as e:
+        print(f"Error saving realtime detection: {str(e)}")
+        db.session.rollback()
+
+def _evict_idle_sessions():
+    """淘汰空闲超时的会话并保存其统计数据"""
+    for session in realtime_sessions.evict_idle():
+        print(f"Realtime session {session.user_id}/{session.session_id} evicted after idle timeout")
+        _save_realtime_session(session)
+
 @detect_bp.route('/realtime/start', methods=['POST'])
 @login_required
 def start_realtime():
-    global realtime_active, detection_service, realtime_stats
-    data = request.get_json()
+    data = request.get_json(silent=True)
     model_id = data.get('model_id') if data else None
     confidence = data.get('confidence', 0.25) if data else 0.25  # 默认0.25
     fps = data.get('fps', 5) if data else 5  # 默认5 FPS
+    user = get_current_user()
+    session_id = _get_session_id(data)
+    
+    _evict_idle_sessions()
     
     try:
-        # 验证模型并初始化检测服务
+        # 验证模型并初始化检测服务（模型由模型缓存共享，阈值按会话保存）
         if model_id:
-            detection_service = get_detection_service(model_id)
+            service = get_detection_service(model_id, use_batcher=True)
         else:
-            detection_service = get_detection_service()
+            service = get_detection_service()
         
         # 设置置信度阈值和FPS
-        if detection_service:
-            detection_service.confidence_threshold = float(confidence)
-            detection_service.detection_fps = int(fps)
+        service.confidence_threshold = float(confidence)
+        service.detection_fps = int(fps)
         
-        # 初始化实时检测统计数据
-        realtime_stats = {
-            'model_id': model_id,
-            'total': 0,
-            'with_helmet': 0,
-            'without_helmet': 0
-        }
+        session = RealtimeSession(user.id, session_id, model_id, service, confidence=confidence, fps=fps)
+        old_session = realtime_sessions.start(session)
+        if old_session is not None:
+            # 同一会话重复启动时先保存旧会话的统计数据
+            _save_realtime_session(old_session)
         
-        realtime_active = True
-        return jsonify({'message': 'Realtime detection started'}), 200
+        return jsonify({'message': 'Realtime detection started', 'session_id': session_id}), 200
     except (ValueError, FileNotFoundError, RuntimeError) as e:
         return jsonify({'message': f'模型错误: {str(e)}'}), 400
     except Exception as e:
@@ -200,49 +586,41 @@ def start_realtime():
 @detect_bp.route('/realtime/stop', methods=['POST'])
 @login_required
 def stop_realtime():
-    global realtime_active, detection_service, realtime_stats
     user = get_current_user()
+    session_id = _get_session_id(request.get_json(silent=True))
     
     # 如果实时检测有统计数据，保存到数据库
-    if realtime_active and detection_service and 'realtime_stats' in globals():
-        stats = globals().get('realtime_stats', {})
-        if stats.get('total', 0) > 0:
-            try:
-                # 获取模型ID（从detection_service中获取，或从请求中获取）
-                model_id = stats.get('model_id')
-                if model_id:
-                    detection = Detection(
-                        user_id=user.id if user else None,
-                        model_id=model_id,
-                        detection_type='realtime',  # 使用 'realtime' 类型
-                        with_helmet=stats.get('with_helmet', 0),
-                        without_helmet=stats.get('without_helmet', 0),
-                        total=stats.get('total', 0)
-                    )
-                    db.session.add(detection)
-                    db.session.commit()
-                    print(f"Saved realtime detection record: {detection.id}")
-            except Exception as e:
-                print(f"Error saving realtime detection: {str(e)}")
-                db.session.rollback()
-    
-    realtime_active = False
-    # 清理统计数据
-    if 'realtime_stats' in globals():
-        globals()['realtime_stats'] = {}
+    session = realtime_sessions.stop(user.id, session_id)
+    if session is not None:
+        _save_realtime_session(session)
     
+    _evict_idle_sessions()
     return jsonify({'message': 'Realtime detection stopped'}), 200
 
+@detect_bp.route('/realtime/sessions', methods=['GET'])
+@login_required
+def get_realtime_sessions():
+    """获取当前活跃的实时检测会话（管理员可查看全部）"""
+    user = get_current_user()
+    _evict_idle_sessions()
+    sessions = realtime_sessions.list(None if user.role == 'admin' else user.id)
+    return jsonify([s.to_dict() for s in sessions]), 200
+
+def _frame_response(result, **flags):
+    """实时检测单帧的响应（flags 标记复用上一次推理结果的原因：超出帧率预算或静止画面）"""
+    response = {'image': result['image'], 'detections': result['detections'], 'boxes': result['boxes'], **flags}
+    if 'image_scale' in result:
+        response['image_scale'] = result['image_scale']
+    return response
+
 @detect_bp.route('/realtime/frame', methods=['POST'])
 @login_required
 def get_realtime_frame():
-    global realtime_active, detection_service, realtime_stats
-    if not realtime_active:
+    user = get_current_user()
+    session = realtime_sessions.get(user.id, _get_session_id())
+    if session is None:
         return jsonify({'message': 'Realtime detection not active'}), 400
     
-    if not detection_service:
-        return jsonify({'message': 'Detection service not initialized'}), 400
-    
     if 'image' not in request.files:
         return jsonify({'message': 'No image file provided'}), 400
     
@@ -250,59 +628,188 @@ def get_realtime_frame():
     if file.filename == '':
         return jsonify({'message': 'No file selected'}), 400
     
-    # 获取置信度和FPS参数
+    fmt, preview_size, error = _get_output_options()
+    if error:
+        return jsonify({'message': error}), 400
+    annotate = fmt != 'boxes'
+    
+    # 获取置信度和FPS参数（只影响当前会话）
     confidence = request.form.get('confidence', type=float)
     fps = request.form.get('fps', type=int)
     if confidence is not None:
-        detection_service.confidence_threshold = float(confidence)
+        session.confidence = float(confidence)
+        session.service.confidence_threshold = session.confidence
     if fps is not None:
-        detection_service.detection_fps = int(fps)
+        session.fps = int(fps)
+        session.service.detection_fps = session.fps
+    
+    # 上一次的结果只在推理参数相同时复用
+    params = (session.confidence, preview_size)
+    with session.lock:
+        if not session.within_budget() and session.can_reuse(params, need_image=annotate):
+            # 超出帧率预算，直接返回上一帧的结果，不做推理
+            session.throttled += 1
+            return _detection_response(_frame_response(session.last_result, throttled=True), fmt)
     
     try:
-        # 保存临时文件
-        import tempfile
-        import os
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            file.save(tmp_file.name)
-            tmp_path = tmp_file.name
+        # 在内存中解码帧，不写临时文件
+        data = file.read()
+        image = decode_image_bytes(data)
+        if image is None:
+            return jsonify({'message': '无法解码图片'}), 400
+        if Config.ARCHIVE_UPLOADED_IMAGES:
+            _archive_upload(data, file.filename)
         
-        try:
-            # 执行检测
-            result = detection_service.detect_image(tmp_path, confidence=detection_service.confidence_threshold)
-            
-            # 更新实时检测统计数据（不保存到数据库，只在停止时保存）
-            # 统计方式：按帧统计，不是按对象统计
-            if 'realtime_stats' in globals():
-                stats = globals()['realtime_stats']
-                # 总检测帧数+1
-                stats['total'] = stats.get('total', 0) + 1
-                
-                # 如果这一帧有检测结果
-                if result['stats']['total'] > 0:
-                    # 检查是否有安全帽和无安全帽的检测
-                    has_with_helmet = any(d.get('class') == 'with_helmet' for d in result.get('detections', []))
-                    has_without_helmet = any(d.get('class') == 'without_helmet' for d in result.get('detections', []))
-                    # 按帧统计：如果这一帧包含有安全帽的检测，则with_helmet帧数+1
-                    if has_with_helmet:
-                        stats['with_helmet'] = stats.get('with_helmet', 0) + 1
-                    # 按帧统计：如果这一帧包含无安全帽的检测，则without_helmet帧数+1
-                    if has_without_helmet:
-                        stats['without_helmet'] = stats.get('without_helmet', 0) + 1
-            
-            return jsonify({
-                'image': result['image'],
-                'detections': result['detections']
-            }), 200
-        finally:
-            # 清理临时文件
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+        with session.lock:
+            # 静止画面：复用上一次推理的结果，不做推理
+            reused = session.reuse_if_static(image, params, need_image=annotate)
+        if reused is not None:
+            return _detection_response(_frame_response(reused, skipped=True), fmt)
+        
+        # 执行检测
+        result = session.service.detect_image(image, confidence=session.confidence, annotate=annotate,
+                                              preview_size=preview_size)
+        _store_boxes(result, (image.shape[1], image.shape[0]), session.model_id, session.user_id, 'realtime')
+        
+        # 更新实时检测统计数据（不保存到数据库，只在停止时保存）
+        with session.lock:
+            session.record_frame(result, params)
+        
+        return _detection_response(_frame_response(result), fmt)
     except Exception as e:
         import traceback
         print(f"Error in realtime frame detection: {str(e)}")
         print(traceback.format_exc())
         return jsonify({'message': f'检测失败: {str(e)}'}), 500
 
+@sock.route('/realtime/ws', bp=detect_bp)
+def realtime_stream(ws):
+    """
+    WebSocket实时检测流：
+    - 连接地址 /api/detect/realtime/ws?token=<jwt>（浏览器无法为WebSocket设置请求头）
+    - 第一条消息为JSON配置 {"model_id": 1, "confidence": 0.25, "annotate": false, "preview": "medium"}，
+      之后可随时发送JSON更新 confidence/annotate/preview
+    - 之后发送二进制JPEG帧，服务端在内存中解码，只返回检测框（annotate=true 时附带标注图片）
+    - 推理跟不上时只处理最新一帧，旧帧直接丢弃
+    """
+    user_id = verify_token(request.args.get('token', ''))
+    user = User.query.get(user_id) if user_id else None
+    if not user:
+        ws.send(json.dumps({'type': 'error', 'message': 'Authentication required'}))
+        return
+    
+    try:
+        options = json.loads(ws.receive(timeout=Config.REALTIME_STREAM_CONFIG_TIMEOUT) or '{}')
+    except (ValueError, TypeError):
+        ws.send(json.dumps({'type': 'error', 'message': '第一条消息必须是JSON配置'}))
+        return
+    
+    model_id = options.get('model_id')
+    if not model_id:
+        ws.send(json.dumps({'type': 'error', 'message': '请选择模型'}))
+        return
+    try:
+        service = get_detection_service(int(model_id), use_batcher=True)
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        ws.send(json.dumps({'type': 'error', 'message': f'模型错误: {str(e)}'}))
+        return
+    
+    confidence = options.get('confidence')
+    service.confidence_threshold = float(confidence) if confidence is not None else Config.CONFIDENCE_THRESHOLD
+    annotate = {'value': bool(options.get('annotate', False))}
+    # 标注图片的预览尺寸（PREVIEW_SIZES 中的名称），不指定时为原图尺寸
+    preview = {'value': Config.PREVIEW_SIZES.get(options.get('preview'))}
+    # 每个连接一个独立会话，可通过 /realtime/sessions 查看
+    session = RealtimeSession(user.id, f"ws-{uuid.uuid4().hex[:8]}", int(model_id), service,
+                              confidence=service.confidence_threshold)
+    try:
+        realtime_sessions.start(session)
+    except RuntimeError as e:
+        ws.send(json.dumps({'type': 'error', 'message': str(e)}))
+        return
+    slot = LatestFrameSlot()
+    
+    def receive_frames():
+        # 接收线程：二进制消息放入帧缓冲，文本消息更新参数
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    continue
+                if isinstance(message, (bytes, bytearray)):
+                    slot.put(bytes(message))
+                    continue
+                try:
+                    update = json.loads(message)
+                except ValueError:
+                    continue
+                if update.get('confidence') is not None:
+                    session.confidence = float(update['confidence'])
+                    service.confidence_threshold = session.confidence
+                if 'annotate' in update:
+                    annotate['value'] = bool(update['annotate'])
+                if 'preview' in update:
+                    preview['value'] = Config.PREVIEW_SIZES.get(update['preview'])
+        except ConnectionClosed:
+            pass
+        finally:
+            slot.close()
+    
+    receiver = threading.Thread(target=receive_frames, name='realtime-ws-receiver', daemon=True)
+    receiver.start()
+    ws.send(json.dumps({'type': 'ready'}))
+    
+    max_age = Config.REALTIME_STREAM_MAX_FRAME_AGE_MS / 1000.0
+    try:
+        while not slot.closed:
+            item = slot.get(timeout=1.0)
+            if item is None:
+                continue
+            frame_id, data, received_at = item
+            if time.monotonic() - received_at > max_age:
+                slot.drop()
+                continue
+            
+            image = decode_image_bytes(data)
+            if image is None:
+                ws.send(json.dumps({'type': 'error', 'frame_id': frame_id, 'message': '无法解码图片'}))
+                continue
+            
+            session.touch()
+            with session.lock:
+                # 静止画面：复用上一次推理的结果，不做推理
+                params = (session.confidence, preview['value'])
+                result = session.reuse_if_static(image, params, need_image=annotate['value'])
+            skipped = result is not None
+            if not skipped:
+                result = service.detect_image(image, annotate=annotate['value'], preview_size=preview['value'])
+                _store_boxes(result, (image.shape[1], image.shape[0]), session.model_id, session.user_id, 'realtime')
+                with session.lock:
+                    session.record_frame(result, params)
+            
+            payload = {
+                'type': 'detections',
+                'frame_id': frame_id,
+                'detections': result['detections'],
+                'stats': result['stats'],
+                'skipped': skipped,
+                'received': slot.received,
+                'dropped': slot.dropped,
+                'latency_ms': round((time.monotonic() - received_at) * 1000, 1)
+            }
+            if result['image'] is not None:
+                payload['image'] = result['image']
+                if 'image_scale' in result:
+                    payload['image_scale'] = result['image_scale']
+            ws.send(json.dumps(payload))
+    except ConnectionClosed:
+        pass
+    finally:
+        slot.close()
+        # 连接断开时保存统计数据，与 /realtime/stop 一致
+        if realtime_sessions.stop(session.user_id, session.session_id) is not None:
+            _save_realtime_session(session)
+
 @detect_bp.route('/uploads/results/<filename>', methods=['GET', 'OPTIONS'])
 def get_result_file(filename):
     # 处理OPTIONS预检请求
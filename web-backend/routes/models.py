@@ -1,12 +1,21 @@
-from flask import Blueprint, request, jsonify, current_app
-from models import Model, Dataset, db
-from utils.auth import login_required, admin_required, get_current_user
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from models import Model, Dataset, TrainingJob, User, db
+from utils.auth import login_required, admin_required, get_current_user, verify_token
 from pathlib import Path
 from config import Config
 from datetime import datetime
 import json
+import queue
+import yaml
 import threading
 from ultralytics import YOLO
+from utils.model_registry import model_registry
+from utils.model_files import model_file_index
+from utils.result_cache import result_cache
+from utils.training_jobs import training_job_manager, last_checkpoint, TrainingCancelled
+from utils.training_progress import training_progress
+from utils.dataset_index import dataset_index_cache, training_preflight
+from utils.model_export import export_model, benchmark_backends, find_backend_artifacts, resolve_inference_path, remove_exported_artifacts, backend_failure
 
 models_bp = Blueprint('models', __name__)
 
@@ -34,82 +43,55 @@ def get_models():
     
     models = query.all()
     
-    # 同步检查：验证模型文件是否存在，如果不存在则更新状态
+    # 同步检查：验证模型文件是否存在（使用缓存的文件索引），如果不存在则更新状态，最后统一提交
+    changed = False
     for model in models:
-        if model.path:
-            model_path = Path(model.path)
-            if not model_path.exists():
-                # 如果模型文件不存在，且状态是completed或published，更新为failed
-                if model.status in ['completed', 'published']:
-                    model.status = 'failed'
-                    current_metrics = model.get_metrics()
-                    if not current_metrics or not current_metrics.get('error'):
-                        error_msg = '模型文件不存在，可能已被删除'
-                        if current_metrics:
-                            current_metrics['error'] = error_msg
-                            model.set_metrics(current_metrics)
-                        else:
-                            model.set_metrics({'error': error_msg})
-                    db.session.commit()
-                    print(f"Synced model {model.id} ({model.name}, type: {model.type}): file missing, status updated to failed")
-        else:
+        if model.status not in ['completed', 'published']:
+            continue
+        if not model.path:
             # 如果模型没有路径，且状态是completed或published，也标记为failed
-            if model.status in ['completed', 'published']:
-                model.status = 'failed'
-                current_metrics = model.get_metrics()
-                if not current_metrics or not current_metrics.get('error'):
-                    error_msg = '模型路径未设置'
-                    if current_metrics:
-                        current_metrics['error'] = error_msg
-                        model.set_metrics(current_metrics)
-                    else:
-                        model.set_metrics({'error': error_msg})
-                db.session.commit()
-                print(f"Synced model {model.id} ({model.name}, type: {model.type}): no path, status updated to failed")
+            changed = _mark_model_missing(model, '模型路径未设置') or changed
+        elif not model_file_index.exists(model.path):
+            # 如果模型文件不存在，且状态是completed或published，更新为failed
+            changed = _mark_model_missing(model, '模型文件不存在，可能已被删除') or changed
+    if changed:
+        db.session.commit()
     
-    return jsonify([m.to_dict() for m in models]), 200
+    # 一次查询获取所有模型的数据集名称
+    dataset_names = Model.load_dataset_names(models)
+    return jsonify([m.to_dict(dataset_names) for m in models]), 200
+
+def _mark_model_missing(model, error_msg):
+    """模型文件缺失时将 completed/published 状态的模型标记为 failed（不提交），返回是否有修改"""
+    if model.status not in ['completed', 'published']:
+        return False
+    old_status = model.status
+    model.status = 'failed'
+    current_metrics = model.get_metrics()
+    if not current_metrics or not current_metrics.get('error'):
+        if current_metrics:
+            current_metrics['error'] = error_msg
+            model.set_metrics(current_metrics)
+        else:
+            model.set_metrics({'error': error_msg})
+    print(f"Synced model {model.id} ({model.name}, type: {model.type}): {old_status} -> failed ({error_msg})")
+    return True
 
 @models_bp.route('/<int:model_id>', methods=['GET'])
 @login_required
 def get_model(model_id):
     model = Model.query.get_or_404(model_id)
     
-    # 同步检查：验证模型文件是否存在
+    # 同步检查：验证模型文件是否存在（详情接口直接检查文件并刷新文件索引）
     # 对于通用模型和自定义模型，如果状态是completed或published，都需要验证文件存在性
-    if model.path:
-        model_path = Path(model.path)
-        if not model_path.exists():
-            # 如果模型文件不存在，且状态是completed或published，更新为failed
-            # 无论是通用模型还是自定义模型，都需要同步状态
-            if model.status in ['completed', 'published']:
-                old_status = model.status
-                model.status = 'failed'
-                current_metrics = model.get_metrics()
-                if not current_metrics or not current_metrics.get('error'):
-                    error_msg = '模型文件不存在，可能已被删除'
-                    if current_metrics:
-                        current_metrics['error'] = error_msg
-                        model.set_metrics(current_metrics)
-                    else:
-                        model.set_metrics({'error': error_msg})
-                db.session.commit()
-                print(f"Synced model {model.id} ({model.name}, type: {model.type}): {old_status} -> failed (file missing)")
+    if not model.path:
+        changed = _mark_model_missing(model, '模型路径未设置')
+    elif not model_file_index.refresh([model.path])[str(model.path)]:
+        changed = _mark_model_missing(model, '模型文件不存在，可能已被删除')
     else:
-        # 如果模型没有路径，且状态是completed或published，也标记为failed
-        # 无论是通用模型还是自定义模型，都需要同步状态
-        if model.status in ['completed', 'published']:
-            old_status = model.status
-            model.status = 'failed'
-            current_metrics = model.get_metrics()
-            if not current_metrics or not current_metrics.get('error'):
-                error_msg = '模型路径未设置'
-                if current_metrics:
-                    current_metrics['error'] = error_msg
-                    model.set_metrics(current_metrics)
-                else:
-                    model.set_metrics({'error': error_msg})
-            db.session.commit()
-            print(f"Synced model {model.id} ({model.name}, type: {model.type}): {old_status} -> failed (no path)")
+        changed = False
+    if changed:
+        db.session.commit()
     
     return jsonify(model.to_dict()), 200
 
@@ -277,6 +259,7 @@ def import_model():
         
         db.session.add(model)
         db.session.commit()
+        model_file_index.invalidate(model.path)
         
         # 导入后立即验证文件是否存在，确保状态同步
         # 如果文件不存在（虽然理论上不应该发生），更新状态
@@ -351,9 +334,16 @@ def delete_model(model_id):
     model_path = Path(model.path)
     if model_path.exists():
         model_path.unlink()
+    # 同时删除导出的 ONNX/OpenVINO 产物
+    if model.path:
+        remove_exported_artifacts(model_path)
     
     db.session.delete(model)
     db.session.commit()
+    model_registry.invalidate(model_id)
+    model_file_index.invalidate(model.path)
+    training_progress.forget(model_id)
+    result_cache.invalidate_model(model_id)
     return jsonify({'message': 'Model deleted successfully'}), 200
 
 @models_bp.route('/<int:model_id>/publish', methods=['POST'])
@@ -367,6 +357,12 @@ def publish_model(model_id):
     
     model.status = 'published'
     db.session.commit()
+    # 发布后丢弃旧的缓存，下次检测时按当前权重文件重新加载
+    model_registry.invalidate(model_id)
+    
+    # 在后台导出CPU推理后端，导出完成后检测服务自动切换到导出的产物
+    if Config.EXPORT_ON_PUBLISH:
+        _start_export(model)
     
     return jsonify({'message': '模型发布成功', 'model': model.to_dict()}), 200
 
@@ -385,38 +381,47 @@ def unpublish_model(model_id):
     
     model.status = 'completed'
     db.session.commit()
+    model_registry.invalidate(model_id)
     
     return jsonify({'message': '取消发布成功', 'model': model.to_dict()}), 200
 
+@models_bp.route('/cache', methods=['GET'])
+@admin_required
+def get_model_cache_stats():
+    """获取模型缓存统计（命中/未命中/加载耗时）"""
+    return jsonify(model_registry.stats()), 200
+
+@models_bp.route('/cache', methods=['DELETE'])
+@admin_required
+def clear_model_cache():
+    """清空模型缓存"""
+    model_registry.clear()
+    return jsonify({'message': '模型缓存已清空'}), 200
+
 @models_bp.route('/sync', methods=['POST'])
 @admin_required
 def sync_models():
-    """同步模型文件状态，检查所有模型文件是否存在"""
+    """同步模型文件状态，检查所有模型文件是否存在（同时刷新文件索引）"""
     models = Model.query.all()
+    exists = model_file_index.refresh([model.path for model in models])
     synced_count = 0
     
     for model in models:
-        if model.path:
-            model_path = Path(model.path)
-            if not model_path.exists():
-                # 如果模型文件不存在，且状态是completed或published，更新为failed
-                if model.status in ['completed', 'published']:
-                    old_status = model.status
-                    model.status = 'failed'
-                    if not model.get_metrics() or not model.get_metrics().get('error'):
-                        error_msg = '模型文件不存在，可能已被删除'
-                        model.set_metrics({'error': error_msg})
-                    db.session.commit()
-                    synced_count += 1
-                    print(f"Synced model {model.id} ({model.name}, type: {model.type}): {old_status} -> failed (file missing)")
+        if model.path and not exists.get(str(model.path)):
+            # 如果模型文件不存在，且状态是completed或published，更新为failed
+            if _mark_model_missing(model, '模型文件不存在，可能已被删除'):
+                synced_count += 1
+    if synced_count:
+        db.session.commit()
     
     return jsonify({
         'message': f'同步完成，已更新 {synced_count} 个模型的状态',
         'synced_count': synced_count
     }), 200
 
-def train_model_async(app, model_id, dataset_id, epochs, batch, imgsz, base_model_name=None, device='cpu'):
-    """异步训练模型"""
+def train_model_async(app, model_id, dataset_id, epochs, batch, imgsz, base_model_name=None, device='cpu',
+                      callbacks=None, resume_path=None):
+    """训练模型（在训练进程中执行），resume_path 为中断训练的 last.pt 时继续训练"""
     # 在应用上下文中运行
     with app.app_context():
         try:
@@ -469,48 +474,60 @@ def train_model_async(app, model_id, dataset_id, epochs, batch, imgsz, base_mode
                 db.session.commit()
                 return
             
-            # 加载预训练模型
-            # 使用传入的基础模型名称，如果没有则使用默认值
-            if not base_model_name:
-                base_model_name = 'yolo11n.pt'
+            if resume_path:
+                # 从中断训练的 last.pt 继续，训练参数沿用检查点中保存的参数
+                print(f"Resuming training from checkpoint: {resume_path}")
+                base_model = YOLO(str(resume_path))
+            else:
+                # 加载预训练模型
+                # 使用传入的基础模型名称，如果没有则使用默认值
+                if not base_model_name:
+                    base_model_name = 'yolo11n.pt'
             
-            # YOLO会自动下载模型
-            # 移除.pt后缀，YOLO会自动处理并下载
-            model_name = base_model_name.replace('.pt', '') if base_model_name.endswith('.pt') else base_model_name
+                # YOLO会自动下载模型
+                # 移除.pt后缀，YOLO会自动处理并下载
+                model_name = base_model_name.replace('.pt', '') if base_model_name.endswith('.pt') else base_model_name
             
-            print(f"Loading base model: {model_name}")
-            try:
-                # YOLO会自动下载模型（如果不存在）
-                # 使用不带.pt后缀的名称，YOLO会自动处理
-                base_model = YOLO(model_name)
-                print(f"Successfully loaded base model: {model_name}")
-            except Exception as e:
-                print(f"Error loading base model {model_name}: {str(e)}")
-                # 如果失败，尝试使用完整路径
-                model_path = Config.MODELS_FOLDER / base_model_name
-                if model_path.exists():
-                    print(f"Trying to load from local path: {model_path}")
-                    base_model = YOLO(str(model_path))
-                else:
-                    # 最后尝试：使用默认模型
-                    print(f"Falling back to default model: yolo11n")
-                    base_model = YOLO('yolo11n')
+                print(f"Loading base model: {model_name}")
+                try:
+                    # YOLO会自动下载模型（如果不存在）
+                    # 使用不带.pt后缀的名称，YOLO会自动处理
+                    base_model = YOLO(model_name)
+                    print(f"Successfully loaded base model: {model_name}")
+                except Exception as e:
+                    print(f"Error loading base model {model_name}: {str(e)}")
+                    # 如果失败，尝试使用完整路径
+                    model_path = Config.MODELS_FOLDER / base_model_name
+                    if model_path.exists():
+                        print(f"Trying to load from local path: {model_path}")
+                        base_model = YOLO(str(model_path))
+                    else:
+                        # 最后尝试：使用默认模型
+                        print(f"Falling back to default model: yolo11n")
+                        base_model = YOLO('yolo11n')
+            
+            # 训练回调（进度、取消检查）
+            for event, callback in (callbacks or {}).items():
+                base_model.add_callback(event, callback)
             
             # 开始训练，指定设备
             device_param = '0' if device == 'gpu' else 'cpu'
             print(f"Starting training with device: {device_param}")
-            results = base_model.train(
-                data=str(data_yaml.absolute()),
-                epochs=epochs,
-                batch=batch,
-                imgsz=imgsz,
-                device=device_param,  # 指定训练设备
-                project=str(Config.MODELS_FOLDER / 'runs'),
-                name=f'model_{model_id}',
-                exist_ok=True,
-                save=True,
-                verbose=True
-            )
+            if resume_path:
+                results = base_model.train(resume=True)
+            else:
+                results = base_model.train(
+                    data=str(data_yaml.absolute()),
+                    epochs=epochs,
+                    batch=batch,
+                    imgsz=imgsz,
+                    device=device_param,  # 指定训练设备
+                    project=str(Config.MODELS_FOLDER / 'runs'),
+                    name=f'model_{model_id}',
+                    exist_ok=True,
+                    save=True,
+                    verbose=True
+                )
             
             # 获取最佳模型路径
             best_model_path = Path(results.save_dir) / 'weights' / 'best.pt'
@@ -529,6 +546,7 @@ def train_model_async(app, model_id, dataset_id, epochs, batch, imgsz, base_mode
                     # 验证文件是否成功复制
                     if target_path.exists():
                         model.path = str(target_path.absolute())  # 使用绝对路径
+                        model_file_index.invalidate(model.path)
                         model_file_saved = True
                         print(f"Model saved to: {target_path.absolute()}")
                     else:
@@ -623,8 +641,13 @@ def train_model_async(app, model_id, dataset_id, epochs, batch, imgsz, base_mode
             # 更新模型状态为训练完成
             model.status = 'completed'
             db.session.commit()
+            # 重新训练会覆盖模型文件，丢弃旧的缓存
+            model_registry.invalidate(model_id)
             
             print(f"Training completed for model {model_id}, model file: {model.path}")
+        except TrainingCancelled:
+            # 取消由训练任务队列处理（恢复模型状态）
+            raise
         except Exception as e:
             print(f"Training error: {str(e)}")
             import traceback
@@ -719,43 +742,170 @@ def train_model():
     if not data_yaml.exists():
         return jsonify({'message': '数据集配置文件不存在，请重新上传数据集'}), 400
     
-    # 更新模型状态为训练中
-    model.status = 'training'
-    db.session.commit()
+    # 训练前检查读取数据集索引（图片、标签和类别统计），不遍历数据集目录
+    index = dataset_index_cache.get_or_build(dataset_dir)
+    try:
+        with open(data_yaml, 'r', encoding='utf-8') as f:
+            nc = (yaml.safe_load(f) or {}).get('nc')
+    except Exception:
+        nc = None
+    errors, warnings = training_preflight(index, nc)
+    if errors:
+        return jsonify({'message': f'数据集检查未通过：{"；".join(errors)}', 'errors': errors, 'warnings': warnings}), 400
     
-    # 获取基础模型名称
-    base_model_name = base_model or 'yolov8n.pt'
+    # 同一模型同时只能有一个训练任务
+    if training_job_manager.active_job(model_id):
+        return jsonify({'message': '该模型已有排队中或运行中的训练任务'}), 409
     
-    # 在后台线程中启动训练（需要传递app实例以创建应用上下文）
-    from flask import current_app
-    app = current_app._get_current_object()
-    training_thread = threading.Thread(
-        target=train_model_async,
-        args=(app, model_id, dataset_id, epochs, batch, imgsz, base_model_name, device),
-        daemon=True
-    )
-    training_thread.start()
+    # 加入训练队列，由独立的训练进程执行（模型状态更新为训练中）
+    job = training_job_manager.enqueue(model, dataset_id, {
+        'epochs': epochs,
+        'batch': batch,
+        'imgsz': imgsz,
+        'base_model': base_model,
+        'device': device
+    })
     
     return jsonify({
-        'message': '训练任务已启动，训练完成后会自动更新模型指标',
+        'message': '训练任务已加入队列，训练完成后会自动更新模型指标',
         'model_id': model_id,
-        'dataset_id': dataset_id
+        'dataset_id': dataset_id,
+        'job': job.to_dict(),
+        'warnings': warnings
     }), 200
 
+@models_bp.route('/<int:model_id>/train/resume', methods=['POST'])
+@admin_required
+def resume_training(model_id):
+    """从上次中断训练保存的 last.pt 继续训练"""
+    model = Model.query.get_or_404(model_id)
+    if training_job_manager.active_job(model_id):
+        return jsonify({'message': '该模型已有排队中或运行中的训练任务'}), 409
+    if not last_checkpoint(model_id):
+        return jsonify({'message': '没有可继续训练的检查点（last.pt）'}), 400
+    
+    last_job = TrainingJob.query.filter_by(model_id=model_id).order_by(TrainingJob.id.desc()).first()
+    training_params = model.get_training_params() or {}
+    params = last_job.get_params() if last_job else training_params
+    dataset_id = last_job.dataset_id if last_job else training_params.get('dataset_id')
+    job = training_job_manager.enqueue(model, dataset_id, params, resume=True)
+    return jsonify({'message': '继续训练任务已加入队列', 'job': job.to_dict()}), 200
+
+@models_bp.route('/training-jobs', methods=['GET'])
+@admin_required
+def list_training_jobs():
+    """训练任务列表（可按模型和状态筛选）"""
+    query = TrainingJob.query
+    model_id = request.args.get('model_id', type=int)
+    if model_id is not None:
+        query = query.filter_by(model_id=model_id)
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(TrainingJob.id.desc()).limit(100).all()
+    return jsonify([job.to_dict() for job in jobs]), 200
+
+@models_bp.route('/training-jobs/<int:job_id>', methods=['GET'])
+@admin_required
+def get_training_job(job_id):
+    job = TrainingJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict()), 200
+
+@models_bp.route('/training-jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_training_job(job_id):
+    """取消训练任务：排队中的任务立即取消，运行中的任务在当前轮次结束后停止（可从 last.pt 继续训练）"""
+    job = TrainingJob.query.get_or_404(job_id)
+    if job.status not in ['queued', 'running']:
+        return jsonify({'message': '任务已结束，无法取消'}), 400
+    training_job_manager.cancel(job)
+    return jsonify({'message': '已请求取消训练任务', 'job': job.to_dict()}), 200
+
 @models_bp.route('/<int:model_id>/training', methods=['GET'])
 @login_required
 def get_model_training_data(model_id):
-    model = Model.query.get_or_404(model_id)
+    """
+    获取训练曲线数据，results.csv 增量读取（每次只解析新增的行）
+    - 查询参数 since：只返回第 since 轮之后的数据，轮询时传入已有的轮数
+    """
+    Model.query.get_or_404(model_id)
+    since = max(request.args.get('since', 0, type=int), 0)
+    
+    try:
+        tail = training_progress.tail(model_id)
+        exists = tail.path.exists()
+        training_data = tail.snapshot(since)
+    except Exception as e:
+        print(f"Error reading training data: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify(dict(_empty_training_data(), error=f'读取训练数据失败: {str(e)}')), 500
     
-    print(f"Getting training data for model {model_id}: path={model.path}, status={model.status}")
+    if not exists:
+        return jsonify(dict(_empty_training_data(), error='训练数据文件不存在，可能runs目录已被删除')), 404
     
-    # 检查模型文件是否存在（但即使不存在也尝试读取训练数据，因为训练数据可能在runs目录中）
-    if not model.path or not Path(model.path).exists():
-        print(f"Warning: Model file does not exist: {model.path}, but will try to read training data from runs directory")
-        # 不直接返回404，继续尝试读取训练数据
+    # 如果没有数据，返回空数据（但不返回404，让前端处理）
+    if not training_data['epochs'] and since == 0:
+        return jsonify(dict(training_data, error='训练数据为空')), 200
+    
+    return jsonify(training_data), 200
+
+@models_bp.route('/<int:model_id>/training/stream', methods=['GET'])
+def stream_model_training(model_id):
+    """
+    训练进度推送（Server-Sent Events）：
+    - 连接地址 /api/models/<id>/training/stream?token=<jwt>&since=<已有轮数>（浏览器 EventSource 无法设置请求头）
+    - 先补发 results.csv 中第 since 轮之后的数据，之后每轮结束推送 epoch 事件，训练结束时推送 status 事件并关闭
+    - 训练进程的推送到达其他 Web 进程时，本连接在保活间隔内从 results.csv 读取新增的轮次
+    """
+    user = get_current_user()
+    if not user:
+        user_id = verify_token(request.args.get('token', ''))
+        user = User.query.get(user_id) if user_id else None
+    if not user:
+        return jsonify({'message': 'Authentication required'}), 401
+    Model.query.get_or_404(model_id)
+    since = max(request.args.get('since', 0, type=int), 0)
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
     
-    # 尝试从runs目录读取训练数据
-    training_data = {
+    def generate():
+        sent = since
+        events = training_progress.subscribe(model_id)
+        try:
+            while True:
+                for entry in training_progress.tail(model_id).entries(sent):
+                    yield sse('epoch', entry)
+                    sent = entry['epoch']
+                # 在读取 results.csv 之后检查任务状态，训练结束前的最后一轮不会遗漏
+                db.session.rollback()
+                job = training_job_manager.active_job(model_id)
+                if job is None:
+                    last_job = TrainingJob.query.filter_by(model_id=model_id).order_by(TrainingJob.id.desc()).first()
+                    yield sse('status', {'job': last_job.to_dict() if last_job else None})
+                    return
+                try:
+                    event = events.get(timeout=Config.TRAINING_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event['type'] == 'epoch' and event['epoch'] > sent:
+                    yield sse('epoch', {key: event[key] for key in ['epoch', 'epochs_total', 'train_loss', 'val_loss', 'map', 'precision', 'recall']})
+                    sent = event['epoch']
+                elif event['type'] == 'status':
+                    yield sse('status', {'job': event['job']})
+                    return
+        finally:
+            training_progress.unsubscribe(model_id, events)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _empty_training_data():
+    return {
         'epochs': [],
         'train_loss': [],
         'val_loss': [],
@@ -763,155 +913,6 @@ def get_model_training_data(model_id):
         'precision': [],
         'recall': []
     }
-    
-    try:
-        # 查找runs目录中的训练结果
-        runs_dir = Config.MODELS_FOLDER / 'runs' / f'model_{model_id}'
-        results_csv = None
-        
-        # 首先尝试直接在runs_dir下查找results.csv（YOLO可能直接保存在这里）
-        direct_csv = runs_dir / 'results.csv'
-        if direct_csv.exists():
-            results_csv = direct_csv
-        else:
-            # 如果直接路径不存在，尝试在子目录中查找
-            if runs_dir.exists():
-                # 查找最新的训练结果目录
-                train_dirs = sorted([d for d in runs_dir.iterdir() if d.is_dir()], key=lambda x: x.stat().st_mtime, reverse=True)
-                for train_dir in train_dirs:
-                    csv_path = train_dir / 'results.csv'
-                    if csv_path.exists():
-                        results_csv = csv_path
-                        break
-        
-        if results_csv and results_csv.exists():
-            # 从CSV文件读取训练数据
-            import csv
-            with open(results_csv, 'r') as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-                
-                if not rows:
-                    print(f"Warning: CSV file {results_csv} is empty")
-                    return jsonify({
-                        'error': '训练数据文件为空',
-                        'epochs': [],
-                        'train_loss': [],
-                        'val_loss': [],
-                        'map': [],
-                        'precision': [],
-                        'recall': []
-                    }), 404
-                
-                # 获取所有列名（可能包含空格），创建去除空格后的映射
-                fieldnames = reader.fieldnames or []
-                # 创建列名映射：去除空格后的列名 -> 原始列名
-                fieldname_map = {}
-                for name in fieldnames:
-                    stripped = name.strip()
-                    fieldname_map[stripped] = name
-                
-                def get_value(row, possible_keys):
-                    """从row中获取值，尝试多个可能的键名（考虑空格）"""
-                    for key in possible_keys:
-                        # 先尝试原始键名
-                        if key in row and row[key]:
-                            try:
-                                value = row[key].strip()
-                                if value:
-                                    return float(value)
-                            except (ValueError, AttributeError):
-                                pass
-                        # 再尝试去除空格后的键名
-                        stripped_key = key.strip()
-                        if stripped_key in fieldname_map:
-                            original_key = fieldname_map[stripped_key]
-                            if original_key in row and row[original_key]:
-                                try:
-                                    value = row[original_key].strip()
-                                    if value:
-                                        return float(value)
-                                except (ValueError, AttributeError):
-                                    pass
-                        # 最后尝试在所有键中查找包含该键名的（处理前导空格）
-                        for original_key in row.keys():
-                            if original_key.strip() == stripped_key:
-                                try:
-                                    value = row[original_key].strip()
-                                    if value:
-                                        return float(value)
-                                except (ValueError, AttributeError):
-                                    pass
-                    return 0.0
-                
-                for i, row in enumerate(rows, start=1):
-                    training_data['epochs'].append(i)
-                    
-                    # 读取损失值（计算总损失 = box_loss + cls_loss + dfl_loss）
-                    train_box_loss = get_value(row, ['train/box_loss'])
-                    train_cls_loss = get_value(row, ['train/cls_loss'])
-                    train_dfl_loss = get_value(row, ['train/dfl_loss'])
-                    train_loss = train_box_loss + train_cls_loss + train_dfl_loss
-                    
-                    val_box_loss = get_value(row, ['val/box_loss'])
-                    val_cls_loss = get_value(row, ['val/cls_loss'])
-                    val_dfl_loss = get_value(row, ['val/dfl_loss'])
-                    val_loss = val_box_loss + val_cls_loss + val_dfl_loss
-                    
-                    training_data['train_loss'].append(train_loss)
-                    training_data['val_loss'].append(val_loss)
-                    
-                    # 读取指标
-                    map_value = get_value(row, ['metrics/mAP50(B)', 'metrics/mAP50'])
-                    precision_value = get_value(row, ['metrics/precision(B)', 'metrics/precision'])
-                    recall_value = get_value(row, ['metrics/recall(B)', 'metrics/recall'])
-                    
-                    training_data['map'].append(map_value)
-                    training_data['precision'].append(precision_value)
-                    training_data['recall'].append(recall_value)
-                
-                print(f"Successfully read {len(training_data['epochs'])} epochs from {results_csv}")
-        else:
-            # 如果找不到训练数据文件，返回空数据
-            return jsonify({
-                'error': '训练数据文件不存在，可能runs目录已被删除',
-                'epochs': [],
-                'train_loss': [],
-                'val_loss': [],
-                'map': [],
-                'precision': [],
-                'recall': []
-            }), 404
-            
-    except Exception as e:
-        print(f"Error reading training data: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'error': f'读取训练数据失败: {str(e)}',
-            'epochs': [],
-            'train_loss': [],
-            'val_loss': [],
-            'map': [],
-            'precision': [],
-            'recall': []
-        }), 500
-    
-    # 如果没有数据，返回空数据（但不返回404，让前端处理）
-    if not training_data['epochs']:
-        print(f"Warning: No training data found for model {model_id}")
-        return jsonify({
-            'error': '训练数据为空',
-            'epochs': [],
-            'train_loss': [],
-            'val_loss': [],
-            'map': [],
-            'precision': [],
-            'recall': []
-        }), 200  # 改为200，让前端判断是否有数据
-    
-    print(f"Returning training data for model {model_id}: {len(training_data['epochs'])} epochs")
-    return jsonify(training_data), 200
 
 @models_bp.route('/<int:model_id>/metrics', methods=['GET'])
 @login_required
@@ -931,3 +932,188 @@ def get_model_metrics(model_id):
     
     return jsonify(model.get_metrics()), 200
 
+
+def _set_backend_info(model, **info):
+    """更新模型指标中的推理后端信息（导出状态、产物、基准测试结果）"""
+    metrics = model.get_metrics() or {}
+    backends = metrics.get('backends') or {}
+    backends.update(info)
+    metrics['backends'] = backends
+    model.set_metrics(metrics)
+
+def _expire_backend_tasks(model):
+    """
+    导出/基准测试的状态只由后台线程清除，进程在执行过程中退出时会一直保持进行中；
+    开始时间超过超时时间（或没有开始时间）的任务视为失败，返回是否有状态被修改（不提交）
+    """
+    info = (model.get_metrics() or {}).get('backends') or {}
+    now = datetime.utcnow()
+    
+    def stale(started_at, timeout):
+        return not started_at or (now - datetime.fromisoformat(started_at)).total_seconds() > timeout
+    
+    updates = {}
+    if info.get('status') == 'exporting' and stale(info.get('export_started_at'), Config.EXPORT_TIMEOUT):
+        updates.update(status='failed', error='导出超时或导出进程已退出')
+    if info.get('benchmark_status') == 'running' and stale(info.get('benchmark_started_at'), Config.BENCHMARK_TIMEOUT):
+        updates.update(benchmark_status='failed', benchmark_error='基准测试超时或进程已退出')
+    if updates:
+        _set_backend_info(model, **updates)
+        print(f"Model {model.id} backend task expired: {updates}")
+    return bool(updates)
+
+def _start_export(model, formats=None, int8=None):
+    _set_backend_info(model, status='exporting', error=None, export_started_at=datetime.utcnow().isoformat())
+    db.session.commit()
+    app = current_app._get_current_object()
+    export_thread = threading.Thread(
+        target=export_model_async,
+        args=(app, model.id, formats, int8),
+        daemon=True
+    )
+    export_thread.start()
+
+def export_model_async(app, model_id, formats=None, int8=None):
+    """异步导出模型并对各后端做延迟基准测试"""
+    with app.app_context():
+        try:
+            model = Model.query.get(model_id)
+            if not model or not model.path or not Path(model.path).exists():
+                print(f"Model {model_id} not found or model file missing, skip export")
+                return
+            
+            artifacts, errors = export_model(model.path, formats=formats, int8=int8)
+            benchmark = benchmark_backends(model.path)
+            
+            model = Model.query.get(model_id)
+            if not model:
+                return
+            _set_backend_info(
+                model,
+                status='completed' if artifacts else 'failed',
+                artifacts=artifacts,
+                errors=errors,
+                benchmark=benchmark,
+                exported_at=datetime.utcnow().isoformat()
+            )
+            db.session.commit()
+            # 产物生成后丢弃缓存中的 .pt 模型，下次检测时加载导出的后端
+            model_registry.invalidate(model_id)
+            print(f"Model {model_id} exported: {list(artifacts.keys())}")
+        except Exception as e:
+            import traceback
+            print(f"Export failed for model {model_id}: {str(e)}")
+            print(traceback.format_exc())
+            db.session.rollback()
+            model = Model.query.get(model_id)
+            if model:
+                _set_backend_info(model, status='failed', error=str(e))
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+def _start_benchmark(model, runs):
+    _set_backend_info(model, benchmark_status='running', benchmark_error=None,
+                      benchmark_started_at=datetime.utcnow().isoformat())
+    db.session.commit()
+    app = current_app._get_current_object()
+    benchmark_thread = threading.Thread(
+        target=benchmark_model_async,
+        args=(app, model.id, runs),
+        daemon=True
+    )
+    benchmark_thread.start()
+
+def benchmark_model_async(app, model_id, runs):
+    """后台对模型现有的各推理后端做延迟基准测试，结果写入模型指标"""
+    with app.app_context():
+        try:
+            model = Model.query.get(model_id)
+            if not model or not model.path or not Path(model.path).exists():
+                return
+            benchmark = benchmark_backends(model.path, runs=runs)
+            model = Model.query.get(model_id)
+            if not model:
+                return
+            _set_backend_info(model, benchmark=benchmark, benchmark_status='completed',
+                              benchmarked_at=datetime.utcnow().isoformat())
+            db.session.commit()
+        except Exception as e:
+            import traceback
+            print(f"Benchmark failed for model {model_id}: {str(e)}")
+            print(traceback.format_exc())
+            db.session.rollback()
+            model = Model.query.get(model_id)
+            if model:
+                _set_backend_info(model, benchmark_status='failed', benchmark_error=str(e))
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+@models_bp.route('/<int:model_id>/backends', methods=['GET'])
+@login_required
+def get_model_backends(model_id):
+    """获取模型可用的推理后端、当前使用的后端和延迟基准测试结果"""
+    model = Model.query.get_or_404(model_id)
+    if not model.path or not Path(model.path).exists():
+        return jsonify({'message': '模型文件不存在'}), 404
+    
+    if _expire_backend_tasks(model):
+        db.session.commit()
+    artifacts = find_backend_artifacts(model.path)
+    active_path = resolve_inference_path(model.path)
+    info = (model.get_metrics() or {}).get('backends') or {}
+    return jsonify({
+        'available': {backend: str(path) for backend, path in artifacts.items()},
+        'active': next((backend for backend, path in artifacts.items() if path == active_path), 'pytorch'),
+        'status': info.get('status'),
+        'errors': info.get('errors') or {},
+        # 本进程中加载失败、已回退到 .pt 的导出产物
+        'failed': {backend: backend_failure(path) for backend, path in artifacts.items()
+                   if backend != 'pytorch' and backend_failure(path) is not None},
+        'error': info.get('error'),
+        'benchmark': info.get('benchmark') or {},
+        'benchmark_status': info.get('benchmark_status'),
+        'benchmark_error': info.get('benchmark_error'),
+        'benchmarked_at': info.get('benchmarked_at'),
+        'exported_at': info.get('exported_at')
+    }), 200
+
+@models_bp.route('/<int:model_id>/export', methods=['POST'])
+@admin_required
+def export_model_backends(model_id):
+    """手动导出模型的CPU推理后端（后台执行）"""
+    model = Model.query.get_or_404(model_id)
+    if model.status not in ['completed', 'published']:
+        return jsonify({'message': '只有训练完成的模型才能导出'}), 400
+    if not model.path or not Path(model.path).exists():
+        return jsonify({'message': '模型文件不存在'}), 404
+    _expire_backend_tasks(model)
+    if ((model.get_metrics() or {}).get('backends') or {}).get('status') == 'exporting':
+        return jsonify({'message': '模型正在导出中'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    formats = data.get('formats') or Config.EXPORT_FORMATS
+    unsupported = [f for f in formats if f not in ('onnx', 'openvino')]
+    if unsupported:
+        return jsonify({'message': f'不支持的导出格式: {", ".join(unsupported)}'}), 400
+    
+    _start_export(model, formats, data.get('int8'))
+    return jsonify({'message': '导出任务已启动', 'formats': formats}), 202
+
+@models_bp.route('/<int:model_id>/benchmark', methods=['POST'])
+@admin_required
+def benchmark_model_backends(model_id):
+    """对模型现有的各推理后端重新做延迟基准测试（后台执行，通过 GET /backends 查询结果）"""
+    model = Model.query.get_or_404(model_id)
+    if not model.path or not Path(model.path).exists():
+        return jsonify({'message': '模型文件不存在'}), 404
+    _expire_backend_tasks(model)
+    info = (model.get_metrics() or {}).get('backends') or {}
+    if info.get('status') == 'exporting' or info.get('benchmark_status') == 'running':
+        return jsonify({'message': '模型正在导出或基准测试中'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    runs = max(1, min(int(data.get('runs', Config.BENCHMARK_RUNS)), Config.BENCHMARK_MAX_RUNS))
+    _start_benchmark(model, runs)
+    return jsonify({'message': '基准测试已启动', 'runs': runs}), 202
@@ -1,18 +1,77 @@
-from flask import Blueprint, request, jsonify
-from models import Detection, db
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from models import Detection, DetectionRollupHourly, DetectionRollupDaily, db
 from utils.auth import login_required, admin_required
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_
+from config import Config
+from utils.rollups import floor_time
+from utils.detection_writer import detection_writer
+from utils.box_store import box_store, dtype_description, export_binary, export_csv, export_ndjson, BOX_DTYPE, SOURCE_CODES
+from utils.detection import CLASS_IDS
 from datetime import datetime, timedelta
+import base64
+import binascii
+import json
 
 statistics_bp = Blueprint('statistics', __name__)
 
+DETECTION_TYPES = ['image', 'video', 'realtime']
+GRANULARITY_STEPS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1)
+}
+
+def _bucket_label(dt, granularity):
+    return dt.strftime('%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d')
+
+def _parse_time(value, end=False):
+    """解析 ISO 格式时间，只有日期时结束时间包含当天"""
+    dt = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt
+
 @statistics_bp.route('', methods=['GET'])
 @admin_required
 def get_statistics():
-    # Get total statistics
-    total_detections = Detection.query.count()
-    with_helmet = Detection.query.with_entities(func.sum(Detection.with_helmet)).scalar() or 0
-    without_helmet = Detection.query.with_entities(func.sum(Detection.without_helmet)).scalar() or 0
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITY_STEPS:
+        return jsonify({'message': 'granularity 必须是 hour、day 或 week'}), 400
+    step = GRANULARITY_STEPS[granularity]
+    
+    # 统计范围：默认最近 days 天（含当前时段），也可以用 start/end 指定
+    try:
+        now = datetime.utcnow()
+        days = request.args.get('days', 30, type=int)
+        end = _parse_time(request.args['end'], end=True) if request.args.get('end') else now
+        if request.args.get('start'):
+            start = floor_time(_parse_time(request.args['start']), granularity)
+        else:
+            start = floor_time(end - timedelta(days=days), granularity) + step
+    except ValueError:
+        return jsonify({'message': '时间格式错误，请使用 ISO 格式（如 2024-01-01 或 2024-01-01T08:00:00）'}), 400
+    if start >= end:
+        return jsonify({'message': '开始时间必须早于结束时间'}), 400
+    if (end - start) / step > Config.STATISTICS_MAX_BUCKETS:
+        return jsonify({'message': f'统计时间段数量超过上限 ({Config.STATISTICS_MAX_BUCKETS})，请缩小范围或增大粒度'}), 400
+    
+    # 可选按模型/用户筛选
+    filters = {field: request.args.get(field, type=int) for field in ('model_id', 'user_id')}
+    filters = {field: value for field, value in filters.items() if value is not None}
+    
+    def rollup_query(rollup_cls, *columns):
+        query = db.session.query(*columns)
+        for field, value in filters.items():
+            query = query.filter(getattr(rollup_cls, field) == value)
+        return query
+    
+    # 总计：从按天聚合表汇总，开销只与天数有关
+    total_detections, with_helmet, without_helmet = rollup_query(
+        DetectionRollupDaily,
+        func.coalesce(func.sum(DetectionRollupDaily.count), 0),
+        func.coalesce(func.sum(DetectionRollupDaily.with_helmet), 0),
+        func.coalesce(func.sum(DetectionRollupDaily.without_helmet), 0)
+    ).one()
     
     detection_rate = 0
     if total_detections > 0:
@@ -20,53 +79,208 @@ def get_statistics():
         if total_people > 0:
             detection_rate = with_helmet / total_people
     
-    # Get daily statistics for last 30 days, grouped by detection type
+    # 按时间段和检测类型读取聚合表：按小时统计读小时表，按天/周统计读天表（周在内存中合并）
+    rollup_cls = DetectionRollupHourly if granularity == 'hour' else DetectionRollupDaily
+    rows = rollup_query(
+        rollup_cls,
+        rollup_cls.bucket_start,
+        rollup_cls.detection_type,
+        func.sum(rollup_cls.count),
+        func.sum(rollup_cls.with_helmet),
+        func.sum(rollup_cls.without_helmet)
+    ).filter(
+        rollup_cls.bucket_start >= start,
+        rollup_cls.bucket_start < end
+    ).group_by(rollup_cls.bucket_start, rollup_cls.detection_type).all()
+    
+    grouped = {}
+    for bucket_start, det_type, count, bucket_with, bucket_without in rows:
+        label = _bucket_label(floor_time(bucket_start, granularity), granularity)
+        grouped.setdefault(label, []).append((det_type, count, bucket_with, bucket_without))
+    
+    # 补齐没有检测记录的时间段
     daily_stats = []
-    detection_types = ['image', 'video', 'realtime']
-    
-    for i in range(30):
-        date = datetime.now() - timedelta(days=i)
-        date_str = date.strftime('%Y-%m-%d')
-        date_obj = date.date()
-        
-        # 统计每种类型的检测次数
-        stats_by_type = {}
-        for det_type in detection_types:
-            count = Detection.query.filter(
-                func.date(Detection.created_at) == date_obj,
-                Detection.detection_type == det_type
-            ).count()
-            stats_by_type[det_type] = count
-        
-        # 总检测次数
-        total_count = sum(stats_by_type.values())
-        
-        daily_stats.append({
-            'date': date_str,
-            'count': total_count,
-            'image': stats_by_type['image'],
-            'video': stats_by_type['video'],
-            'realtime': stats_by_type['realtime']
-        })
-    
-    daily_stats.reverse()
+    current = start
+    while current < end:
+        label = _bucket_label(current, granularity)
+        item = {'date': label, 'count': 0, 'with_helmet': 0, 'without_helmet': 0}
+        item.update({det_type: 0 for det_type in DETECTION_TYPES})
+        for det_type, count, bucket_with, bucket_without in grouped.get(label, []):
+            item['count'] += int(count)
+            item['with_helmet'] += int(bucket_with)
+            item['without_helmet'] += int(bucket_without)
+            if det_type in DETECTION_TYPES:
+                item[det_type] += int(count)
+        daily_stats.append(item)
+        current += step
     
     return jsonify({
-        'total_detections': total_detections,
+        'total_detections': int(total_detections),
         'with_helmet': int(with_helmet),
         'without_helmet': int(without_helmet),
         'detection_rate': detection_rate,
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
         'daily_stats': daily_stats
     }), 200
 
+HISTORY_COLUMNS = ['id', 'user_id', 'model_id', 'detection_type', 'with_helmet', 'without_helmet', 'total', 'created_at']
+
+def _encode_cursor(created_at, detection_id):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{detection_id}'.encode()).decode()
+
+def _decode_cursor(cursor):
+    created_at, detection_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(detection_id)
+
+def _history_query():
+    """根据查询参数构造检测历史查询（按 created_at, id 倒序），参数错误时抛出 ValueError"""
+    query = db.session.query(*[getattr(Detection, c) for c in HISTORY_COLUMNS]).filter(Detection.created_at.isnot(None))
+    
+    # days=0 表示不限制时间范围
+    days = request.args.get('days', 30, type=int)
+    if days:
+        query = query.filter(Detection.created_at >= datetime.utcnow() - timedelta(days=days))
+    for field in ('model_id', 'user_id'):
+        value = request.args.get(field, type=int)
+        if value is not None:
+            query = query.filter(getattr(Detection, field) == value)
+    det_type = request.args.get('type')
+    if det_type:
+        if det_type not in DETECTION_TYPES:
+            raise ValueError(f'未知的检测类型: {det_type}')
+        query = query.filter(Detection.detection_type == det_type)
+    # 按类别筛选：包含该类别检测结果的记录
+    class_name = request.args.get('class')
+    if class_name:
+        if class_name not in ('with_helmet', 'without_helmet'):
+            raise ValueError(f'未知的类别: {class_name}')
+        query = query.filter(getattr(Detection, class_name) > 0)
+    
+    return query.order_by(Detection.created_at.desc(), Detection.id.desc())
+
+def _history_row(row):
+    item = dict(zip(HISTORY_COLUMNS, row))
+    item['created_at'] = item['created_at'].isoformat()
+    return item
+
 @statistics_bp.route('/history', methods=['GET'])
 @admin_required
 def get_detection_history():
-    days = request.args.get('days', 30, type=int)
+    """检测历史，按 (created_at, id) 游标分页，翻页开销与页码无关"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), Config.HISTORY_MAX_PAGE_SIZE)
+    try:
+        query = _history_query()
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, detection_id = _decode_cursor(cursor)
+            # 游标之后（更早）的记录：created_at 更早，或 created_at 相同但 id 更小
+            query = query.filter(or_(
+                Detection.created_at < created_at,
+                and_(Detection.created_at == created_at, Detection.id < detection_id)
+            ))
+    except (ValueError, UnicodeDecodeError, binascii.Error) as e:
+        return jsonify({'message': f'参数错误: {str(e)}'}), 400
+    
+    # 多取一条判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = dict(zip(HISTORY_COLUMNS, rows[-1]))
+        next_cursor = _encode_cursor(last['created_at'], last['id'])
+    
+    return jsonify({
+        'items': [_history_row(row) for row in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+@statistics_bp.route('/history/export', methods=['GET'])
+@admin_required
+def export_detection_history():
+    """流式导出检测历史（ndjson 或 csv），通过服务端游标分批读取，不在内存中保存完整结果"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format 必须是 ndjson 或 csv'}), 400
+    try:
+        query = _history_query().yield_per(Config.HISTORY_EXPORT_BATCH_SIZE)
+    except ValueError as e:
+        return jsonify({'message': f'参数错误: {str(e)}'}), 400
     
-    detections = Detection.query.filter(
-        Detection.created_at >= datetime.now() - timedelta(days=days)
-    ).order_by(Detection.created_at.desc()).limit(100).all()
+    def generate_ndjson():
+        for row in query:
+            yield json.dumps(_history_row(row)) + '\n'
     
-    return jsonify([d.to_dict() for d in detections]), 200
+    def generate_csv():
+        yield ','.join(HISTORY_COLUMNS) + '\n'
+        for row in query:
+            item = _history_row(row)
+            yield ','.join('' if item[c] is None else str(item[c]) for c in HISTORY_COLUMNS) + '\n'
+    
+    filename = f"detections_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+    if export_format == 'csv':
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    else:
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.ndjson'
+    return response
+
+@statistics_bp.route('/writer', methods=['GET'])
+@admin_required
+def get_writer_stats():
+    """获取检测记录写入队列的统计（队列深度、批量写入耗时）"""
+    return jsonify(detection_writer.stats()), 200
+
+@statistics_bp.route('/boxes', methods=['GET'])
+@admin_required
+def get_box_storage_stats():
+    """获取检测框存储的统计（天数、记录数、占用空间）和记录格式"""
+    stats = box_store.stats()
+    stats['dtype'] = dtype_description()
+    stats['sources'] = SOURCE_CODES
+    stats['classes'] = CLASS_IDS
+    return jsonify(stats), 200
 
+@statistics_bp.route('/boxes/export', methods=['GET'])
+@admin_required
+def export_boxes():
+    """流式导出检测框：binary（原始定长记录）、csv 或 ndjson"""
+    export_format = request.args.get('format', 'binary')
+    if export_format not in ('binary', 'csv', 'ndjson'):
+        return jsonify({'message': 'format 必须是 binary、csv 或 ndjson'}), 400
+    try:
+        start = datetime.fromisoformat(request.args['start']).date() if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']).date() if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'message': '日期格式错误，请使用 ISO 格式（如 2024-01-01）'}), 400
+    det_type = request.args.get('type')
+    class_name = request.args.get('class')
+    if det_type and det_type not in SOURCE_CODES:
+        return jsonify({'message': f'未知的检测类型: {det_type}'}), 400
+    if class_name and class_name not in CLASS_IDS:
+        return jsonify({'message': f'未知的类别: {class_name}'}), 400
+    
+    chunks = box_store.iter_chunks(
+        start, end,
+        model_id=request.args.get('model_id', type=int),
+        user_id=request.args.get('user_id', type=int),
+        source=SOURCE_CODES[det_type] if det_type else None,
+        class_id=CLASS_IDS[class_name] if class_name else None
+    )
+    
+    filename = f"boxes_{start or 'all'}_{end or 'all'}"
+    if export_format == 'binary':
+        response = Response(stream_with_context(export_binary(chunks)), mimetype='application/octet-stream')
+        response.headers['X-Box-Dtype'] = json.dumps(dtype_description())
+        response.headers['X-Box-Record-Size'] = str(BOX_DTYPE.itemsize)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.bin'
+    elif export_format == 'csv':
+        response = Response(stream_with_context(export_csv(chunks)), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+    else:
+        response = Response(stream_with_context(export_ndjson(chunks)), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.ndjson'
+    return response
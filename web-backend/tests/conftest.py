@@ -0,0 +1,5 @@
+"""测试在 web-backend 目录下运行：python -m pytest tests"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,72 @@
+import numpy as np
+
+from utils.annotation import LabelSpriteCache, downscale, encode_jpeg, label_sprites, render_detections, scale_detections
+
+
+def _frame():
+    return np.zeros((240, 320, 3), dtype=np.uint8)
+
+
+def test_repeated_frames_hit_sprite_cache():
+    detections = [
+        {'class': 'with_helmet', 'confidence': 0.912, 'bbox': [40, 60, 100, 160], 'track_id': 7},
+        {'class': 'without_helmet', 'confidence': 0.55, 'bbox': [150, 80, 220, 200], 'track_id': 8},
+    ]
+    render_detections(_frame(), detections)
+    before = label_sprites.stats()
+    for _ in range(5):
+        render_detections(_frame(), detections)
+    after = label_sprites.stats()
+    assert after['misses'] == before['misses']
+    assert after['hits'] > before['hits']
+
+
+def test_sprite_keys_are_bounded_by_class_and_confidence_bucket():
+    cache = LabelSpriteCache(max_entries=1000)
+    for track_id in range(200):
+        for glyph in f'#{track_id} ':
+            cache.glyph(glyph)
+        cache.label('with_helmet', 0.9 + track_id * 1e-5)
+    # 1 个置信度分桶 + '#'、' '、0-9
+    assert cache.stats()['entries'] == 13
+
+
+def test_label_buckets_round_to_two_decimals():
+    cache = LabelSpriteCache()
+    assert cache.label('with_helmet', 0.904) is cache.label('with_helmet', 0.9)
+    assert cache.label('with_helmet', 0.91) is not cache.label('with_helmet', 0.9)
+
+
+def test_render_draws_class_colours_in_bgr():
+    frame = _frame()
+    render_detections(frame, [{'class': 'with_helmet', 'confidence': 0.9, 'bbox': [40, 60, 100, 160]}])
+    assert tuple(frame[100, 40]) == (0, 255, 0)
+    frame = _frame()
+    render_detections(frame, [{'class': 'without_helmet', 'confidence': 0.9, 'bbox': [40, 60, 100, 160]}])
+    assert tuple(frame[100, 40]) == (0, 0, 255)
+
+
+def test_labels_outside_frame_are_clipped():
+    frame = _frame()
+    render_detections(frame, [{'class': 'with_helmet', 'confidence': 0.9, 'bbox': [-50, 0, 10, 10], 'track_id': 1}])
+    assert frame.shape == (240, 320, 3)
+
+
+def test_downscale_and_scale_detections():
+    frame = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    preview, scale = downscale(frame, 500)
+    assert preview.shape[:2] == (250, 500)
+    assert scale == 0.25
+    same, scale = downscale(frame, 4000)
+    assert same is frame and scale == 1.0
+    detections = [{'class': 'with_helmet', 'confidence': 0.9, 'bbox': [100, 200, 300, 400]}]
+    assert scale_detections(detections, 0.25)[0]['bbox'] == [25, 50, 75, 100]
+    assert detections[0]['bbox'] == [100, 200, 300, 400]
+
+
+def test_encode_jpeg_quality():
+    frame = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    low = encode_jpeg(frame, quality=20)
+    high = encode_jpeg(frame, quality=95)
+    assert low[:2] == b'\xff\xd8'
+    assert len(low) < len(high)
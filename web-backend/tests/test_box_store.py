@@ -0,0 +1,119 @@
+import json
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from utils.box_store import (BOX_DTYPE, CSV_HEADER, SOURCE_CODES, BoxStore, dtype_description, export_binary,
+                             export_csv, export_ndjson, record_rows)
+
+# 2024-01-01 12:00:00 UTC / 2024-01-02 12:00:00 UTC
+DAY1 = datetime(2024, 1, 1, 12, tzinfo=timezone.utc).timestamp()
+DAY2 = datetime(2024, 1, 2, 12, tzinfo=timezone.utc).timestamp()
+
+
+def _detections():
+    return [
+        {'class': 'with_helmet', 'confidence': 0.91, 'bbox': [10.04, 20.0, 110.0, 220.0], 'track_id': 3},
+        {'class': 'without_helmet', 'confidence': 0.5, 'bbox': [5.0, 6.0, 7.0, 8.0]},
+        {'class': 'person', 'confidence': 0.25, 'bbox': [0.0, 0.0, 1.0, 1.0]},
+    ]
+
+
+def _store(tmp_path):
+    return BoxStore(root=tmp_path / 'boxes', enabled=True)
+
+
+def test_record_layout_is_fixed_size():
+    assert BOX_DTYPE.itemsize == 50
+    fields = {f['name']: f for f in dtype_description()}
+    assert fields['bbox']['shape'] == [4]
+    assert fields['bbox']['offset'] + 16 == BOX_DTYPE.itemsize
+
+
+def test_disabled_store_writes_nothing(tmp_path):
+    store = BoxStore(root=tmp_path / 'boxes', enabled=False)
+    assert store.append(_detections()) == 0
+    assert not (tmp_path / 'boxes').exists()
+
+
+def test_append_packs_records_into_daily_files(tmp_path):
+    store = _store(tmp_path)
+    assert store.append(_detections(), model_id=4, user_id=9, source='video', frame=12,
+                        image_size=(640, 480), timestamp=DAY1) == 3
+    store.append(_detections()[:1], model_id=5, timestamp=DAY2)
+
+    assert [day for day, _ in store.days()] == [date(2024, 1, 1), date(2024, 1, 2)]
+    records = np.fromfile(tmp_path / 'boxes' / '20240101.bin', dtype=BOX_DTYPE)
+    assert len(records) == 3
+    assert records['model_id'].tolist() == [4, 4, 4]
+    assert records['user_id'].tolist() == [9, 9, 9]
+    assert records['source'].tolist() == [SOURCE_CODES['video']] * 3
+    assert records['frame'].tolist() == [12, 12, 12]
+    assert records['track_id'].tolist() == [3, -1, -1]
+    assert records['class_id'].tolist() == [0, 1, 255]
+    assert records['width'].tolist() == [640] * 3 and records['height'].tolist() == [480] * 3
+    np.testing.assert_allclose(records['bbox'][1], [5, 6, 7, 8])
+    assert store.stats()['records'] == 4
+
+
+def test_iter_chunks_filters_and_respects_date_range(tmp_path):
+    store = _store(tmp_path)
+    store.append(_detections(), model_id=1, source='image', timestamp=DAY1)
+    store.append(_detections(), model_id=2, source='realtime', timestamp=DAY2)
+
+    chunks = list(store.iter_chunks(chunk_size=2))
+    assert [len(c) for c in chunks] == [2, 1, 2, 1]
+    assert sum(len(c) for c in store.iter_chunks(start=date(2024, 1, 2))) == 3
+    assert sum(len(c) for c in store.iter_chunks(end=date(2024, 1, 1))) == 3
+    model2 = np.concatenate(list(store.iter_chunks(model_id=2)))
+    assert set(model2['source'].tolist()) == {SOURCE_CODES['realtime']}
+    assert sum(len(c) for c in store.iter_chunks(class_id=1)) == 2
+    assert list(store.iter_chunks(model_id=3)) == []
+
+
+def test_iter_chunks_ignores_partial_trailing_record(tmp_path):
+    store = _store(tmp_path)
+    store.append(_detections(), timestamp=DAY1)
+    with open(tmp_path / 'boxes' / '20240101.bin', 'ab') as f:
+        f.write(b'\x00' * 10)
+    assert sum(len(c) for c in store.iter_chunks()) == 3
+
+
+def test_record_rows_maps_codes_to_names(tmp_path):
+    store = _store(tmp_path)
+    store.append(_detections(), model_id=7, source='video', frame=3, image_size=(640, 480), timestamp=DAY1)
+    rows = [row for chunk in store.iter_chunks() for row in record_rows(chunk)]
+    assert rows[0] == {
+        'timestamp': DAY1, 'model_id': 7, 'user_id': None, 'type': 'video', 'class': 'with_helmet',
+        'frame': 3, 'track_id': 3, 'width': 640, 'height': 480, 'confidence': 0.91,
+        'bbox': [10.0, 20.0, 110.0, 220.0]
+    }
+    assert rows[1]['track_id'] is None
+    assert rows[2]['class'] == 'unknown'
+
+
+def test_export_csv_and_ndjson(tmp_path):
+    store = _store(tmp_path)
+    store.append(_detections()[:2], model_id=7, timestamp=DAY1)
+    store.append(_detections()[:1], model_id=8, timestamp=DAY2)
+
+    text = ''.join(export_csv(store.iter_chunks()))
+    lines = text.splitlines()
+    assert lines[0] + '\n' == CSV_HEADER
+    assert len(lines) == 4
+    assert lines[1].split(',') == [str(DAY1), '7', '', 'image', 'with_helmet', '0', '3', '0', '0', '0.91',
+                                   '10.0', '20.0', '110.0', '220.0']
+    assert all(len(line.split(',')) == len(lines[0].split(',')) for line in lines)
+
+    rows = [json.loads(line) for line in ''.join(export_ndjson(store.iter_chunks())).splitlines()]
+    assert [row['model_id'] for row in rows] == [7, 7, 8]
+    assert rows[1]['class'] == 'without_helmet'
+
+
+def test_export_binary_round_trips(tmp_path):
+    store = _store(tmp_path)
+    store.append(_detections(), model_id=7, timestamp=DAY1)
+    data = b''.join(export_binary(store.iter_chunks(chunk_size=2)))
+    records = np.frombuffer(data, dtype=BOX_DTYPE)
+    assert len(records) == 3
+    assert records['class_id'].tolist() == [0, 1, 255]
@@ -0,0 +1,98 @@
+import os
+
+from PIL import Image
+
+from utils.dataset_index import (LABEL_EMPTY, LABEL_INVALID, LABEL_MISSING, LABEL_OK, DatasetIndexCache,
+                                 build_dataset_index, load_index_arrays, training_preflight)
+
+
+def _write_image(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', size).save(path)
+
+
+def _write_label(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def _dataset(root):
+    _write_image(root / 'train' / 'images' / 'a.jpg', (640, 480))
+    _write_label(root / 'train' / 'labels' / 'a.txt', '0 0.5 0.5 0.5 0.5\n1 0.1 0.1 0.02 0.02\n0 0.2 0.2 0.1 0.1\n')
+    _write_image(root / 'train' / 'images' / 'sub' / 'b.png', (320, 240))
+    _write_label(root / 'train' / 'labels' / 'sub' / 'b.txt', '1 0.1 0.1 0.3 0.1 0.3 0.4\n')  # 多边形标签
+    _write_image(root / 'train' / 'images' / 'c.jpg', (100, 100))
+    _write_label(root / 'train' / 'labels' / 'c.txt', '\n')
+    _write_image(root / 'train' / 'images' / 'd.jpg', (100, 100))
+    _write_label(root / 'train' / 'labels' / 'd.txt', '0 0.5 0.5\nbad line here x y\n')
+    _write_image(root / 'valid' / 'images' / 'e.jpg', (200, 100))
+    (root / 'valid' / 'images' / 'broken.jpg').write_bytes(b'not an image')
+    _write_label(root / 'valid' / 'labels' / 'broken.txt', '1 0.5 0.5 0.2 0.2\n')
+    (root / 'train' / 'images' / 'notes.txt').write_text('ignored')
+
+
+def test_index_summary(tmp_path):
+    _dataset(tmp_path)
+    summary = build_dataset_index(tmp_path, workers=2)
+
+    assert summary['image_count'] == 6
+    assert summary['box_count'] == 5
+    assert summary['splits']['train'] == {'images': 4, 'labeled': 2, 'boxes': 4, 'missing_labels': 0,
+                                          'empty_labels': 1, 'invalid_labels': 1}
+    assert summary['splits']['val']['missing_labels'] == 1
+    assert summary['splits']['test']['images'] == 0
+    assert summary['classes'] == {'0': {'boxes': 2, 'images': 1}, '1': {'boxes': 3, 'images': 3}}
+    assert summary['max_class_id'] == 1
+    assert summary['unreadable_images'] == 1
+    assert summary['image_size']['max_width'] == 640 and summary['image_size']['min_height'] == 100
+    # broken.jpg 尺寸未知，不计入大小分布
+    assert sum(summary['box_size'].values()) == 4
+    assert sum(summary['box_scale_histogram']['counts']) == 5
+
+
+def test_index_arrays(tmp_path):
+    _dataset(tmp_path)
+    build_dataset_index(tmp_path, workers=1)
+    arrays = load_index_arrays(tmp_path)
+    paths = [path.replace(os.sep, '/') for path in arrays['paths'].tolist()]
+    # 按划分、路径排序
+    assert paths == ['train/images/a.jpg', 'train/images/c.jpg', 'train/images/d.jpg', 'train/images/sub/b.png',
+                     'valid/images/broken.jpg', 'valid/images/e.jpg']
+    assert arrays['label_status'].tolist() == [LABEL_OK, LABEL_EMPTY, LABEL_INVALID, LABEL_OK, LABEL_OK,
+                                               LABEL_MISSING]
+    assert arrays['box_count'].tolist() == [3, 0, 0, 1, 1, 0]
+    assert arrays['box_image'].tolist() == [0, 0, 0, 3, 4]
+    assert arrays['box_class'].tolist() == [0, 1, 0, 1, 1]
+    assert arrays['box_wh'].shape == (5, 2)
+    assert load_index_arrays(tmp_path / 'missing') is None
+
+
+def test_cache_reloads_after_rebuild(tmp_path):
+    cache = DatasetIndexCache()
+    assert cache.load(tmp_path) is None
+    _dataset(tmp_path)
+    summary = cache.get_or_build(tmp_path)
+    assert summary['image_count'] == 6
+    assert cache.load(tmp_path) is summary
+
+    _write_image(tmp_path / 'test' / 'images' / 'f.jpg', (50, 50))
+    build_dataset_index(tmp_path, workers=1)
+    index_json = tmp_path / 'index.json'
+    stat = index_json.stat()
+    os.utime(index_json, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(tmp_path)['image_count'] == 7
+
+
+def test_training_preflight(tmp_path):
+    _dataset(tmp_path)
+    summary = build_dataset_index(tmp_path, workers=1)
+    errors, warnings = training_preflight(summary, nc=2)
+    assert errors == []
+    assert any('缺少标签文件' in w for w in warnings)
+    assert any('无法读取' in w for w in warnings)
+
+    errors, _ = training_preflight(summary, nc=1)
+    assert any('nc=1' in e for e in errors)
+    (tmp_path / 'empty').mkdir()
+    errors, _ = training_preflight(build_dataset_index(tmp_path / 'empty', workers=1))
+    assert '训练集没有图片' in errors and '验证集没有图片' in errors
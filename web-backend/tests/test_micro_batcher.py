@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.micro_batcher import MicroBatcher
+
+
+class _Model:
+    """记录每次推理的批次，返回每张图片的像素值和置信度阈值"""
+
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, images, conf_threshold):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append((len(images), conf_threshold))
+        return [(int(image[0, 0, 0]), conf_threshold) for image in images]
+
+
+def _image(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_concurrent_requests_are_merged_and_results_routed():
+    gate = threading.Event()
+    model = _Model(gate)
+    batcher = MicroBatcher(model, max_batch=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(_image(i), 0.5) for i in range(4)]
+        gate.set()
+        assert [f.result(5) for f in futures] == [(i, 0.5) for i in range(4)]
+        assert batcher.stats()['items'] == 4
+        assert batcher.stats()['max_batch_size'] > 1
+        assert all(size <= 8 for size, _ in model.calls)
+    finally:
+        batcher.stop()
+
+
+def test_different_confidence_thresholds_are_not_merged():
+    gate = threading.Event()
+    model = _Model(gate)
+    batcher = MicroBatcher(model, max_batch=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(_image(i), 0.25 if i % 2 else 0.5) for i in range(4)]
+        gate.set()
+        assert [f.result(5) for f in futures] == [(i, 0.25 if i % 2 else 0.5) for i in range(4)]
+        for size, conf in model.calls:
+            assert conf in (0.25, 0.5)
+        assert sum(size for size, _ in model.calls) == 4
+    finally:
+        batcher.stop()
+
+
+def test_inference_errors_are_set_on_every_future():
+    def failing(images, conf_threshold):
+        raise RuntimeError('boom')
+
+    batcher = MicroBatcher(failing, max_batch=4, max_wait_ms=1)
+    try:
+        future = batcher.submit(_image(1), 0.5)
+        with pytest.raises(RuntimeError):
+            future.result(5)
+    finally:
+        batcher.stop()
+
+
+def test_unreadable_path_raises_before_queueing(tmp_path):
+    batcher = MicroBatcher(_Model(), max_batch=4, max_wait_ms=1)
+    try:
+        with pytest.raises(ValueError):
+            batcher.submit(tmp_path / 'missing.jpg', 0.5)
+        assert batcher.stats()['queue_depth'] == 0
+    finally:
+        batcher.stop()
+
+
+def test_submit_after_stop_runs_directly():
+    model = _Model()
+    batcher = MicroBatcher(model, max_batch=4, max_wait_ms=1)
+    batcher.stop()
+    assert batcher.stopped
+    assert batcher.submit(_image(7), 0.5).result(0) == (7, 0.5)
+    assert batcher.stats()['direct'] == 1
+
+
+def test_requests_queued_before_stop_are_still_inferred():
+    gate = threading.Event()
+    model = _Model(gate)
+    batcher = MicroBatcher(model, max_batch=2, max_wait_ms=1)
+    futures = [batcher.submit(_image(i), 0.5) for i in range(5)]
+    batcher.stop()
+    gate.set()
+    assert [f.result(5) for f in futures] == [(i, 0.5) for i in range(5)]
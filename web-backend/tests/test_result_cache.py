@@ -0,0 +1,76 @@
+import json
+
+from utils.result_cache import ResultCache, content_hash, make_key
+
+
+def test_key_changes_with_weights_and_parameters():
+    image_hash = content_hash(b'image bytes')
+    key = make_key(image_hash, 1, ('best.pt', 1, 2), 0.5, 0.45)
+    assert key == make_key(content_hash(b'image bytes'), 1, ('best.pt', 1, 2), 0.5, 0.45)
+    assert key != make_key(image_hash, 1, ('best.pt', 2, 2), 0.5, 0.45)
+    assert key != make_key(image_hash, 1, ('best.pt', 1, 2), 0.6, 0.45)
+    assert key != make_key(image_hash, 2, ('best.pt', 1, 2), 0.5, 0.45)
+    assert key != make_key(image_hash, 1, ('best.pt', 1, 2), 0.5, 0.45, 'boxes')
+
+
+def test_get_returns_independent_copies(tmp_path):
+    cache = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=False, disk_dir=tmp_path / 'cache')
+    cache.put(1, 'k', {'detections': [1, 2]})
+    first = cache.get(1, 'k')
+    first['detections'].append(3)
+    assert cache.get(1, 'k') == {'detections': [1, 2]}
+    assert cache.get(1, 'missing') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert stats['models']['1']['hits'] == 2
+
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=False, disk_dir=tmp_path / 'cache')
+    value = {'image': 'x' * 400 * 1024}
+    cache.put(1, 'a', value)
+    cache.put(1, 'b', value)
+    cache.get(1, 'a')
+    cache.put(1, 'c', value)
+    assert cache.get(1, 'b') is None
+    assert cache.get(1, 'a') is not None and cache.get(1, 'c') is not None
+    assert cache.evictions == 1
+
+
+def test_disk_cache_survives_a_new_process(tmp_path):
+    cache = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=True, disk_dir=tmp_path / 'cache', disk_max_mb=1)
+    cache.put(1, 'abcdef', {'stats': {'total': 2}})
+    assert cache.disk_writes == 1
+
+    restarted = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=True, disk_dir=tmp_path / 'cache', disk_max_mb=1)
+    assert restarted.get(1, 'abcdef') == {'stats': {'total': 2}}
+    assert restarted.stats()['models']['1']['disk_hits'] == 1
+    # 磁盘命中后放回内存
+    assert restarted.stats()['entries'] == 1
+
+
+def test_disk_cache_is_pruned_to_budget(tmp_path):
+    cache = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=True, disk_dir=tmp_path / 'cache', disk_max_mb=1)
+    value = {'image': 'x' * 300 * 1024}
+    for i in range(5):
+        cache.put(1, f'key{i}', value)
+    files = list((tmp_path / 'cache').rglob('*.json'))
+    assert sum(f.stat().st_size for f in files) <= 1024 * 1024
+    assert cache.disk_evictions > 0
+
+
+def test_invalidate_model_drops_only_that_model(tmp_path):
+    cache = ResultCache(enabled=True, max_memory_mb=1, disk_enabled=False, disk_dir=tmp_path / 'cache')
+    cache.put(1, 'a', {'v': 1})
+    cache.put(2, 'b', {'v': 2})
+    cache.invalidate_model(1)
+    assert cache.get(1, 'a') is None
+    assert cache.get(2, 'b') == {'v': 2}
+    assert cache.stats()['memory_mb'] == round(len(json.dumps({'v': 2})) / (1024 * 1024), 2)
+
+
+def test_disabled_cache_is_a_no_op(tmp_path):
+    cache = ResultCache(enabled=False, disk_dir=tmp_path / 'cache')
+    cache.put(1, 'a', {'v': 1})
+    assert cache.get(1, 'a') is None
+    assert cache.stats()['entries'] == 0
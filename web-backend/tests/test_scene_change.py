@@ -0,0 +1,52 @@
+import numpy as np
+
+from utils.scene_change import SceneChangeDetector
+
+
+def _frame(value=100):
+    frame = np.full((240, 320, 3), value, dtype=np.uint8)
+    frame[60:120, 80:160] = 200
+    return frame
+
+
+def test_identical_frames_are_static():
+    detector = SceneChangeDetector(threshold=0.01, pixel_delta=20, size=64, max_skip=50)
+    assert detector.is_static(_frame()) is False  # 第一帧成为参考帧
+    assert detector.is_static(_frame()) is True
+    assert detector.stats()['skipped'] == 1
+    assert detector.stats()['last_change'] == 0
+
+
+def test_small_noise_is_ignored_but_moving_object_is_not():
+    detector = SceneChangeDetector(threshold=0.01, pixel_delta=20, size=64, max_skip=50)
+    detector.is_static(_frame())
+    rng = np.random.default_rng(0)
+    noisy = np.clip(_frame().astype(np.int16) + rng.integers(-5, 6, (240, 320, 3)), 0, 255).astype(np.uint8)
+    assert detector.is_static(noisy) is True
+
+    moved = np.full((240, 320, 3), 100, dtype=np.uint8)
+    moved[120:180, 200:280] = 200
+    assert detector.is_static(moved) is False
+
+
+def test_changes_accumulate_against_the_reference_frame():
+    detector = SceneChangeDetector(threshold=0.01, pixel_delta=20, size=64, max_skip=50)
+    detector.is_static(_frame(100))
+    # 每帧变化都低于像素阈值，但相对参考帧的累计变化超过阈值
+    results = [detector.is_static(_frame(100 + 8 * step)) for step in range(1, 5)]
+    assert results[:2] == [True, True]
+    assert False in results
+
+
+def test_forced_inference_after_max_skip():
+    detector = SceneChangeDetector(threshold=0.01, pixel_delta=20, size=64, max_skip=2)
+    results = [detector.is_static(_frame()) for _ in range(5)]
+    assert results == [False, True, True, False, True]
+
+
+def test_reset_and_resolution_change_force_inference():
+    detector = SceneChangeDetector(threshold=0.01, pixel_delta=20, size=64, max_skip=50)
+    detector.is_static(_frame())
+    detector.reset()
+    assert detector.is_static(_frame()) is False
+    assert detector.is_static(np.full((480, 320, 3), 100, dtype=np.uint8)) is False
@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils.tracker import IoUTracker, iou_matrix
+
+
+def _det(bbox, cls='with_helmet', conf=0.9):
+    return {'class': cls, 'confidence': conf, 'bbox': list(bbox)}
+
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10], [20, 20, 30, 30]], [[0, 0, 10, 10], [5, 0, 15, 10]])
+    np.testing.assert_allclose(ious, [[1.0, 50 / 150], [0.0, 0.0]], rtol=1e-6)
+    assert iou_matrix([], [[0, 0, 1, 1]]).shape == (0, 1)
+
+
+def test_ids_persist_across_frames_and_new_objects_get_new_ids():
+    tracker = IoUTracker(iou_threshold=0.3, max_age=30, min_hits=2, max_misses=1)
+    first = tracker.update([_det([0, 0, 10, 10]), _det([50, 50, 60, 60])], 0)
+    second = tracker.update([_det([51, 51, 61, 61]), _det([1, 0, 11, 10]), _det([100, 100, 110, 110])], 5)
+    assert [d['track_id'] for d in first] == [1, 2]
+    assert [d['track_id'] for d in second] == [2, 1, 3]
+
+
+def test_predict_extrapolates_velocity_for_confirmed_tracks():
+    tracker = IoUTracker(iou_threshold=0.3, max_age=30, min_hits=2, max_misses=1, alpha=1.0, beta=1.0)
+    tracker.update([_det([0, 0, 10, 10])], 0)
+    assert tracker.predict(1) == []  # 只匹配一次，未确认
+    tracker.update([_det([2, 0, 12, 10])], 1)
+    predictions = tracker.predict(2)
+    assert len(predictions) == 1
+    np.testing.assert_allclose(predictions[0]['bbox'], [4, 0, 14, 10])
+    assert predictions[0]['track_id'] == 1
+
+
+def test_predict_drops_tracks_that_stopped_matching():
+    tracker = IoUTracker(iou_threshold=0.3, max_age=30, min_hits=2, max_misses=1)
+    tracker.update([_det([0, 0, 10, 10])], 0)
+    tracker.update([_det([0, 0, 10, 10])], 5)
+    tracker.update([], 10)
+    assert len(tracker.predict(12)) == 1
+    tracker.update([], 15)
+    assert tracker.predict(17) == []
+    # 仍在 max_age 内，重新出现时沿用原轨迹ID
+    assert tracker.update([_det([0, 0, 10, 10])], 20)[0]['track_id'] == 1
+
+
+def test_expired_tracks_are_counted_once_by_majority_class():
+    tracker = IoUTracker(iou_threshold=0.3, max_age=5, min_hits=2, max_misses=1)
+    tracker.update([_det([0, 0, 10, 10], 'without_helmet'), _det([50, 50, 60, 60])], 0)
+    tracker.update([_det([0, 0, 10, 10], 'with_helmet'), _det([50, 50, 60, 60])], 1)
+    tracker.update([_det([0, 0, 10, 10], 'without_helmet')], 2)
+    tracker.update([_det([200, 200, 210, 210])], 20)  # 前两条轨迹过期，新轨迹只匹配一次
+    assert len(tracker.finished_tracks) == 2
+    assert tracker.summary() == {'unique_people': 2, 'unique_with_helmet': 1, 'unique_without_helmet': 1}
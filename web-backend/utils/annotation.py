@@ -0,0 +1,134 @@
+"""
+检测结果标注：直接在 BGR 帧上绘制检测框，不做颜色空间转换；标签文字预先栅格化为掩码并缓存
+（按类别 + 置信度分桶，轨迹ID由逐字符的掩码拼接），绘制时只按掩码填充颜色；用 cv2.imencode 编码 JPEG（质量可配置）
+"""
+from collections import OrderedDict
+from config import Config
+import base64
+import threading
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+THICKNESS = 2
+LABEL_OFFSET = 10  # 标签基线在检测框上边缘之上的距离（像素）
+SPRITE_PADDING = THICKNESS  # 粗笔画会超出文字尺寸，画布四周留白
+CONFIDENCE_BUCKETS = 100  # 置信度按 0.01 分桶（标签显示两位小数）
+# BGR颜色：佩戴安全帽为绿色，未佩戴为红色
+CLASS_COLORS = {'with_helmet': (0, 255, 0)}
+DEFAULT_COLOR = (0, 0, 255)
+
+
+class LabelSpriteCache:
+    """
+    标签文字掩码的 LRU 缓存：类别标签按 (类别, 置信度分桶) 缓存，轨迹ID按单个字符缓存后拼接，
+    缓存的键空间有界（类别数 × 101 + 字符数），视频中同一画面的标签重复命中
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or Config.ANNOTATION_SPRITE_CACHE_SIZE
+        self._sprites = OrderedDict()  # 键 -> (掩码, 基线以上的文字高度, 字符宽度)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def label(self, class_name, confidence):
+        """类别 + 两位小数置信度的标签掩码"""
+        bucket = min(max(int(round(confidence * CONFIDENCE_BUCKETS)), 0), CONFIDENCE_BUCKETS)
+        return self._get(('label', class_name, bucket), f'{class_name} {bucket / CONFIDENCE_BUCKETS:.2f}')
+
+    def glyph(self, char):
+        """单个字符的掩码（用于拼接轨迹ID）"""
+        return self._get(('glyph', char), char)
+
+    def _get(self, key, text):
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+        sprite = self._render(text)
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self.max_entries:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    @staticmethod
+    def _render(text):
+        """把文字画在单通道画布上，返回 (布尔掩码, 基线以上的文字高度, 文字宽度)"""
+        (width, height), baseline = cv2.getTextSize(text, FONT, FONT_SCALE, THICKNESS)
+        canvas = np.zeros((height + baseline + 2 * SPRITE_PADDING, width + 2 * SPRITE_PADDING), dtype=np.uint8)
+        cv2.putText(canvas, text, (SPRITE_PADDING, height + SPRITE_PADDING), FONT, FONT_SCALE, 255, THICKNESS)
+        return canvas > 0, height, width
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._sprites), 'hits': self.hits, 'misses': self.misses}
+
+
+def _paste(frame, mask, x, y, color):
+    """按掩码把颜色填充到帧上左上角为 (x, y) 的区域，超出画面的部分裁掉"""
+    height, width = mask.shape
+    frame_height, frame_width = frame.shape[:2]
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + width, frame_width), min(y + height, frame_height)
+    if left >= right or top >= bottom:
+        return
+    region = frame[top:bottom, left:right]
+    region[mask[top - y:bottom - y, left - x:right - x]] = color
+
+
+def render_detections(frame, detections):
+    """在 BGR 帧上原地绘制检测框和标签（标签在检测框左上角之上）"""
+    for det in detections:
+        x1, y1, x2, y2 = map(int, det['bbox'])
+        color = CLASS_COLORS.get(det['class'], DEFAULT_COLOR)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, THICKNESS)
+        x = x1
+        if 'track_id' in det:
+            # 轨迹ID（#ID）逐字符拼接在类别标签之前
+            for char in f"#{det['track_id']} ":
+                mask, height, width = label_sprites.glyph(char)
+                _paste(frame, mask, x - SPRITE_PADDING, y1 - LABEL_OFFSET - height - SPRITE_PADDING, color)
+                x += width
+        mask, height, _ = label_sprites.label(det['class'], det['confidence'])
+        _paste(frame, mask, x - SPRITE_PADDING, y1 - LABEL_OFFSET - height - SPRITE_PADDING, color)
+    return frame
+
+
+def downscale(frame, max_size):
+    """把帧缩小到长边不超过 max_size 像素（预览图），返回 (帧, 缩放比例)；不需要缩小时返回原帧"""
+    height, width = frame.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return frame, 1.0
+    scale = max_size / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+
+def scale_detections(detections, scale):
+    """按缩放比例换算检测框坐标（用于在预览图上绘制，不修改原检测结果）"""
+    if scale == 1.0:
+        return detections
+    return [dict(det, bbox=[v * scale for v in det['bbox']]) for det in detections]
+
+
+def encode_jpeg(frame, quality=None):
+    """把 BGR 帧编码为 JPEG 字节（OpenCV 直接按 BGR 编码，不需要转换为 RGB）"""
+    quality = quality or Config.ANNOTATION_JPEG_QUALITY
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError('JPEG 编码失败')
+    return buffer.tobytes()
+
+
+def encode_base64_jpeg(frame, quality=None):
+    return base64.b64encode(encode_jpeg(frame, quality)).decode()
+
+
+# 进程级单例
+label_sprites = LabelSpriteCache()
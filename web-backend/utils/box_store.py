@@ -0,0 +1,180 @@
+"""
+检测框存储：按天追加写入定长二进制记录（numpy 结构化数组，float32 坐标），用于离线分析，不需要重新推理
+"""
+from datetime import datetime
+from pathlib import Path
+from config import Config
+from utils.detection import CLASS_IDS, CLASS_NAMES
+import json
+import numpy as np
+import threading
+import time
+
+# 每条记录一个检测框，小端定长 50 字节
+BOX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),  # UNIX 时间戳（秒）
+    ('model_id', '<i4'),
+    ('user_id', '<i4'),  # 0 表示未知
+    ('source', 'u1'),  # 见 SOURCE_CODES
+    ('class_id', 'u1'),  # 见 CLASS_IDS，255 表示未知类别
+    ('frame', '<i4'),  # 视频帧序号，图片为 0
+    ('track_id', '<i4'),  # 视频跟踪ID，-1 表示无
+    ('width', '<u2'),  # 原图尺寸
+    ('height', '<u2'),
+    ('confidence', '<f4'),
+    ('bbox', '<f4', (4,))  # x1, y1, x2, y2（像素）
+])
+SOURCE_CODES = {'image': 0, 'video': 1, 'realtime': 2}
+SOURCE_NAMES = {code: name for name, code in SOURCE_CODES.items()}
+CSV_HEADER = 'timestamp,model_id,user_id,type,class,frame,track_id,width,height,confidence,x1,y1,x2,y2\n'
+
+
+class BoxStore:
+    """按天分文件（uploads/boxes/YYYYMMDD.bin）追加写入检测框"""
+
+    def __init__(self, root=None, enabled=None):
+        self.root = Path(root or Config.UPLOAD_FOLDER / 'boxes')
+        self.enabled = Config.BOX_STORAGE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+
+    def _day_path(self, day):
+        return self.root / f"{day.strftime('%Y%m%d')}.bin"
+
+    def append(self, detections, model_id=None, user_id=None, source='image', frame=0, image_size=None,
+               timestamp=None):
+        """追加一帧/一张图片的检测框，未开启存储或没有检测框时不写入"""
+        if not self.enabled or not detections:
+            return 0
+        timestamp = timestamp or time.time()
+        records = np.zeros(len(detections), dtype=BOX_DTYPE)
+        records['timestamp'] = timestamp
+        records['model_id'] = model_id or 0
+        records['user_id'] = user_id or 0
+        records['source'] = SOURCE_CODES.get(source, 255)
+        records['frame'] = frame
+        records['track_id'] = [d.get('track_id', -1) for d in detections]
+        if image_size is not None:
+            records['width'], records['height'] = image_size
+        records['class_id'] = [CLASS_IDS.get(d.get('class'), 255) for d in detections]
+        records['confidence'] = [d['confidence'] for d in detections]
+        records['bbox'] = [d['bbox'] for d in detections]
+
+        # 同一进程内串行追加；按UTC日期分文件，与统计接口的时间一致
+        path = self._day_path(datetime.utcfromtimestamp(timestamp))
+        with self._lock:
+            with open(path, 'ab') as f:
+                f.write(records.tobytes())
+        return len(records)
+
+    def video_callback(self, model_id=None, user_id=None):
+        """视频检测中每个检测帧的检测框保存回调，未开启存储时返回 None"""
+        if not self.enabled:
+            return None
+        def on_detections(frame_index, detections, image_size):
+            self.append(detections, model_id=model_id, user_id=user_id, source='video',
+                        frame=frame_index, image_size=image_size)
+        return on_detections
+
+    def days(self, start=None, end=None):
+        """返回日期范围内存在的数据文件（按日期排序），start/end 为 date，包含两端"""
+        files = []
+        for path in sorted(self.root.glob('*.bin')):
+            try:
+                day = datetime.strptime(path.stem, '%Y%m%d').date()
+            except ValueError:
+                continue
+            if (start is None or day >= start) and (end is None or day <= end):
+                files.append((day, path))
+        return files
+
+    def iter_chunks(self, start=None, end=None, chunk_size=None, model_id=None, user_id=None, source=None,
+                    class_id=None):
+        """按块读取检测框记录并过滤，内存占用只与块大小有关"""
+        chunk_size = chunk_size or Config.BOX_EXPORT_CHUNK_SIZE
+        for day, path in self.days(start, end):
+            # 正在追加的文件末尾可能有不完整的记录，只读取完整的部分
+            count = path.stat().st_size // BOX_DTYPE.itemsize
+            with open(path, 'rb') as f:
+                for offset in range(0, count, chunk_size):
+                    records = np.fromfile(f, dtype=BOX_DTYPE, count=min(chunk_size, count - offset))
+                    mask = np.ones(len(records), dtype=bool)
+                    if model_id is not None:
+                        mask &= records['model_id'] == model_id
+                    if user_id is not None:
+                        mask &= records['user_id'] == user_id
+                    if source is not None:
+                        mask &= records['source'] == source
+                    if class_id is not None:
+                        mask &= records['class_id'] == class_id
+                    if mask.any():
+                        yield records if mask.all() else records[mask]
+
+    def stats(self):
+        files = self.days()
+        sizes = [path.stat().st_size for _, path in files]
+        return {
+            'enabled': self.enabled,
+            'record_size': BOX_DTYPE.itemsize,
+            'days': len(files),
+            'records': sum(sizes) // BOX_DTYPE.itemsize,
+            'bytes': sum(sizes),
+            'first_day': files[0][0].isoformat() if files else None,
+            'last_day': files[-1][0].isoformat() if files else None
+        }
+
+
+def dtype_description():
+    """结构化记录格式说明（字段名、numpy 类型、形状），用于二进制导出"""
+    return [
+        {'name': name, 'type': BOX_DTYPE.fields[name][0].base.str,
+         'shape': list(BOX_DTYPE.fields[name][0].shape), 'offset': BOX_DTYPE.fields[name][1]}
+        for name in BOX_DTYPE.names
+    ]
+
+
+def record_rows(records):
+    """把结构化记录转换为导出用的字典（未知的用户/模型/轨迹为 None，坐标保留一位小数）"""
+    for r in records:
+        yield {
+            'timestamp': float(r['timestamp']),
+            'model_id': int(r['model_id']) or None,
+            'user_id': int(r['user_id']) or None,
+            'type': SOURCE_NAMES.get(int(r['source']), 'unknown'),
+            'class': CLASS_NAMES.get(int(r['class_id']), 'unknown'),
+            'frame': int(r['frame']),
+            'track_id': int(r['track_id']) if r['track_id'] >= 0 else None,
+            'width': int(r['width']),
+            'height': int(r['height']),
+            'confidence': round(float(r['confidence']), 4),
+            'bbox': [round(float(v), 1) for v in r['bbox']]
+        }
+
+
+def export_binary(chunks):
+    """原始定长记录，客户端可用 numpy.frombuffer(data, dtype=...) 按 dtype_description() 解析"""
+    for records in chunks:
+        yield records.tobytes()
+
+
+def export_csv(chunks):
+    """CSV（首行为表头），每块记录生成一段文本"""
+    yield CSV_HEADER
+    for records in chunks:
+        lines = []
+        for row in record_rows(records):
+            bbox = row.pop('bbox')
+            values = ['' if v is None else str(v) for v in row.values()] + [str(v) for v in bbox]
+            lines.append(','.join(values))
+        yield '\n'.join(lines) + '\n'
+
+
+def export_ndjson(chunks):
+    """每行一个检测框的 JSON"""
+    for records in chunks:
+        yield ''.join(json.dumps(row) + '\n' for row in record_rows(records))
+
+
+# 进程级单例
+box_store = BoxStore()
@@ -0,0 +1,281 @@
+"""
+数据集索引：上传后并行扫描一次（图片尺寸、标签、检测框），保存为数据集目录下的 index.npz（逐图片/逐检测框数组）
+和 index.json（统计摘要），数据集页面和训练前检查读取索引，不再遍历文件系统
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from config import Config
+from PIL import Image
+import json
+import os
+import threading
+import time
+import numpy as np
+
+INDEX_VERSION = 1
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+SPLITS = {'train': 'train', 'valid': 'val', 'test': 'test'}  # 目录名 -> 统计中的名称
+SPLIT_CODES = {name: i for i, name in enumerate(SPLITS.values())}
+# 标签文件状态
+LABEL_OK, LABEL_MISSING, LABEL_EMPTY, LABEL_INVALID = 0, 1, 2, 3
+# 检测框大小（像素面积，与 COCO 的 small/medium/large 划分一致）
+BOX_AREA_SMALL = 32 ** 2
+BOX_AREA_MEDIUM = 96 ** 2
+# 检测框相对大小 sqrt(w*h)（归一化）的直方图区间
+BOX_SCALE_BINS = np.linspace(0, 1, 11)
+
+
+def index_paths(dataset_dir):
+    dataset_dir = Path(dataset_dir)
+    return dataset_dir / 'index.npz', dataset_dir / 'index.json'
+
+
+def _list_images(images_dir):
+    """递归列出目录中的图片（os.scandir，不为每个文件创建 Path）"""
+    images = []
+    stack = [str(images_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    images.append(entry.path)
+    images.sort()
+    return images
+
+
+def _scan_image(image_path, images_dir, labels_dir):
+    """读取图片尺寸（只解析文件头）和对应的 YOLO 标签文件"""
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+    except Exception:
+        width, height = 0, 0
+
+    relative = os.path.relpath(image_path, images_dir)
+    label_path = os.path.join(labels_dir, os.path.splitext(relative)[0] + '.txt')
+    boxes = []
+    try:
+        with open(label_path, 'r') as f:
+            lines = [line.split() for line in f if line.strip()]
+    except FileNotFoundError:
+        return width, height, LABEL_MISSING, boxes
+    except (OSError, UnicodeDecodeError):
+        return width, height, LABEL_INVALID, boxes
+    if not lines:
+        return width, height, LABEL_EMPTY, boxes
+
+    status = LABEL_OK
+    for parts in lines:
+        try:
+            # class x_center y_center width height（分割标签为多边形，按外接框计算）
+            class_id = int(parts[0])
+            coords = [float(v) for v in parts[1:]]
+            if len(coords) == 4:
+                box_w, box_h = coords[2], coords[3]
+            elif len(coords) >= 6 and len(coords) % 2 == 0:
+                box_w = max(coords[0::2]) - min(coords[0::2])
+                box_h = max(coords[1::2]) - min(coords[1::2])
+            else:
+                raise ValueError
+        except (ValueError, IndexError):
+            status = LABEL_INVALID
+            continue
+        boxes.append((class_id, box_w, box_h))
+    return width, height, status, boxes
+
+
+def build_dataset_index(dataset_dir, workers=None):
+    """并行扫描数据集的 train/valid/test 目录，写入 index.npz 和 index.json，返回统计摘要"""
+    start = time.perf_counter()
+    dataset_dir = Path(dataset_dir)
+    workers = workers or Config.DATASET_INDEX_WORKERS or min(32, (os.cpu_count() or 1) + 4)
+
+    tasks = []  # (划分, 图片路径, images目录, labels目录)
+    for dir_name, split in SPLITS.items():
+        images_dir = dataset_dir / dir_name / 'images'
+        if images_dir.is_dir():
+            labels_dir = dataset_dir / dir_name / 'labels'
+            tasks.extend((split, path, str(images_dir), str(labels_dir)) for path in _list_images(images_dir))
+
+    # 图片解码头部和读取标签文件以 I/O 为主，线程池并行
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda task: _scan_image(*task[1:]), tasks))
+
+    count = len(tasks)
+    paths = np.array([os.path.relpath(task[1], dataset_dir) for task in tasks], dtype=str)
+    split = np.array([SPLIT_CODES[task[0]] for task in tasks], dtype=np.uint8)
+    width = np.array([r[0] for r in results], dtype=np.int32)
+    height = np.array([r[1] for r in results], dtype=np.int32)
+    label_status = np.array([r[2] for r in results], dtype=np.uint8)
+    box_count = np.array([len(r[3]) for r in results], dtype=np.int32)
+    box_image = np.repeat(np.arange(count, dtype=np.int32), box_count)
+    box_data = np.array([box for r in results for box in r[3]], dtype=np.float32).reshape(-1, 3)
+    box_class = box_data[:, 0].astype(np.int32)
+    box_wh = box_data[:, 1:3]
+
+    npz_path, json_path = index_paths(dataset_dir)
+    tmp_npz = npz_path.with_name('index.tmp.npz')
+    np.savez_compressed(tmp_npz, paths=paths, split=split, width=width, height=height,
+                        label_status=label_status, box_count=box_count,
+                        box_image=box_image, box_class=box_class, box_wh=box_wh)
+    os.replace(tmp_npz, npz_path)
+
+    summary = _summarize(split, width, height, label_status, box_count, box_image, box_class, box_wh)
+    summary['version'] = INDEX_VERSION
+    summary['built_at'] = datetime.utcnow().isoformat()
+    summary['build_seconds'] = round(time.perf_counter() - start, 3)
+    tmp_json = json_path.with_name('index.tmp.json')
+    with open(tmp_json, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp_json, json_path)
+    print(f"Dataset index built for {dataset_dir}: {count} images, {len(box_class)} boxes "
+          f"in {summary['build_seconds']}s ({workers} workers)")
+    return summary
+
+
+def _summarize(split, width, height, label_status, box_count, box_image, box_class, box_wh):
+    """由索引数组计算统计摘要（按划分的图片/标签数量、类别分布、检测框大小分布）"""
+    splits = {}
+    for name, code in SPLIT_CODES.items():
+        mask = split == code
+        status = label_status[mask]
+        splits[name] = {
+            'images': int(mask.sum()),
+            'labeled': int((status == LABEL_OK).sum()),
+            'boxes': int(box_count[mask].sum()),
+            'missing_labels': int((status == LABEL_MISSING).sum()),
+            'empty_labels': int((status == LABEL_EMPTY).sum()),
+            'invalid_labels': int((status == LABEL_INVALID).sum())
+        }
+
+    classes = {}
+    if len(box_class):
+        valid = box_class >= 0
+        class_ids = box_class[valid]
+        boxes_per_class = np.bincount(class_ids)
+        # 每个类别出现在多少张图片中（同一图片的同类检测框只计一次）
+        pairs = np.unique(np.stack([box_image[valid], class_ids], axis=1), axis=0)
+        images_per_class = np.bincount(pairs[:, 1], minlength=len(boxes_per_class))
+        classes = {
+            str(class_id): {'boxes': int(boxes_per_class[class_id]), 'images': int(images_per_class[class_id])}
+            for class_id in np.nonzero(boxes_per_class)[0]
+        }
+
+    # 检测框像素面积（图片尺寸未知的按 0 处理，不计入大小分布）
+    image_w = width[box_image].astype(np.float64)
+    image_h = height[box_image].astype(np.float64)
+    area = box_wh[:, 0] * image_w * box_wh[:, 1] * image_h
+    known = (image_w > 0) & (image_h > 0)
+    scale = np.sqrt(np.clip(box_wh[:, 0] * box_wh[:, 1], 0, 1))
+    scale_counts, _ = np.histogram(scale, bins=BOX_SCALE_BINS)
+
+    readable = width > 0
+    return {
+        'image_count': int(len(split)),
+        'box_count': int(len(box_class)),
+        'splits': splits,
+        'classes': classes,
+        'max_class_id': int(box_class.max()) if len(box_class) else None,
+        'unreadable_images': int((~readable).sum()),
+        'image_size': {
+            'min_width': int(width[readable].min()) if readable.any() else 0,
+            'max_width': int(width[readable].max()) if readable.any() else 0,
+            'min_height': int(height[readable].min()) if readable.any() else 0,
+            'max_height': int(height[readable].max()) if readable.any() else 0
+        },
+        'box_size': {
+            'small': int((known & (area < BOX_AREA_SMALL)).sum()),
+            'medium': int((known & (area >= BOX_AREA_SMALL) & (area < BOX_AREA_MEDIUM)).sum()),
+            'large': int((known & (area >= BOX_AREA_MEDIUM)).sum())
+        },
+        'box_scale_histogram': {
+            'edges': [round(float(edge), 2) for edge in BOX_SCALE_BINS],
+            'counts': [int(c) for c in scale_counts]
+        }
+    }
+
+
+class DatasetIndexCache:
+    """按数据集缓存索引摘要，index.json 被重建（修改时间变化）后重新读取"""
+
+    def __init__(self):
+        self._entries = {}  # dataset_dir -> (mtime, 摘要)
+        self._lock = threading.Lock()
+
+    def load(self, dataset_dir):
+        """读取索引摘要，索引不存在或版本不兼容时返回 None"""
+        _, json_path = index_paths(dataset_dir)
+        key = str(dataset_dir)
+        try:
+            mtime = json_path.stat().st_mtime
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                return entry[1]
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if summary.get('version') != INDEX_VERSION:
+            return None
+        with self._lock:
+            self._entries[key] = (mtime, summary)
+        return summary
+
+    def get_or_build(self, dataset_dir):
+        """读取索引摘要，没有索引（本功能之前上传的数据集）时扫描一次"""
+        summary = self.load(dataset_dir)
+        if summary is None and Path(dataset_dir).is_dir():
+            build_dataset_index(dataset_dir)
+            summary = self.load(dataset_dir)
+        return summary
+
+    def invalidate(self, dataset_dir):
+        with self._lock:
+            self._entries.pop(str(dataset_dir), None)
+
+
+def load_index_arrays(dataset_dir):
+    """读取逐图片/逐检测框的索引数组，没有索引时返回 None"""
+    npz_path, _ = index_paths(dataset_dir)
+    if not npz_path.exists():
+        return None
+    with np.load(npz_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def training_preflight(summary, nc=None):
+    """训练前检查：返回 (错误, 警告)，错误会导致训练失败或没有意义"""
+    errors = []
+    warnings = []
+    train = summary['splits'].get('train', {})
+    val = summary['splits'].get('val', {})
+    if not train.get('images'):
+        errors.append('训练集没有图片')
+    elif not train.get('labeled'):
+        errors.append('训练集没有有效的标签文件')
+    if not val.get('images'):
+        errors.append('验证集没有图片')
+    max_class_id = summary.get('max_class_id')
+    if nc is not None and max_class_id is not None and max_class_id >= nc:
+        errors.append(f'标签中的类别ID（最大 {max_class_id}）超出 data.yaml 中的类别数 nc={nc}')
+    for name, stats in summary['splits'].items():
+        if stats.get('missing_labels'):
+            warnings.append(f'{name} 有 {stats["missing_labels"]} 张图片缺少标签文件（按背景图片处理）')
+        if stats.get('invalid_labels'):
+            warnings.append(f'{name} 有 {stats["invalid_labels"]} 个标签文件格式错误')
+    if summary.get('unreadable_images'):
+        warnings.append(f'{summary["unreadable_images"]} 张图片无法读取')
+    return errors, warnings
+
+
+# 进程级单例
+dataset_index_cache = DatasetIndexCache()
@@ -0,0 +1,341 @@
+"""
+数据集ZIP导入：上传的数据只写入磁盘一次（写入时计算SHA-256），读取ZIP中央目录先检查目录结构，
+再把每个文件直接解压到数据集目录中的最终位置（同时计算SHA-256），不再经过 extracted/ 中转；
+可选删除ZIP，支持后台任务和进度查询
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from config import Config
+from extensions import db
+from models import Dataset, DatasetIngestJob
+from utils.dataset_index import build_dataset_index, dataset_index_cache
+import hashlib
+import json
+import shutil
+import threading
+import time
+import zipfile
+
+# 打包工具生成的系统文件，不解压
+SKIP_DIRS = {'__MACOSX'}
+SKIP_NAMES = {'.DS_Store', 'Thumbs.db'}
+REQUIRED_DIRS = {
+    'train/images': '训练图片目录',
+    'train/labels': '训练标签目录',
+    'valid/images': '验证图片目录',
+    'valid/labels': '验证标签目录'
+}
+# 导入失败的类型（保存在任务结果的 error_kind 中），上传接口据此返回 400 / 404 / 500
+ERROR_BAD_ARCHIVE = 'bad_archive'  # ZIP文件格式错误或已损坏
+ERROR_INVALID_STRUCTURE = 'invalid_structure'  # 目录结构不符合要求
+ERROR_DATASET_NOT_FOUND = 'dataset_not_found'
+ERROR_ARCHIVE_MISSING = 'archive_missing'  # 重启恢复时上传的ZIP已不存在
+ERROR_INTERNAL = 'internal'
+CLIENT_ERRORS = {ERROR_BAD_ARCHIVE, ERROR_INVALID_STRUCTURE}
+OPTIONAL_DIRS = {
+    'test/images': '测试图片目录',
+    'test/labels': '测试标签目录'
+}
+
+
+def save_upload(stream, path, chunk_size=None):
+    """把上传流按块写入文件，同时计算大小和SHA-256，返回 (大小, sha256)"""
+    chunk_size = chunk_size or Config.DATASET_INGEST_CHUNK_SIZE
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def plan_members(zip_ref):
+    """
+    根据ZIP中央目录确定每个文件在数据集目录中的相对路径：
+    只有一个顶层目录时去掉该层（与原来解压后移动子目录内容的处理一致），拒绝绝对路径和包含 .. 的路径
+    """
+    members = []
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        path = PurePosixPath(info.filename.replace('\\', '/'))
+        if not path.parts:
+            continue
+        if path.parts[0] in SKIP_DIRS or path.name in SKIP_NAMES:
+            continue
+        if path.is_absolute() or '..' in path.parts or ':' in path.parts[0]:
+            raise ValueError(f'ZIP中包含不安全的路径: {info.filename}')
+        members.append((info, path))
+
+    tops = {path.parts[0] for _, path in members}
+    strip = len(tops) == 1 and all(len(path.parts) > 1 for _, path in members)
+    return [(info, PurePosixPath(*path.parts[1:]) if strip else path) for info, path in members]
+
+
+def check_structure(plan, dataset_dir):
+    """
+    根据ZIP中的文件路径检查数据集目录结构（不需要先解压），返回 (错误, 警告)；
+    ZIP中没有的顶层目录沿用数据集目录中已有的（与原来合并到数据集目录的处理一致）
+    """
+    errors = []
+    warnings = []
+    dirs = set()
+    for _, path in plan:
+        dirs.update(str(parent) for parent in path.parents if str(parent) != '.')
+    tops = {path.parts[0] for _, path in plan}
+
+    def present(dir_path):
+        if dir_path in dirs:
+            return True
+        return dir_path.split('/')[0] not in tops and (dataset_dir / dir_path).is_dir()
+
+    # 检查data.yaml（可选，但推荐）
+    if 'data.yaml' not in tops and not (dataset_dir / 'data.yaml').exists():
+        warnings.append('未找到data.yaml配置文件（可选）')
+    for dir_path, desc in REQUIRED_DIRS.items():
+        if not present(dir_path):
+            errors.append(f'缺少必需目录: {dir_path} ({desc})')
+    for dir_path, desc in OPTIONAL_DIRS.items():
+        if not present(dir_path):
+            warnings.append(f'缺少可选目录: {dir_path} ({desc})')
+    return errors, warnings
+
+
+def inspect_archive(archive_path, dataset_dir):
+    """读取ZIP中央目录并检查结构，返回 (导入计划, 错误, 警告)；ZIP损坏时抛出 zipfile.BadZipFile"""
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        plan = plan_members(zip_ref)
+    errors, warnings = check_structure(plan, dataset_dir)
+    return plan, errors, warnings
+
+
+def extract_members(zip_ref, plan, dataset_dir, skip_path=None, on_progress=None, chunk_size=None):
+    """把文件直接解压到最终位置并计算SHA-256（读取时 zipfile 会校验CRC），返回 {相对路径: {size, sha256}}"""
+    chunk_size = chunk_size or Config.DATASET_INGEST_CHUNK_SIZE
+    # ZIP中包含的顶层目录/文件替换数据集目录中已有的
+    for top in {path.parts[0] for _, path in plan}:
+        dest = dataset_dir / top
+        if skip_path is not None and dest == skip_path:
+            continue
+        if dest.is_dir():
+            shutil.rmtree(dest)
+        elif dest.exists():
+            dest.unlink()
+
+    manifest = {}
+    bytes_done = 0
+    for files_done, (info, path) in enumerate(plan, start=1):
+        target = dataset_dir.joinpath(*path.parts)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with zip_ref.open(info) as src, open(target, 'wb') as dst:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+        bytes_done += info.file_size
+        manifest[str(path)] = {'size': info.file_size, 'sha256': digest.hexdigest()}
+        if on_progress is not None:
+            on_progress(files_done, bytes_done)
+    return manifest
+
+
+class DatasetIngestManager:
+    """数据集导入任务：后台线程池执行，重启后重新导入未完成的任务"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Config.DATASET_INGEST_WORKERS
+        self._executor = None
+        self._app = None
+        self._lock = threading.Lock()
+        self._resumed = False
+
+    def init_app(self, app):
+        self._app = app
+
+        @app.before_request
+        def resume_dataset_ingest_jobs():
+            # 在实际处理请求的进程中恢复任务（避免调试模式下 reloader 父进程重复执行）
+            if not self._resumed:
+                self.resume_unfinished()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dataset-ingest')
+            return self._executor
+
+    def active_job(self, dataset_id):
+        return DatasetIngestJob.query.filter(
+            DatasetIngestJob.dataset_id == dataset_id,
+            DatasetIngestJob.status.in_(['queued', 'running'])
+        ).first()
+
+    def submit(self, job_id):
+        self._get_executor().submit(self.run, job_id)
+
+    def resume_unfinished(self):
+        """重启后重新提交未完成的任务（已解压的文件会被覆盖）"""
+        with self._lock:
+            if self._resumed:
+                return
+            self._resumed = True
+        jobs = DatasetIngestJob.query.filter(DatasetIngestJob.status.in_(['queued', 'running'])).order_by(DatasetIngestJob.id).all()
+        for job in jobs:
+            if not Path(job.archive_path).exists():
+                job.status = 'failed'
+                job.error = '上传的ZIP文件不存在，无法恢复任务'
+                job.set_result({'message': job.error, 'error_kind': ERROR_ARCHIVE_MISSING, 'errors': [], 'warnings': []})
+                job.finished_at = datetime.utcnow()
+                continue
+            job.status = 'queued'
+            job.files_done = 0
+            job.bytes_done = 0
+        db.session.commit()
+        for job in jobs:
+            if job.status == 'queued':
+                print(f"Resuming dataset ingest job {job.id}")
+                self.submit(job.id)
+
+    def run(self, job_id):
+        """执行导入任务（后台线程或上传请求中同步调用）"""
+        with self._app.app_context():
+            try:
+                self._process(job_id)
+            except Exception as e:
+                import traceback
+                print(f"Dataset ingest job {job_id} failed: {str(e)}")
+                print(traceback.format_exc())
+                db.session.rollback()
+                job = DatasetIngestJob.query.get(job_id)
+                if job:
+                    if isinstance(e, zipfile.BadZipFile):
+                        self._fail(job, ERROR_BAD_ARCHIVE, 'ZIP文件格式错误或已损坏')
+                    else:
+                        self._fail(job, ERROR_INTERNAL, f'处理ZIP文件失败: {str(e)}')
+            finally:
+                db.session.remove()
+
+    def _fail(self, job, kind, message, errors=None, warnings=None):
+        job.status = 'failed'
+        job.error = message
+        job.finished_at = datetime.utcnow()
+        job.set_result({'message': message, 'error_kind': kind, 'errors': errors or [], 'warnings': warnings or []})
+        dataset = Dataset.query.get(job.dataset_id)
+        if dataset is not None:
+            dataset.status = 'failed'
+            dataset.error_reason = '；'.join(errors) if errors else message
+        db.session.commit()
+        self._cleanup_archive(job)
+
+    def _process(self, job_id):
+        from routes.datasets import analyze_dataset_structure, update_data_yaml_paths
+
+        job = DatasetIngestJob.query.get(job_id)
+        if not job or job.status != 'queued':
+            return
+        dataset = Dataset.query.get(job.dataset_id)
+        if dataset is None:
+            self._fail(job, ERROR_DATASET_NOT_FOUND, '数据集不存在')
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        job.error = None
+        db.session.commit()
+
+        dataset_dir = Config.UPLOAD_FOLDER / 'datasets' / str(job.dataset_id)
+        archive_path = Path(job.archive_path)
+        plan, errors, warnings = inspect_archive(archive_path, dataset_dir)
+        if errors:
+            self._fail(job, ERROR_INVALID_STRUCTURE, '数据集格式不符合要求', errors, warnings)
+            return
+        job.files_total = len(plan)
+        job.bytes_total = sum(info.file_size for info, _ in plan)
+        db.session.commit()
+
+        last_update = {'time': 0.0}
+
+        def on_progress(files_done, bytes_done):
+            now = time.monotonic()
+            if now - last_update['time'] < Config.DATASET_INGEST_PROGRESS_INTERVAL and files_done < len(plan):
+                return
+            last_update['time'] = now
+            DatasetIngestJob.query.filter_by(id=job_id).update({
+                'files_done': files_done,
+                'bytes_done': bytes_done
+            }, synchronize_session=False)
+            db.session.commit()
+
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            manifest = extract_members(zip_ref, plan, dataset_dir, skip_path=archive_path, on_progress=on_progress)
+        db.session.refresh(job)
+
+        # 文件清单（大小和SHA-256），用于校验数据集文件是否被修改
+        with open(dataset_dir / 'manifest.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'archive': {'name': job.archive_name, 'size': job.archive_size, 'sha256': job.archive_sha256},
+                'files': manifest
+            }, f, ensure_ascii=False)
+
+        # 解压完成后扫描一次生成数据集索引，数量统计和 data.yaml 都读取索引
+        index = build_dataset_index(dataset_dir)
+        dataset_index_cache.invalidate(dataset_dir)
+        train_count, val_count, test_count = analyze_dataset_structure(dataset_dir, index)
+        total_count = train_count + val_count + test_count
+        update_data_yaml_paths(dataset_dir, index)
+
+        dataset.image_count = total_count
+        dataset.file_size = job.archive_size
+        dataset.train_count = train_count
+        dataset.val_count = val_count
+        dataset.test_count = test_count
+        if total_count > 0:
+            dataset.status = 'validated'
+            dataset.error_reason = None  # 验证通过，清除错误原因
+        else:
+            dataset.status = 'failed'
+            dataset.error_reason = '数据集中没有找到图片文件'
+
+        response_message = f'数据集上传成功，共 {total_count} 张图片'
+        if warnings:
+            response_message += f'（警告: {"; ".join(warnings)}）'
+        job.set_result({
+            'message': response_message,
+            'image_count': total_count,
+            'train_count': train_count,
+            'val_count': val_count,
+            'test_count': test_count,
+            'file_size': job.archive_size,
+            'status': dataset.status,
+            'index': index,
+            'warnings': warnings if warnings else []
+        })
+        job.files_done = job.files_total
+        job.bytes_done = job.bytes_total
+        job.status = 'completed'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Dataset ingest job {job_id} completed: {len(plan)} files, {total_count} images")
+        self._cleanup_archive(job)
+
+    def _cleanup_archive(self, job):
+        """导入结束后删除上传的ZIP，或保留为数据集目录中的原始文件名"""
+        archive_path = Path(job.archive_path)
+        if not archive_path.exists():
+            return
+        if job.status == 'completed' and job.keep_archive and job.archive_name:
+            archive_path.replace(archive_path.with_name(job.archive_name))
+        else:
+            archive_path.unlink()
+
+
+# 进程级单例
+dataset_ingest_manager = DatasetIngestManager()
@@ -1,163 +1,240 @@
-from ultralytics import YOLO
-from PIL import Image
 import cv2
 import numpy as np
-import base64
-from io import BytesIO
 from pathlib import Path
 from config import Config
+from utils.video_pipeline import VideoPipeline, PipelineCancelled
+from utils.tracker import IoUTracker
+from utils.scene_change import SceneChangeDetector
+from utils.annotation import render_detections, encode_base64_jpeg, downscale, scale_detections
 import subprocess
 import tempfile
+import threading
 
-class DetectionService:
-    def __init__(self, model_path=None, confidence_threshold=None):
-        if model_path is None:
-            # 不再使用默认模型，必须明确指定模型路径
-            raise ValueError('必须指定模型路径，不能使用默认模型')
-        
-        model_path_str = str(model_path)
+# 类别名称 -> 类别ID（与训练数据的标签一致）
+CLASS_IDS = {'with_helmet': 0, 'without_helmet': 1}
+CLASS_NAMES = {class_id: name for name, class_id in CLASS_IDS.items()}
+
+def load_yolo_model(model_path):
+    """加载YOLO模型权重，处理旧版本权重文件的兼容性问题"""
+    # 按需导入：box_store、统计接口只需要本模块的类别映射，不需要加载 ultralytics/torch
+    from ultralytics import YOLO
+    model_path_str = str(model_path)
+    
+    try:
+        # 导出的后端（ONNX/OpenVINO）不包含任务信息，需要显式指定
+        if Path(model_path_str).suffix != '.pt':
+            return YOLO(model_path_str, task='detect')
+        return YOLO(model_path_str)
+    except Exception as e:
+        error_msg = str(e)
+        import traceback
+        print(f"Model loading error: {error_msg}")
+        print(f"Model path: {model_path_str}")
+        print(traceback.format_exc())
         
-        try:
-            self.model = YOLO(model_path_str)
-        except Exception as e:
-            error_msg = str(e)
-            import traceback
-            print(f"Model loading error: {error_msg}")
-            print(f"Model path: {model_path_str}")
-            print(traceback.format_exc())
-            
-            # 处理常见的模型加载错误
-            if 'OrderedDict' in error_msg or ('attribute' in error_msg.lower() and 'to' in error_msg):
-                # 模型文件可能是旧版本格式或版本不兼容
-                # 尝试使用 torch 直接加载并修复权重文件
-                try:
-                    import torch
-                    print(f"Attempting to fix model file with OrderedDict issue: {model_path_str}")
-                    
-                    # 加载权重文件
-                    ckpt = torch.load(model_path_str, map_location='cpu')
-                    
-                    # 检查权重文件结构并尝试修复
-                    if isinstance(ckpt, dict):
-                        # 如果 'model' 是 OrderedDict，尝试修复
-                        if 'model' in ckpt:
-                            model_obj = ckpt['model']
-                            # 检查是否是 OrderedDict 格式
-                            from collections import OrderedDict
-                            if isinstance(model_obj, OrderedDict) or (hasattr(model_obj, 'keys') and not hasattr(model_obj, 'to')):
-                                print("Detected OrderedDict format in model weights")
-                                # 尝试使用 'ema' 如果存在
-                                if 'ema' in ckpt:
-                                    ema_obj = ckpt['ema']
-                                    if hasattr(ema_obj, 'to'):
-                                        print("Using 'ema' weights instead of 'model'")
-                                        ckpt['model'] = ema_obj
-                                    else:
-                                        print("'ema' is also OrderedDict, cannot fix automatically")
-                                        raise RuntimeError(f'模型文件格式不兼容：权重文件中的模型对象是 OrderedDict 格式，无法自动修复。这通常是因为模型文件与当前 YOLO 版本不兼容。请尝试重新训练模型或使用兼容的模型文件。')
+        # 处理常见的模型加载错误
+        if 'OrderedDict' in error_msg or ('attribute' in error_msg.lower() and 'to' in error_msg):
+            # 模型文件可能是旧版本格式或版本不兼容
+            # 尝试使用 torch 直接加载并修复权重文件
+            try:
+                import torch
+                print(f"Attempting to fix model file with OrderedDict issue: {model_path_str}")
+                
+                # 加载权重文件
+                ckpt = torch.load(model_path_str, map_location='cpu')
+                
+                # 检查权重文件结构并尝试修复
+                if isinstance(ckpt, dict):
+                    # 如果 'model' 是 OrderedDict，尝试修复
+                    if 'model' in ckpt:
+                        model_obj = ckpt['model']
+                        # 检查是否是 OrderedDict 格式
+                        from collections import OrderedDict
+                        if isinstance(model_obj, OrderedDict) or (hasattr(model_obj, 'keys') and not hasattr(model_obj, 'to')):
+                            print("Detected OrderedDict format in model weights")
+                            # 尝试使用 'ema' 如果存在
+                            if 'ema' in ckpt:
+                                ema_obj = ckpt['ema']
+                                if hasattr(ema_obj, 'to'):
+                                    print("Using 'ema' weights instead of 'model'")
+                                    ckpt['model'] = ema_obj
                                 else:
-                                    print("No 'ema' found, cannot fix OrderedDict format")
+                                    print("'ema' is also OrderedDict, cannot fix automatically")
                                     raise RuntimeError(f'模型文件格式不兼容：权重文件中的模型对象是 OrderedDict 格式，无法自动修复。这通常是因为模型文件与当前 YOLO 版本不兼容。请尝试重新训练模型或使用兼容的模型文件。')
+                            else:
+                                print("No 'ema' found, cannot fix OrderedDict format")
+                                raise RuntimeError(f'模型文件格式不兼容：权重文件中的模型对象是 OrderedDict 格式，无法自动修复。这通常是因为模型文件与当前 YOLO 版本不兼容。请尝试重新训练模型或使用兼容的模型文件。')
+                    
+                    # 如果修复成功，保存修复后的权重并重新加载
+                    if 'model' in ckpt and hasattr(ckpt['model'], 'to'):
+                        print("Model weights fixed, saving and reloading...")
+                        # 创建临时文件保存修复后的权重
+                        import tempfile
+                        import shutil
+                        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pt')
+                        temp_path = temp_file.name
+                        temp_file.close()
                         
-                        # 如果修复成功，保存修复后的权重并重新加载
-                        if 'model' in ckpt and hasattr(ckpt['model'], 'to'):
-                            print("Model weights fixed, saving and reloading...")
-                            # 创建临时文件保存修复后的权重
-                            import tempfile
-                            import shutil
-                            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pt')
-                            temp_path = temp_file.name
-                            temp_file.close()
-                            
-                            try:
-                                torch.save(ckpt, temp_path)
-                                # 尝试加载修复后的模型
-                                self.model = YOLO(temp_path)
-                                print("Successfully loaded fixed model")
-                                # 清理临时文件
-                                import os
+                        try:
+                            torch.save(ckpt, temp_path)
+                            # 尝试加载修复后的模型
+                            model = YOLO(temp_path)
+                            print("Successfully loaded fixed model")
+                            # 清理临时文件
+                            import os
+                            os.unlink(temp_path)
+                            return model
+                        except Exception as e3:
+                            # 清理临时文件
+                            import os
+                            if os.path.exists(temp_path):
                                 os.unlink(temp_path)
-                            except Exception as e3:
-                                # 清理临时文件
-                                import os
-                                if os.path.exists(temp_path):
-                                    os.unlink(temp_path)
-                                print(f"Failed to load fixed model: {e3}")
-                                raise RuntimeError(f'模型文件格式不兼容：即使尝试修复后仍无法加载。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
-                        else:
-                            raise RuntimeError(f'模型文件格式不兼容：无法修复权重文件格式。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
+                            print(f"Failed to load fixed model: {e3}")
+                            raise RuntimeError(f'模型文件格式不兼容：即使尝试修复后仍无法加载。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
                     else:
-                        raise RuntimeError(f'模型文件格式不正确：无法识别权重文件格式。错误详情: {error_msg}')
-                except RuntimeError:
-                    # 重新抛出 RuntimeError
-                    raise
-                except Exception as e2:
-                    import traceback
-                    print(f"Model fix attempt failed: {e2}")
-                    print(traceback.format_exc())
-                    raise RuntimeError(f'模型文件格式不兼容或版本不匹配。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
-            else:
-                raise RuntimeError(f'无法加载模型: {error_msg}')
+                        raise RuntimeError(f'模型文件格式不兼容：无法修复权重文件格式。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
+                else:
+                    raise RuntimeError(f'模型文件格式不正确：无法识别权重文件格式。错误详情: {error_msg}')
+            except RuntimeError:
+                # 重新抛出 RuntimeError
+                raise
+            except Exception as e2:
+                import traceback
+                print(f"Model fix attempt failed: {e2}")
+                print(traceback.format_exc())
+                raise RuntimeError(f'模型文件格式不兼容或版本不匹配。请检查模型文件是否正确，或尝试重新导入模型。错误详情: {error_msg}')
+        else:
+            raise RuntimeError(f'无法加载模型: {error_msg}')
+
+def decode_image_bytes(data):
+    """在内存中将上传的图片字节解码为BGR数组，无法解码时返回 None"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def run_inference(model, sources, conf_threshold, iou_threshold=None):
+    """执行YOLO推理，sources 可以是单张图片或图片列表（列表会作为一个批次推理）"""
+    iou_threshold = iou_threshold if iou_threshold is not None else Config.IOU_THRESHOLD
+    try:
+        return model(sources, conf=conf_threshold, iou=iou_threshold, task='detect')
+    except Exception as e:
+        # 如果指定task失败，尝试不指定task
+        print(f"Warning: Failed with task='detect', trying without task: {str(e)}")
+        return model(sources, conf=conf_threshold, iou=iou_threshold)
+
+class DetectionService:
+    def __init__(self, model_path=None, confidence_threshold=None, model=None, inference_lock=None, batcher=None):
+        if model_path is None:
+            # 不再使用默认模型，必须明确指定模型路径
+            raise ValueError('必须指定模型路径，不能使用默认模型')
+        
+        self.model_path = str(model_path)
+        # 允许传入已加载的模型（由模型缓存提供），避免每次请求重新加载权重
+        self.model = model if model is not None else load_yolo_model(self.model_path)
+        # 共享模型时由缓存提供推理锁，保证同一模型对象不会被并发调用
+        self.inference_lock = inference_lock if inference_lock is not None else threading.Lock()
+        # 可选的微批处理器：合并并发的单图请求
+        self.batcher = batcher
         
-        self.class_names = {0: 'with_helmet', 1: 'without_helmet'}
+        self.class_names = CLASS_NAMES
         # 支持动态置信度阈值
         self.confidence_threshold = confidence_threshold if confidence_threshold is not None else Config.CONFIDENCE_THRESHOLD
         # 支持动态检测帧率
         self.detection_fps = 10  # 默认10 FPS
     
-    def detect_image(self, image_path_or_array, confidence=None):
-        """Detect helmets in an image"""
-        # 使用传入的置信度或实例的置信度阈值
-        conf_threshold = confidence if confidence is not None else self.confidence_threshold
-        try:
-            results = self.model(image_path_or_array, conf=conf_threshold, iou=Config.IOU_THRESHOLD, task='detect')
-        except Exception as e:
-            # 如果指定task失败，尝试不指定task
-            print(f"Warning: Failed with task='detect', trying without task: {str(e)}")
-            results = self.model(image_path_or_array, conf=conf_threshold, iou=Config.IOU_THRESHOLD)
-        
-        detections = []
-        with_helmet = 0
-        without_helmet = 0
-        
-        for result in results:
-            if result.boxes is None or len(result.boxes) == 0:
-                continue
-            boxes = result.boxes
-            for box in boxes:
-                if box.cls is None or len(box.cls) == 0:
-                    continue
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                bbox = box.xyxy[0].tolist()
-                
-                class_name = self.class_names.get(cls, 'unknown')
-                detections.append({
-                    'class': class_name,
-                    'confidence': conf,
-                    'bbox': bbox
-                })
-                
-                if class_name == 'with_helmet':
-                    with_helmet += 1
-                elif class_name == 'without_helmet':
-                    without_helmet += 1
+    def _predict(self, sources, conf_threshold):
+        """对一张或一批图片执行一次前向推理，返回与输入一一对应的结果列表"""
+        with self.inference_lock:
+            return run_inference(self.model, sources, conf_threshold)
+    
+    def _extract_boxes(self, result):
+        """
+        一次性把单张图片的检测框转换为 numpy 数组（类别ID、置信度、xyxy坐标），
+        每张图片只做一次张量拷贝，不逐个检测框转换
+        """
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty((0, 4), dtype=np.float32)
+        # Boxes.data 的列为 x1, y1, x2, y2, [track_id,] conf, cls
+        data = boxes.data
+        data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+        return data[:, -1].astype(np.int64), data[:, -2], data[:, :4]
+    
+    def _parse_arrays(self, class_ids, confidences, xyxy):
+        """由检测框数组生成检测结果列表和统计数据（按类别ID bincount 计数）"""
+        counts = np.bincount(class_ids, minlength=len(self.class_names))
+        names = [self.class_names.get(cls, 'unknown') for cls in class_ids.tolist()]
+        detections = [
+            {'class': name, 'confidence': conf, 'bbox': bbox}
+            for name, conf, bbox in zip(names, confidences.tolist(), xyxy.tolist())
+        ]
+        return detections, int(counts[0]), int(counts[1])
+    
+    def _parse_result(self, result):
+        """从单张图片的推理结果中提取检测框和统计数据"""
+        return self._parse_arrays(*self._extract_boxes(result))
+    
+    def _build_result(self, image_path_or_array, result, annotate=True, preview_size=None):
+        """
+        解析推理结果并绘制标注图片（annotate=False 时只返回检测框）；
+        preview_size 为预览图长边的像素数，先缩小再绘制，检测框坐标仍为原图坐标
+        """
+        class_ids, confidences, xyxy = self._extract_boxes(result)
+        detections, with_helmet, without_helmet = self._parse_arrays(class_ids, confidences, xyxy)
         
         # Draw results on image
-        annotated_image = self._draw_detections(image_path_or_array, detections)
+        annotated_image = None
+        image_scale = 1.0
+        if annotate:
+            annotated_image, image_scale = self._draw_detections(image_path_or_array, detections, preview_size)
         
-        return {
+        output = {
             'image': annotated_image,
             'detections': detections,
+            # 同一批检测框的紧凑格式（按列保存），第 i 个检测框对应 detections[i]
+            'boxes': {
+                'class_id': class_ids.tolist(),
+                'confidence': confidences.tolist(),
+                'xyxy': xyxy.tolist()
+            },
             'stats': {
                 'total': len(detections),
                 'with_helmet': with_helmet,
                 'without_helmet': without_helmet
             }
         }
+        if preview_size:
+            # 预览图相对原图的缩放比例，客户端按此换算检测框坐标
+            output['image_scale'] = image_scale
+        return output
+    
+    def detect_image(self, image_path_or_array, confidence=None, annotate=True, preview_size=None):
+        """Detect helmets in an image"""
+        # 使用传入的置信度或实例的置信度阈值
+        conf_threshold = confidence if confidence is not None else self.confidence_threshold
+        if self.batcher is not None:
+            # 交给微批处理器，与同一模型的并发请求合并为一次前向推理（处理器已停止时直接推理）
+            result = self.batcher.submit(image_path_or_array, conf_threshold).result()
+        else:
+            result = self._predict(image_path_or_array, conf_threshold)[0]
+        
+        return self._build_result(image_path_or_array, result, annotate=annotate, preview_size=preview_size)
+    
+    def detect_images(self, images, confidence=None, batch_size=None, annotate=True, preview_size=None):
+        """Detect helmets in a batch of images (numpy arrays), one forward pass per chunk"""
+        conf_threshold = confidence if confidence is not None else self.confidence_threshold
+        batch_size = batch_size or Config.BATCH_INFERENCE_SIZE
+        
+        outputs = []
+        for i in range(0, len(images), batch_size):
+            chunk = images[i:i + batch_size]
+            results = self._predict(chunk, conf_threshold)
+            for image, result in zip(chunk, results):
+                outputs.append(self._build_result(image, result, annotate=annotate, preview_size=preview_size))
+        return outputs
     
-    def _draw_detections(self, image_path_or_array, detections):
-        """Draw bounding boxes on image"""
+    def _draw_detections(self, image_path_or_array, detections, max_size=None):
+        """Draw bounding boxes on image, returns (base64 JPEG, scale of the preview relative to the image)"""
         try:
             if isinstance(image_path_or_array, (str, Path)):
                 img = cv2.imread(str(image_path_or_array))
@@ -168,38 +245,41 @@ class DetectionService:
                 if img is None:
                     raise ValueError("图片数组为空")
             
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            for det in detections:
-                x1, y1, x2, y2 = map(int, det['bbox'])
-                color = (0, 255, 0) if det['class'] == 'with_helmet' else (255, 0, 0)
-                
-                cv2.rectangle(img_rgb, (x1, y1), (x2, y2), color, 2)
-                label = f"{det['class']} {det['confidence']:.2f}"
-                cv2.putText(img_rgb, label, (x1, y1 - 10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            # 预览图先缩小再绘制（缩小会生成新数组）；否则复制一份，不修改调用方传入的数组
+            preview, scale = downscale(img, max_size)
+            if preview is image_path_or_array:
+                preview = preview.copy()
+            self._annotate_frame(preview, scale_detections(detections, scale))
             
             # Convert to base64
-            pil_img = Image.fromarray(img_rgb)
-            buff = BytesIO()
-            pil_img.save(buff, format='JPEG')
-            img_str = base64.b64encode(buff.getvalue()).decode()
-            
-            return img_str
+            return self._encode_frame(preview), scale
         except Exception as e:
             print(f"Error in _draw_detections: {str(e)}")
             import traceback
             traceback.print_exc()
             raise
     
-    def detect_video(self, video_path, output_path=None, detection_fps=None):
+    def _annotate_frame(self, frame, detections):
+        """Draw bounding boxes in place on a BGR frame"""
+        return render_detections(frame, detections)
+    
+    def _encode_frame(self, frame):
+        """Encode a BGR frame as base64 JPEG"""
+        return encode_base64_jpeg(frame)
+    
+    def detect_video(self, video_path, output_path=None, detection_fps=None, progress_callback=None, cancel_event=None,
+                     tracking=None, detections_callback=None, scene_skip=None):
         """Detect helmets in a video"""
         cap = cv2.VideoCapture(str(video_path))
         frame_results = []
-        total_detections = 0
-        total_with_helmet = 0
-        total_without_helmet = 0
-        frame_count = 0
+        # 写入线程中累加的统计数据
+        totals = {
+            'total_detections': 0,
+            'with_helmet': 0,
+            'without_helmet': 0,
+            'detected_frames': 0,  # 已检测的帧数（不是总帧数，含复用上一检测帧结果的静止画面帧）
+            'skipped_frames': 0  # 静止画面没有推理、复用结果的检测帧数
+        }
         
         # 确保 output_path 是 Path 对象
         if output_path is None:
@@ -246,27 +326,49 @@ class DetectionService:
             # 计算跳帧间隔：每N帧检测一次
             frame_skip = max(1, int(video_fps / detection_fps))
         
-        last_detected_frame = None
-        detected_frame_count = 0  # 已检测的帧数（不是总帧数）
+        conf_threshold = self.confidence_threshold
+        last_annotated = {'frame': None}
+        # 跟踪模式：跳过的帧用跟踪器预测的框绘制在当前真实帧上
+        tracking = Config.VIDEO_TRACKING_ENABLED if tracking is None else tracking
+        tracker = IoUTracker() if tracking else None
+        # 静止画面跳过推理：与上一个推理帧相比变化很小的检测帧复用其检测结果
+        scene_skip = Config.SCENE_SKIP_ENABLED if scene_skip is None else scene_skip
+        scene = SceneChangeDetector() if scene_skip else None
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            
-            # 根据跳帧间隔决定是否检测
-            if frame_count % frame_skip == 0:
-                # 进行检测
-                result = self.detect_image(frame)
-                last_detected_frame = result
-                detected_frame_count += 1
+        def infer_frames(frames):
+            # 一批需要检测的帧只做一次前向推理
+            return [self._parse_result(result) for result in self._predict(frames, conf_threshold)]
+        
+        def write_frame(index, frame, parsed, reused=False):
+            if parsed is not None:
+                # 进行检测：直接在原始帧数组上绘制，不经过JPEG/base64编码
+                detections, with_helmet, without_helmet = parsed
+                if reused:
+                    # 静止画面复用的结果已经更新过跟踪器和保存过检测框
+                    totals['skipped_frames'] += 1
+                else:
+                    if tracker is not None:
+                        tracker.update(detections, index)
+                    if detections_callback is not None:
+                        # 检测帧的检测框（含跟踪ID）交给调用方保存
+                        detections_callback(index, detections, (width, height))
+                self._annotate_frame(frame, detections)
+                last_annotated['frame'] = frame
+                totals['detected_frames'] += 1
+                detected_frame_count = totals['detected_frames']
+                stats = {
+                    'total': len(detections),
+                    'with_helmet': with_helmet,
+                    'without_helmet': without_helmet
+                }
                 
                 # 收集关键帧：收集所有检测帧（不限制数量），以便更好地展示检测结果
                 # 如果检测帧数较少，全部收集；如果较多，均匀采样
                 should_collect = False
-                if detected_frame_count <= 10:
+                if reused:
+                    # 静止画面与已收集的关键帧相同，不重复收集
+                    should_collect = False
+                elif detected_frame_count <= 10:
                     # 前10个检测帧都收集
                     should_collect = True
                 else:
@@ -275,26 +377,54 @@ class DetectionService:
                     should_collect = (detected_frame_count % collect_interval == 0) and len(frame_results) < 30
                 
                 if should_collect:
-                    frame_results.append(result)
+                    # 只有返回给前端的关键帧才编码为base64
+                    frame_results.append({
+                        'image': self._encode_frame(frame),
+                        'detections': detections,
+                        'stats': stats
+                    })
                 
-                total_detections += result['stats']['total']
-                total_with_helmet += result['stats']['with_helmet']
-                total_without_helmet += result['stats']['without_helmet']
+                totals['total_detections'] += stats['total']
+                totals['with_helmet'] += stats['with_helmet']
+                totals['without_helmet'] += stats['without_helmet']
                 
-                # Draw on frame and write
-                annotated_frame = self._frame_from_base64(result['image'])
-                out.write(annotated_frame)
+                out.write(frame)
+            elif tracker is not None:
+                # 跳过检测，在当前帧上绘制跟踪器预测的框
+                self._annotate_frame(frame, tracker.predict(index))
+                out.write(frame)
             else:
                 # 跳过检测，直接使用上一帧的检测结果（如果有）
-                if last_detected_frame:
-                    annotated_frame = self._frame_from_base64(last_detected_frame['image'])
-                    out.write(annotated_frame)
+                if last_annotated['frame'] is not None:
+                    out.write(last_annotated['frame'])
                 else:
                     # 第一帧之前，直接写入原始帧
                     out.write(frame)
         
-        cap.release()
-        out.release()
+        # 进度回调：progress_callback(已处理帧数, 总帧数)
+        frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        progress_fn = None
+        if progress_callback is not None:
+            progress_fn = lambda frames_done: progress_callback(frames_done, frames_total)
+        
+        # 解码、推理、标注写入分阶段并行执行
+        pipeline = VideoPipeline(cap.read, infer_frames, write_frame, frame_skip=frame_skip,
+                                 progress_fn=progress_fn, cancel_event=cancel_event,
+                                 static_fn=scene.is_static if scene is not None else None)
+        try:
+            timings = pipeline.run()
+        except PipelineCancelled:
+            # 取消时删除未写完的结果视频
+            out.release()
+            if output_path.exists():
+                output_path.unlink()
+            raise
+        finally:
+            cap.release()
+            out.release()
+        frame_count = pipeline.frames_read
+        # 按轨迹去重后的人数统计
+        track_summary = tracker.summary() if tracker is not None else {}
         
         # 确保视频文件被正确写入和关闭
         # 检查输出文件是否存在且大小大于0
@@ -365,17 +495,12 @@ class DetectionService:
             'frame_results': frame_results,  # Return all collected keyframes (up to 30)
             'summary': {
                 'total_frames': frame_count,
-                'total_detections': total_detections,
-                'with_helmet': total_with_helmet,
-                'without_helmet': total_without_helmet,
-                'detected_frames': detected_frame_count  # 实际检测的帧数
+                'total_detections': totals['total_detections'],
+                'with_helmet': totals['with_helmet'],
+                'without_helmet': totals['without_helmet'],
+                'detected_frames': totals['detected_frames'],  # 检测帧数（含静止画面复用结果的帧）
+                'skipped_frames': totals['skipped_frames'],  # 静止画面跳过推理的帧数
+                'timings': timings,  # 各阶段耗时（秒）
+                **track_summary
             }
         }
-    
-    def _frame_from_base64(self, base64_str):
-        """Convert base64 image back to OpenCV frame"""
-        img_data = base64.b64decode(base64_str)
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        return img
-
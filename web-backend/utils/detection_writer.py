@@ -0,0 +1,180 @@
+"""
+检测记录写入：可选的延迟批量写入（write-behind），检测请求只入队，由后台线程每N条或每T毫秒在一个事务中批量提交
+"""
+from datetime import datetime
+from config import Config
+from extensions import db
+from utils.rollups import record_detection
+import atexit
+import queue
+import threading
+import time
+
+
+class DetectionWriter:
+    """检测记录写入器，未开启延迟写入时在当前请求的会话中同步提交"""
+
+    def __init__(self, enabled=None, batch_size=None, flush_ms=None, queue_size=None):
+        self.enabled = Config.DETECTION_WRITE_BEHIND if enabled is None else enabled
+        self.batch_size = batch_size or Config.DETECTION_WRITE_BATCH_SIZE
+        self.flush_interval = (flush_ms or Config.DETECTION_WRITE_FLUSH_MS) / 1000.0
+        self.retries = Config.DETECTION_WRITE_RETRIES
+        self.retry_backoff = Config.DETECTION_WRITE_RETRY_BACKOFF_MS / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size or Config.DETECTION_WRITE_QUEUE_SIZE)
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.retried = 0  # 批量提交失败后重试的次数
+        self.fallbacks = 0  # 重试仍失败、改为逐条提交的批次数
+        self.sync_writes = 0  # 未开启或队列已满时同步写入的记录数
+        self.flushes = 0
+        self.total_flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    def init_app(self, app):
+        self._app = app
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name='detection-writer', daemon=True)
+            self._thread.start()
+            # 进程退出前写入队列中剩余的记录
+            atexit.register(self.stop)
+
+    def write(self, *detections):
+        """保存检测记录，延迟写入时立即返回（记录ID在写入前不可用）"""
+        if self.enabled and self._thread is not None and not self._stop.is_set():
+            now = datetime.utcnow()
+            for i, detection in enumerate(detections):
+                # 在入队时确定创建时间，延迟写入不影响统计的时间段
+                if detection.created_at is None:
+                    detection.created_at = now
+                try:
+                    self._queue.put_nowait(detection)
+                except queue.Full:
+                    # 队列已满（写入跟不上）时退化为同步写入，形成背压而不是丢弃记录
+                    detections = detections[i:]
+                    break
+                with self._lock:
+                    self.enqueued += 1
+            else:
+                return
+        record_detection(*detections)
+        db.session.commit()
+        with self._lock:
+            self.sync_writes += len(detections)
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        """收集一批记录：达到批量大小或距第一条记录超过刷新间隔时返回"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, detections):
+        """在一个事务中写入记录，失败时回滚并抛出异常"""
+        with self._app.app_context():
+            try:
+                record_detection(*detections)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _flush(self, batch):
+        """
+        批量提交；失败（例如 SQLite database is locked）时按指数退避重试，
+        重试仍失败时逐条提交，只丢弃本身无法写入的记录
+        """
+        start = time.perf_counter()
+        written = 0
+        retried = 0
+        fallback = False
+        for attempt in range(self.retries + 1):
+            try:
+                self._commit(batch)
+                written = len(batch)
+                break
+            except Exception as e:
+                if attempt < self.retries:
+                    delay = self.retry_backoff * (2 ** attempt)
+                    print(f"Detection writer flush failed ({len(batch)} records), retrying in {delay:.2f}s: {str(e)}")
+                    retried += 1
+                    time.sleep(delay)
+                else:
+                    print(f"Detection writer flush failed ({len(batch)} records) after {self.retries} retries, "
+                          f"committing records one by one: {str(e)}")
+                    fallback = True
+        if fallback:
+            for detection in batch:
+                try:
+                    self._commit([detection])
+                    written += 1
+                except Exception as e:
+                    import traceback
+                    print(f"Detection writer dropped record (user_id={detection.user_id}, "
+                          f"model_id={detection.model_id}, created_at={detection.created_at}): {str(e)}")
+                    print(traceback.format_exc())
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.written += written
+            self.failed += len(batch) - written
+            self.retried += retried
+            self.fallbacks += int(fallback)
+            self.flushes += 1
+            self.total_flush_time += elapsed
+            self.last_flush_time = elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    def stop(self, timeout=10):
+        """停止后台线程，写入队列中剩余的记录"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def stats(self):
+        """返回队列深度和批量写入耗时等统计信息"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queue_depth': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'batch_size': self.batch_size,
+                'flush_interval_ms': self.flush_interval * 1000,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'failed': self.failed,
+                'retried': self.retried,
+                'fallbacks': self.fallbacks,
+                'sync_writes': self.sync_writes,
+                'flushes': self.flushes,
+                'avg_batch_size': (self.written + self.failed) / self.flushes if self.flushes > 0 else 0,
+                'avg_flush_ms': self.total_flush_time / self.flushes * 1000 if self.flushes > 0 else 0,
+                'last_flush_ms': self.last_flush_time * 1000,
+                'max_flush_ms': self.max_flush_time * 1000
+            }
+
+
+# 进程级单例
+detection_writer = DetectionWriter()
@@ -0,0 +1,136 @@
+"""
+微批处理器：把同一模型上并发到达的单图检测请求合并成一次批量前向推理
+"""
+from concurrent.futures import Future
+from pathlib import Path
+from config import Config
+import cv2
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    """在 max_wait_ms 时间窗口内收集最多 max_batch 个请求，合并为一次推理"""
+
+    def __init__(self, predict_fn, max_batch=None, max_wait_ms=None, name='batcher'):
+        # predict_fn(sources, conf_threshold) -> 与 sources 一一对应的推理结果列表
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch or Config.MICRO_BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else Config.MICRO_BATCH_MAX_WAIT_MS) / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = False
+        # 保证停止后不会再有请求进入队列（停止时队列中剩余的请求都会被处理）
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.direct = 0  # 停止后直接推理（不合并）的请求数
+        self.items = 0
+        self.max_batch_seen = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, image_path_or_array, conf_threshold):
+        """
+        提交一张图片，返回 Future，结果为该图片的推理结果；
+        处理器已停止（模型缓存失效或被淘汰）时在调用线程中直接推理，调用方不需要检查状态
+        """
+        if isinstance(image_path_or_array, (str, Path)):
+            # 同一批次中的输入必须同为numpy数组，路径需要先解码
+            image = cv2.imread(str(image_path_or_array))
+            if image is None:
+                raise ValueError(f"无法读取图片: {image_path_or_array}")
+        else:
+            image = image_path_or_array
+        future = Future()
+        with self._lock:
+            if not self._stopped:
+                self._queue.put((image, conf_threshold, future))
+                return future
+        self._run_group(conf_threshold, [(image, conf_threshold, future)])
+        with self._lock:
+            self.direct += 1
+        return future
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def stop(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+
+    def _collect(self):
+        """阻塞等待第一个请求，然后在时间窗口内继续收集"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            # 置信度阈值是推理参数，只有相同阈值的请求才能合并
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for conf_threshold, items in groups.items():
+                self._run_group(conf_threshold, items)
+            if self._stopped:
+                break
+        # 停止前已入队的请求仍然推理（停止后 submit 不再入队）
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                remaining.append(item)
+        for i in range(0, len(remaining), self.max_batch):
+            groups = {}
+            for item in remaining[i:i + self.max_batch]:
+                groups.setdefault(item[1], []).append(item)
+            for conf_threshold, items in groups.items():
+                self._run_group(conf_threshold, items)
+
+    def _run_group(self, conf_threshold, items):
+        images = [item[0] for item in items]
+        try:
+            results = self.predict_fn(images, conf_threshold)
+        except Exception as e:
+            for item in items:
+                item[2].set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(items)
+        self.max_batch_seen = max(self.max_batch_seen, len(items))
+        for item, result in zip(items, results):
+            item[2].set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches > 0 else 0,
+            'max_batch_size': self.max_batch_seen,
+            'direct': self.direct,
+            'queue_depth': self._queue.qsize()
+        }
@@ -0,0 +1,170 @@
+"""
+模型导出与推理后端选择：发布时把 .pt 权重导出为 ONNX / OpenVINO（可选INT8量化），CPU节点优先使用导出的后端；
+导出的后端加载或预热失败时记录下来，之后回退到 .pt 权重
+"""
+from pathlib import Path
+from config import Config
+import numpy as np
+import shutil
+import threading
+import time
+
+# 本进程中加载失败的导出产物：(产物路径, 修改时间) -> 错误信息，产物重新导出后修改时间变化，会再次尝试
+_failed_backends = {}
+_failed_lock = threading.Lock()
+
+# 后端名称 -> 相对 .pt 文件的产物路径
+def backend_artifact_paths(pt_path):
+    pt_path = Path(pt_path)
+    return {
+        'onnx': pt_path.with_suffix('.onnx'),
+        'onnx_int8': pt_path.with_name(f'{pt_path.stem}.int8.onnx'),
+        'openvino': pt_path.with_name(f'{pt_path.stem}_openvino_model')
+    }
+
+
+def find_backend_artifacts(pt_path):
+    """返回已存在且不早于 .pt 文件的导出产物（.pt 被重新训练覆盖后旧产物视为过期）"""
+    pt_path = Path(pt_path)
+    artifacts = {'pytorch': pt_path} if pt_path.exists() else {}
+    if not pt_path.exists():
+        return artifacts
+    pt_mtime = pt_path.stat().st_mtime
+    for backend, path in backend_artifact_paths(pt_path).items():
+        if path.exists() and path.stat().st_mtime >= pt_mtime:
+            artifacts[backend] = path
+    return artifacts
+
+
+def _failure_key(path):
+    path = Path(path)
+    try:
+        return str(path.absolute()), path.stat().st_mtime_ns
+    except OSError:
+        return str(path.absolute()), None
+
+
+def mark_backend_failed(path, error):
+    """记录导出产物加载失败，之后选择推理后端时跳过该产物"""
+    with _failed_lock:
+        _failed_backends[_failure_key(path)] = str(error)
+
+
+def backend_failure(path):
+    """返回导出产物在本进程中的加载失败信息，没有失败时返回 None"""
+    with _failed_lock:
+        return _failed_backends.get(_failure_key(path))
+
+
+def resolve_inference_path(pt_path):
+    """按 INFERENCE_BACKEND_PREFERENCE 选择实际用于推理的模型文件（跳过加载失败的导出产物）"""
+    if not Config.PREFER_EXPORTED_BACKEND:
+        return Path(pt_path)
+    artifacts = find_backend_artifacts(pt_path)
+    for backend in Config.INFERENCE_BACKEND_PREFERENCE:
+        if backend in artifacts and (backend == 'pytorch' or backend_failure(artifacts[backend]) is None):
+            return artifacts[backend]
+    return Path(pt_path)
+
+
+def load_inference_model(path):
+    """
+    加载推理模型；导出的后端在第一次推理时才初始化运行时（onnxruntime/openvino），
+    加载时用空白图预热一次，缺少依赖或产物损坏时在这里失败，而不是在检测请求中失败
+    """
+    from utils.detection import load_yolo_model, run_inference
+
+    model = load_yolo_model(path)
+    if Path(path).suffix != '.pt':
+        image = np.zeros((Config.EXPORT_IMGSZ, Config.EXPORT_IMGSZ, 3), dtype=np.uint8)
+        run_inference(model, image, Config.CONFIDENCE_THRESHOLD)
+    return model
+
+
+def export_model(pt_path, formats=None, int8=None, imgsz=None):
+    """导出模型，返回 {后端: 产物路径}，单个后端导出失败不影响其他后端"""
+    from utils.detection import load_yolo_model
+
+    pt_path = Path(pt_path)
+    formats = formats if formats is not None else Config.EXPORT_FORMATS
+    int8 = Config.EXPORT_INT8 if int8 is None else int8
+    imgsz = imgsz or Config.EXPORT_IMGSZ
+    targets = backend_artifact_paths(pt_path)
+    artifacts = {}
+    errors = {}
+
+    for fmt in formats:
+        try:
+            model = load_yolo_model(pt_path)
+            # dynamic=True 以支持批量推理（微批处理、视频批量推理）
+            exported = Path(model.export(format=fmt, imgsz=imgsz, dynamic=True, half=False))
+            target = targets[fmt]
+            if exported.resolve() != target.resolve():
+                if target.exists():
+                    shutil.rmtree(target) if target.is_dir() else target.unlink()
+                shutil.move(str(exported), str(target))
+            artifacts[fmt] = target
+            print(f"Exported {pt_path} to {fmt}: {target}")
+        except Exception as e:
+            print(f"Export to {fmt} failed for {pt_path}: {str(e)}")
+            errors[fmt] = str(e)
+
+    if int8 and 'onnx' in artifacts:
+        try:
+            # 动态INT8量化（仅权重），依赖 onnxruntime，未安装时跳过
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(str(artifacts['onnx']), str(targets['onnx_int8']), weight_type=QuantType.QUInt8)
+            artifacts['onnx_int8'] = targets['onnx_int8']
+            print(f"Quantized {artifacts['onnx']} to INT8: {targets['onnx_int8']}")
+        except ImportError:
+            errors['onnx_int8'] = '未安装 onnxruntime，跳过INT8量化'
+        except Exception as e:
+            print(f"INT8 quantization failed for {pt_path}: {str(e)}")
+            errors['onnx_int8'] = str(e)
+
+    return {k: str(v) for k, v in artifacts.items()}, errors
+
+
+def remove_exported_artifacts(pt_path):
+    """删除模型的所有导出产物"""
+    for path in backend_artifact_paths(pt_path).values():
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+
+def benchmark_backends(pt_path, runs=None, imgsz=None):
+    """对每个可用后端测量单张图片推理延迟（毫秒）"""
+    from utils.detection import load_yolo_model, run_inference
+
+    runs = runs or Config.BENCHMARK_RUNS
+    imgsz = imgsz or Config.EXPORT_IMGSZ
+    # 固定随机种子的噪声图，保证不同后端之间可比
+    image = np.random.default_rng(0).integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    results = {}
+
+    for backend, path in find_backend_artifacts(pt_path).items():
+        try:
+            model = load_yolo_model(path)
+            # 预热：首次推理包含初始化开销
+            run_inference(model, image, Config.CONFIDENCE_THRESHOLD)
+            latencies = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                run_inference(model, image, Config.CONFIDENCE_THRESHOLD)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies = np.array(latencies)
+            results[backend] = {
+                'path': str(path),
+                'runs': runs,
+                'mean_ms': round(float(latencies.mean()), 2),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+                'min_ms': round(float(latencies.min()), 2)
+            }
+        except Exception as e:
+            print(f"Benchmark failed for backend {backend} ({path}): {str(e)}")
+            results[backend] = {'path': str(path), 'error': str(e)}
+
+    return results
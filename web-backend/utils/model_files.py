@@ -0,0 +1,53 @@
+"""
+模型文件存在性索引：缓存模型文件的检查结果，模型列表接口不再对每个模型访问文件系统
+"""
+from pathlib import Path
+from config import Config
+import threading
+import time
+
+
+class ModelFileIndex:
+    """按路径缓存文件是否存在，超过有效期或被显式刷新时重新检查"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else Config.MODEL_FILE_INDEX_TTL
+        self._entries = {}  # 路径 -> (是否存在, 检查时间)
+        self._lock = threading.Lock()
+
+    def exists(self, path):
+        if not path:
+            return False
+        key = str(path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                return entry[0]
+        exists = Path(key).exists()
+        with self._lock:
+            self._entries[key] = (exists, now)
+        return exists
+
+    def refresh(self, paths=None):
+        """重新检查指定路径（默认全部已缓存的路径），返回 {路径: 是否存在}"""
+        with self._lock:
+            keys = [str(p) for p in paths if p] if paths is not None else list(self._entries)
+        now = time.monotonic()
+        result = {key: Path(key).exists() for key in keys}
+        with self._lock:
+            for key, exists in result.items():
+                self._entries[key] = (exists, now)
+        return result
+
+    def invalidate(self, path=None):
+        """模型文件被创建、替换或删除后调用，path 为空时清空整个索引"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(path), None)
+
+
+# 进程级单例
+model_file_index = ModelFileIndex()
@@ -0,0 +1,181 @@
+"""
+模型缓存注册表：在进程内保持已加载的YOLO模型常驻，避免每次检测请求都从磁盘重新加载权重
+"""
+from collections import OrderedDict
+from pathlib import Path
+from config import Config
+from utils.micro_batcher import MicroBatcher
+import threading
+import time
+
+
+class _RegistryEntry:
+    """缓存中的单个已加载模型"""
+    def __init__(self, model_id, key, model, size_bytes, load_time):
+        self.model_id = model_id
+        self.key = key  # (模型路径, 文件修改时间, 文件大小)，模型路径可能是导出的ONNX/OpenVINO产物
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_time = load_time
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        # 同一个YOLO模型对象不保证线程安全，推理时需要串行化
+        self.lock = threading.Lock()
+        # 按需创建的微批处理器（合并并发请求）
+        self.batcher = None
+
+
+class ModelRegistry:
+    """按模型ID缓存已加载的模型，按LRU策略在数量/内存预算内淘汰"""
+
+    def __init__(self, max_models=None, max_memory_mb=None):
+        self.max_models = max_models if max_models is not None else Config.MODEL_CACHE_MAX_MODELS
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else Config.MODEL_CACHE_MAX_MEMORY_MB
+        self._entries = OrderedDict()  # model_id -> _RegistryEntry
+        self._lock = threading.RLock()
+        # 每个模型ID一把加载锁，避免并发请求重复加载同一个模型
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.total_load_time = 0.0
+
+    @staticmethod
+    def weights_key(model_path):
+        """
+        根据文件路径、修改时间和大小生成权重标识（模型缓存键，也用于检测结果缓存），
+        文件被替换后自动失效；只读取文件状态，不读取文件内容
+        """
+        path = Path(model_path)
+        if path.is_dir():
+            # OpenVINO 导出产物是目录，按目录内文件汇总
+            stats = [f.stat() for f in path.rglob('*') if f.is_file()]
+            return (str(path.absolute()), max((s.st_mtime_ns for s in stats), default=0), sum(s.st_size for s in stats))
+        stat = path.stat()
+        return (str(path.absolute()), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, model_id, model_path, loader):
+        """获取已加载的模型条目，未命中时调用 loader(model_path) 加载"""
+        key = self.weights_key(model_path)
+
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(model_id)
+                entry.hits += 1
+                entry.last_used = time.time()
+                self.hits += 1
+                return entry
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        with load_lock:
+            # 等待锁期间其他线程可能已经完成加载
+            with self._lock:
+                entry = self._entries.get(model_id)
+                if entry is not None and entry.key == key:
+                    self._entries.move_to_end(model_id)
+                    entry.hits += 1
+                    entry.last_used = time.time()
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+            start = time.perf_counter()
+            model = loader(model_path)
+            load_time = time.perf_counter() - start
+
+            entry = _RegistryEntry(model_id, key, model, key[2], load_time)
+            with self._lock:
+                old_entry = self._entries.pop(model_id, None)
+                if old_entry is not None:
+                    self._release(old_entry)
+                self._entries[model_id] = entry
+                self.loads += 1
+                self.total_load_time += load_time
+                self._evict()
+            print(f"Model {model_id} loaded into cache in {load_time:.3f}s: {model_path}")
+            return entry
+
+    def _memory_bytes(self):
+        return sum(e.size_bytes for e in self._entries.values())
+
+    def _evict(self):
+        """按LRU顺序淘汰，直到满足数量和内存预算（至少保留最近使用的一个模型）"""
+        max_bytes = self.max_memory_mb * 1024 * 1024 if self.max_memory_mb else None
+        while len(self._entries) > 1:
+            over_count = self.max_models and len(self._entries) > self.max_models
+            over_memory = max_bytes and self._memory_bytes() > max_bytes
+            if not over_count and not over_memory:
+                break
+            model_id, entry = self._entries.popitem(last=False)
+            self._release(entry)
+            self.evictions += 1
+            print(f"Model {model_id} evicted from cache")
+
+    def _release(self, entry):
+        """释放条目持有的资源"""
+        if entry.batcher is not None:
+            entry.batcher.stop()
+            entry.batcher = None
+        entry.model = None
+
+    def get_batcher(self, entry, predict_fn):
+        """获取条目对应的微批处理器，不存在时创建"""
+        with self._lock:
+            if entry.batcher is None:
+                entry.batcher = MicroBatcher(predict_fn, name=f'batcher-model-{entry.model_id}')
+            return entry.batcher
+
+    def invalidate(self, model_id):
+        """使指定模型的缓存失效（发布、取消发布、删除、重新训练后调用）"""
+        with self._lock:
+            entry = self._entries.pop(model_id, None)
+            if entry is not None:
+                self._release(entry)
+                self.invalidations += 1
+                print(f"Model {model_id} invalidated in cache")
+            return entry is not None
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._release(entry)
+            self._entries.clear()
+
+    def stats(self):
+        """返回缓存命中/未命中/加载耗时等统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0,
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'total_load_time': self.total_load_time,
+                'avg_load_time': self.total_load_time / self.loads if self.loads > 0 else 0,
+                'max_models': self.max_models,
+                'max_memory_mb': self.max_memory_mb,
+                'memory_bytes': self._memory_bytes(),
+                'models': [
+                    {
+                        'model_id': e.model_id,
+                        'path': e.key[0],
+                        'size_bytes': e.size_bytes,
+                        'load_time': e.load_time,
+                        'hits': e.hits,
+                        'loaded_at': e.loaded_at,
+                        'last_used': e.last_used,
+                        'batcher': e.batcher.stats() if e.batcher is not None else None
+                    }
+                    for e in reversed(self._entries.values())
+                ]
+            }
+
+
+# 进程级单例
+model_registry = ModelRegistry()
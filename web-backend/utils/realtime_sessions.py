@@ -0,0 +1,149 @@
+"""
+实时检测会话管理：每个用户/会话独立保存阈值、帧率和统计数据，模型通过模型缓存共享
+"""
+from config import Config
+from utils.scene_change import SceneChangeDetector
+import threading
+import time
+
+
+class RealtimeSession:
+    """单个实时检测会话"""
+
+    def __init__(self, user_id, session_id, model_id, service, confidence=None, fps=None):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.model_id = model_id
+        # DetectionService 每个会话一个实例（保存会话阈值），底层模型由模型缓存共享
+        self.service = service
+        self.confidence = float(confidence) if confidence is not None else Config.CONFIDENCE_THRESHOLD
+        self.fps = int(fps) if fps else 5
+        self.stats = {
+            'total': 0,
+            'with_helmet': 0,
+            'without_helmet': 0
+        }
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.last_inference = 0.0
+        self.last_result = None
+        self.last_params = None  # 上一次推理的参数（置信度、预览图尺寸），参数变化后不复用结果
+        self.throttled = 0
+        # 静止画面检测（复用上一次推理的结果）
+        self.scene = SceneChangeDetector() if Config.SCENE_SKIP_ENABLED else None
+        self.lock = threading.Lock()
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def within_budget(self):
+        """检查距离上次推理的时间是否满足帧率预算（允许一半的抖动）"""
+        if not self.fps or self.last_result is None:
+            return True
+        return time.monotonic() - self.last_inference >= 0.5 / self.fps
+
+    def can_reuse(self, params, need_image=False):
+        """上一次推理的结果是否可以用于当前请求：推理参数相同，且需要标注图片时上一次的结果有图片"""
+        if self.last_result is None or params != self.last_params:
+            return False
+        return not need_image or self.last_result.get('image') is not None
+
+    def reuse_if_static(self, image, params, need_image=False):
+        """画面相对上一次推理的帧没有变化时，计入统计并返回上一次的结果（不推理），否则返回 None"""
+        if self.scene is None:
+            return None
+        if not self.can_reuse(params, need_image):
+            # 参数变化后重新选择参考帧，本帧推理的结果才可以复用
+            self.scene.reset()
+            return None
+        if not self.scene.is_static(image):
+            return None
+        self._count_frame(self.last_result)
+        return self.last_result
+
+    def record_frame(self, result, params=None):
+        """记录一次推理的结果和推理参数并累加统计数据"""
+        self.last_inference = time.monotonic()
+        self.last_result = result
+        self.last_params = params
+        self._count_frame(result)
+
+    def _count_frame(self, result):
+        """累加实时检测统计数据，统计方式：按帧统计，不是按对象统计"""
+        # 总检测帧数+1
+        self.stats['total'] += 1
+
+        # 如果这一帧有检测结果
+        if result['stats']['total'] > 0:
+            # 检查是否有安全帽和无安全帽的检测
+            has_with_helmet = any(d.get('class') == 'with_helmet' for d in result.get('detections', []))
+            has_without_helmet = any(d.get('class') == 'without_helmet' for d in result.get('detections', []))
+            # 按帧统计：如果这一帧包含有安全帽的检测，则with_helmet帧数+1
+            if has_with_helmet:
+                self.stats['with_helmet'] += 1
+            # 按帧统计：如果这一帧包含无安全帽的检测，则without_helmet帧数+1
+            if has_without_helmet:
+                self.stats['without_helmet'] += 1
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'session_id': self.session_id,
+            'model_id': self.model_id,
+            'confidence': self.confidence,
+            'fps': self.fps,
+            'stats': dict(self.stats),
+            'throttled': self.throttled,
+            'skipped': self.scene.skipped if self.scene is not None else 0,  # 静止画面复用结果的帧数
+            'created_at': self.created_at,
+            'last_active': self.last_active
+        }
+
+
+class RealtimeSessionManager:
+    """按 (用户ID, 会话ID) 管理实时检测会话，空闲超时的会话会被淘汰"""
+
+    def __init__(self, idle_timeout=None, max_sessions=None):
+        self.idle_timeout = idle_timeout if idle_timeout is not None else Config.REALTIME_SESSION_IDLE_TIMEOUT
+        self.max_sessions = max_sessions if max_sessions is not None else Config.REALTIME_MAX_SESSIONS
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(self, session):
+        """注册会话，返回被替换的同名旧会话（如果有）"""
+        with self._lock:
+            key = (session.user_id, session.session_id)
+            old = self._sessions.pop(key, None)
+            if old is None and self.max_sessions and len(self._sessions) >= self.max_sessions:
+                raise RuntimeError(f'实时检测会话数量已达上限 ({self.max_sessions})')
+            self._sessions[key] = session
+            return old
+
+    def get(self, user_id, session_id):
+        with self._lock:
+            session = self._sessions.get((user_id, session_id))
+            if session is not None:
+                session.touch()
+            return session
+
+    def stop(self, user_id, session_id):
+        with self._lock:
+            return self._sessions.pop((user_id, session_id), None)
+
+    def evict_idle(self):
+        """移除空闲超时的会话并返回，调用方负责保存统计数据"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, s in self._sessions.items() if now - s.last_active > self.idle_timeout]
+            return [self._sessions.pop(key) for key in expired]
+
+    def list(self, user_id=None):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        if user_id is not None:
+            sessions = [s for s in sessions if s.user_id == user_id]
+        return sessions
+
+
+# 进程级单例
+realtime_sessions = RealtimeSessionManager()
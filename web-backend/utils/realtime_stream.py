@@ -0,0 +1,50 @@
+"""
+实时流检测的帧缓冲：只保留最新的一帧，推理跟不上时丢弃过期帧，保证端到端延迟有上界
+"""
+import threading
+import time
+
+
+class LatestFrameSlot:
+    """单槽帧缓冲，新帧覆盖尚未处理的旧帧"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data):
+        """放入一帧（二进制JPEG），返回帧序号"""
+        with self._cond:
+            self.received += 1
+            if self._frame is not None:
+                # 上一帧还没来得及处理，直接丢弃
+                self.dropped += 1
+            self._frame = (self.received, data, time.monotonic())
+            self._cond.notify()
+            return self.received
+
+    def get(self, timeout=None):
+        """取出最新一帧 (帧序号, 数据, 接收时间)，连接关闭或超时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame is not None or self._closed, timeout=timeout):
+                return None
+            frame = self._frame
+            self._frame = None
+            return frame
+
+    def drop(self):
+        """记录一帧因过期被丢弃"""
+        with self._cond:
+            self.dropped += 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
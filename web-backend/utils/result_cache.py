@@ -0,0 +1,204 @@
+"""
+检测结果缓存：按 (图片内容哈希, 模型ID + 权重文件标识, 置信度, IoU) 缓存检测结果（检测框、统计和标注图片），
+重复上传的图片和客户端重试直接返回缓存结果，不解码图片也不调用模型；内存 LRU + 可选的磁盘缓存
+"""
+from collections import OrderedDict
+from pathlib import Path
+from config import Config
+import hashlib
+import json
+import os
+import threading
+
+
+def content_hash(data):
+    """图片内容哈希（原始字节）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def make_key(image_hash, model_id, weights_key, confidence, iou, variant=''):
+    """
+    缓存键：权重文件被替换或导出产物变化后 weights_key 改变，旧的缓存结果不再命中；
+    variant 区分同一检测结果的不同输出（只返回检测框、预览图尺寸）
+    """
+    raw = f'{image_hash}|{model_id}|{weights_key}|{confidence:.4f}|{iou:.4f}'
+    if variant:
+        raw += f'|{variant}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _ModelStats:
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0
+        }
+
+
+class ResultCache:
+    """内存中按字节数限制的 LRU，未命中时查找磁盘缓存（命中后放回内存）"""
+
+    def __init__(self, enabled=None, max_memory_mb=None, disk_enabled=None, disk_dir=None, disk_max_mb=None):
+        self.enabled = Config.RESULT_CACHE_ENABLED if enabled is None else enabled
+        self.max_memory = (max_memory_mb if max_memory_mb is not None else Config.RESULT_CACHE_MAX_MEMORY_MB) * 1024 * 1024
+        self.disk_enabled = Config.RESULT_CACHE_DISK_ENABLED if disk_enabled is None else disk_enabled
+        self.disk_dir = Path(disk_dir or Config.UPLOAD_FOLDER / 'result_cache')
+        self.disk_max = (disk_max_mb if disk_max_mb is not None else Config.RESULT_CACHE_DISK_MAX_MB) * 1024 * 1024
+        self._entries = OrderedDict()  # 缓存键 -> (模型ID, JSON字节)
+        self._memory_bytes = 0
+        self._disk_bytes = None  # 首次写入磁盘时统计
+        self._model_stats = {}  # 模型ID -> _ModelStats
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.disk_writes = 0
+        self.disk_evictions = 0
+
+    def _stats_for(self, model_id):
+        stats = self._model_stats.get(model_id)
+        if stats is None:
+            stats = self._model_stats[model_id] = _ModelStats()
+        return stats
+
+    def _disk_path(self, key):
+        return self.disk_dir / key[:2] / f'{key}.json'
+
+    def get(self, model_id, key):
+        """返回缓存的结果（每次返回新的对象，调用方可以修改），未命中返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats_for(model_id).hits += 1
+                return json.loads(entry[1])
+
+        payload = None
+        if self.disk_enabled:
+            try:
+                payload = self._disk_path(key).read_bytes()
+            except OSError:
+                payload = None
+        with self._lock:
+            stats = self._stats_for(model_id)
+            if payload is None:
+                stats.misses += 1
+                return None
+            stats.hits += 1
+            stats.disk_hits += 1
+            self._store(model_id, key, payload)
+        return json.loads(payload)
+
+    def put(self, model_id, key, value):
+        if not self.enabled:
+            return
+        payload = json.dumps(value).encode('utf-8')
+        with self._lock:
+            self._store(model_id, key, payload)
+        if self.disk_enabled:
+            self._write_disk(key, payload)
+
+    def _store(self, model_id, key, payload):
+        """放入内存 LRU，超过内存预算时淘汰最久未使用的结果（需持有锁）"""
+        if len(payload) > self.max_memory:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[1])
+        self._entries[key] = (model_id, payload)
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.max_memory and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _write_disk(self, key, payload):
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Result cache disk write failed: {str(e)}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(f.stat().st_size for f in self.disk_dir.rglob('*.json'))
+            else:
+                self._disk_bytes += len(payload)
+            self.disk_writes += 1
+            over = self._disk_bytes > self.disk_max
+        if over:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """磁盘缓存超过上限时按修改时间删除最旧的结果，直到降到上限的 90%"""
+        files = []
+        for path in self.disk_dir.rglob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += removed
+
+    def invalidate_model(self, model_id):
+        """模型被删除或重新训练后释放该模型的内存缓存（磁盘缓存因权重标识变化不会再命中，按容量淘汰）"""
+        with self._lock:
+            for key in [k for k, (mid, _) in self._entries.items() if mid == model_id]:
+                self._memory_bytes -= len(self._entries.pop(key)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            hits = sum(s.hits for s in self._model_stats.values())
+            misses = sum(s.misses for s in self._model_stats.values())
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'memory_mb': round(self._memory_bytes / (1024 * 1024), 2),
+                'max_memory_mb': self.max_memory / (1024 * 1024),
+                'disk_enabled': self.disk_enabled,
+                'disk_mb': round(self._disk_bytes / (1024 * 1024), 2) if self._disk_bytes is not None else None,
+                'disk_max_mb': self.disk_max / (1024 * 1024),
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0,
+                'evictions': self.evictions,
+                'disk_writes': self.disk_writes,
+                'disk_evictions': self.disk_evictions,
+                'models': {str(model_id): s.to_dict() for model_id, s in self._model_stats.items()}
+            }
+
+
+# 进程级单例
+result_cache = ResultCache()
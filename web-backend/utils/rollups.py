@@ -0,0 +1,106 @@
+"""
+检测记录预聚合：写入检测记录时在同一事务中增量更新按小时/按天的聚合表，统计接口的开销只与时间段数量有关
+"""
+from datetime import datetime, timedelta
+from extensions import db
+from models import Detection, DetectionRollupHourly, DetectionRollupDaily
+
+ROLLUP_TABLES = {
+    'hour': DetectionRollupHourly,
+    'day': DetectionRollupDaily
+}
+ROLLUP_KEY = ['bucket_start', 'model_id', 'user_id', 'detection_type']
+ROLLUP_COUNTS = ['count', 'with_helmet', 'without_helmet', 'total']
+
+
+def floor_time(dt, granularity):
+    """将时间向下对齐到统计粒度的起点（周从周一开始）"""
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _accumulate(rollups, detection, granularity):
+    """把一条检测记录累加到 {聚合键: 计数}"""
+    key = (floor_time(detection.created_at, granularity), detection.model_id or 0,
+           detection.user_id or 0, detection.detection_type)
+    counts = rollups.setdefault(key, dict.fromkeys(ROLLUP_COUNTS, 0))
+    counts['count'] += 1
+    counts['with_helmet'] += detection.with_helmet or 0
+    counts['without_helmet'] += detection.without_helmet or 0
+    counts['total'] += detection.total or 0
+
+
+def _upsert(rollup_cls, key, counts):
+    """累加到聚合表，SQLite/PostgreSQL 使用 ON CONFLICT 原子更新"""
+    values = dict(zip(ROLLUP_KEY, key), **counts)
+    table = rollup_cls.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={c: table.c[c] + stmt.excluded[c] for c in ROLLUP_COUNTS}
+        )
+        db.session.execute(stmt)
+        return
+    row = rollup_cls.query.filter_by(**dict(zip(ROLLUP_KEY, key))).with_for_update().first()
+    if row is None:
+        db.session.add(rollup_cls(**values))
+    else:
+        for c in ROLLUP_COUNTS:
+            setattr(row, c, getattr(row, c) + counts[c])
+
+
+def apply_rollups(detections):
+    """按检测记录增量更新聚合表（不提交，由调用方和检测记录在同一事务中提交）"""
+    for granularity, rollup_cls in ROLLUP_TABLES.items():
+        rollups = {}
+        for detection in detections:
+            _accumulate(rollups, detection, granularity)
+        for key, counts in rollups.items():
+            _upsert(rollup_cls, key, counts)
+
+
+def record_detection(*detections):
+    """添加检测记录并更新聚合表，调用方负责 commit"""
+    now = datetime.utcnow()
+    for detection in detections:
+        if detection.created_at is None:
+            detection.created_at = now
+        db.session.add(detection)
+    apply_rollups(detections)
+
+
+def backfill_rollups(batch_size=10000):
+    """根据原始检测记录重建聚合表，返回处理的检测记录数"""
+    totals = {granularity: {} for granularity in ROLLUP_TABLES}
+    processed = 0
+    query = Detection.query.filter(Detection.created_at.isnot(None)).order_by(Detection.id)
+    for detection in query.yield_per(batch_size):
+        for granularity, rollups in totals.items():
+            _accumulate(rollups, detection, granularity)
+        processed += 1
+
+    for granularity, rollup_cls in ROLLUP_TABLES.items():
+        rollup_cls.query.delete()
+        db.session.bulk_insert_mappings(rollup_cls, [
+            dict(zip(ROLLUP_KEY, key), **counts) for key, counts in totals[granularity].items()
+        ])
+    db.session.commit()
+    return processed
+
+
+def ensure_rollups():
+    """聚合表为空但已有检测记录时（升级后首次启动）自动回填"""
+    if DetectionRollupDaily.query.first() is None and Detection.query.first() is not None:
+        print("Detection rollups are empty, backfilling from existing detections...")
+        processed = backfill_rollups()
+        print(f"Detection rollups backfilled from {processed} detections")
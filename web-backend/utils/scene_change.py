@@ -0,0 +1,61 @@
+"""
+静止画面检测：把帧缩小为灰度小图，与上一次推理的帧比较，变化像素的比例低于阈值时认为画面没有变化，
+复用上一次的检测结果，不做推理（固定摄像头的大部分帧都是静止画面）
+"""
+from config import Config
+import cv2
+import numpy as np
+
+
+class SceneChangeDetector:
+    """
+    与上一次推理的帧（参考帧）比较，而不是与上一帧比较，缓慢的变化会累积到超过阈值；
+    连续复用超过 max_skip 帧后强制推理一次
+    """
+
+    def __init__(self, threshold=None, pixel_delta=None, size=None, max_skip=None):
+        self.threshold = Config.SCENE_CHANGE_THRESHOLD if threshold is None else threshold
+        self.pixel_delta = Config.SCENE_CHANGE_PIXEL_DELTA if pixel_delta is None else pixel_delta
+        self.size = size or Config.SCENE_CHANGE_SIZE
+        self.max_skip = Config.SCENE_CHANGE_MAX_SKIP if max_skip is None else max_skip
+        self._reference = None
+        self._run = 0  # 连续复用的帧数
+        self.checked = 0
+        self.skipped = 0
+        self.last_change = None  # 最近一次比较的变化像素比例
+
+    def _signature(self, frame):
+        """缩小到固定宽度的灰度图并轻微模糊，抑制噪声和压缩伪影"""
+        height, width = frame.shape[:2]
+        size = (self.size, max(1, round(self.size * height / width)))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def is_static(self, frame):
+        """返回 True 表示画面相对参考帧没有变化，可以复用检测结果；返回 False 时该帧成为新的参考帧"""
+        signature = self._signature(frame)
+        self.checked += 1
+        if self._reference is not None and self._reference.shape == signature.shape and self._run < self.max_skip:
+            changed = np.count_nonzero(cv2.absdiff(signature, self._reference) > self.pixel_delta)
+            self.last_change = changed / signature.size
+            if self.last_change < self.threshold:
+                self._run += 1
+                self.skipped += 1
+                return True
+        self._reference = signature
+        self._run = 0
+        return False
+
+    def reset(self):
+        """参考帧的检测结果不可用时（例如推理失败）调用，下一帧重新推理"""
+        self._reference = None
+        self._run = 0
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skip_rate': self.skipped / self.checked if self.checked > 0 else 0,
+            'last_change': self.last_change
+        }
@@ -0,0 +1,151 @@
+"""
+轻量级目标跟踪：基于IoU关联检测框，用恒速模型（α-β滤波，即稳态卡尔曼滤波）在未检测的帧上预测框的位置
+"""
+from config import Config
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """计算两组 xyxy 框之间的IoU矩阵"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = np.asarray(boxes_a, dtype=np.float32)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32)[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0).astype(np.float32)
+
+
+class Track:
+    """单个跟踪目标"""
+
+    def __init__(self, track_id, detection, frame_index):
+        self.track_id = track_id
+        self.bbox = np.asarray(detection['bbox'], dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # 每帧的位移
+        self.confidence = detection['confidence']
+        self.class_name = detection['class']
+        self.class_votes = {detection['class']: 1}
+        self.hits = 1
+        self.misses = 0  # 连续未匹配的检测帧数
+        self.last_frame = frame_index
+
+    def predict(self, frame_index):
+        """按恒速模型预测指定帧的位置"""
+        return self.bbox + self.velocity * (frame_index - self.last_frame)
+
+    def update(self, detection, frame_index, alpha, beta):
+        """α-β滤波：用观测值修正位置和速度"""
+        dt = max(1, frame_index - self.last_frame)
+        predicted = self.predict(frame_index)
+        residual = np.asarray(detection['bbox'], dtype=np.float32) - predicted
+        self.bbox = predicted + alpha * residual
+        self.velocity = self.velocity + beta * residual / dt
+        self.confidence = detection['confidence']
+        self.class_name = detection['class']
+        self.class_votes[detection['class']] = self.class_votes.get(detection['class'], 0) + 1
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame_index
+
+    def majority_class(self):
+        """整个轨迹中出现次数最多的类别（用于按人统计是否佩戴安全帽）"""
+        return max(self.class_votes.items(), key=lambda item: item[1])[0]
+
+
+class IoUTracker:
+    """
+    按帧序号调用：检测帧调用 update() 关联检测框并分配轨迹ID，跳过的帧调用 predict() 获取预测框
+    """
+
+    def __init__(self, iou_threshold=None, max_age=None, min_hits=None, max_misses=None, alpha=0.6, beta=0.2):
+        self.iou_threshold = iou_threshold if iou_threshold is not None else Config.TRACKER_IOU_THRESHOLD
+        self.max_age = max_age if max_age is not None else Config.TRACKER_MAX_AGE  # 轨迹丢失多少帧后删除
+        self.min_hits = min_hits if min_hits is not None else Config.TRACKER_MIN_HITS  # 至少匹配多少次才计为一个人
+        # 连续未匹配超过该检测帧数的轨迹不再绘制预测框（仍保留到 max_age 以便重新关联）
+        self.max_misses = max_misses if max_misses is not None else Config.TRACKER_PREDICT_MAX_MISSES
+        self.alpha = alpha
+        self.beta = beta
+        self.tracks = []
+        self.finished_tracks = []
+        self._next_id = 1
+
+    def _expire(self, frame_index):
+        alive = []
+        for track in self.tracks:
+            if frame_index - track.last_frame > self.max_age:
+                self.finished_tracks.append(track)
+            else:
+                alive.append(track)
+        self.tracks = alive
+
+    def update(self, detections, frame_index):
+        """关联当前帧的检测结果，为每个检测框写入 track_id"""
+        self._expire(frame_index)
+
+        predicted = [t.predict(frame_index) for t in self.tracks]
+        ious = iou_matrix(predicted, [d['bbox'] for d in detections])
+
+        # 贪心匹配：按IoU从大到小依次配对
+        matched_tracks = set()
+        matched_detections = set()
+        if ious.size > 0:
+            pairs = np.argwhere(ious >= self.iou_threshold)
+            order = np.argsort(-ious[pairs[:, 0], pairs[:, 1]]) if len(pairs) else []
+            for k in order:
+                ti, di = pairs[k]
+                if ti in matched_tracks or di in matched_detections:
+                    continue
+                matched_tracks.add(ti)
+                matched_detections.add(di)
+                track = self.tracks[ti]
+                track.update(detections[di], frame_index, self.alpha, self.beta)
+                detections[di]['track_id'] = track.track_id
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+
+        for di, detection in enumerate(detections):
+            if di in matched_detections:
+                continue
+            track = Track(self._next_id, detection, frame_index)
+            self._next_id += 1
+            self.tracks.append(track)
+            detection['track_id'] = track.track_id
+
+        return detections
+
+    def predict(self, frame_index):
+        """
+        返回已确认轨迹在指定帧的预测框（格式同检测结果）：只包含匹配次数达到 min_hits（与 summary() 相同）
+        且最近 max_misses 个检测帧内匹配过的轨迹，避免单帧误检和已离开的人留下残影
+        """
+        self._expire(frame_index)
+        predictions = []
+        for track in self.tracks:
+            if track.hits < self.min_hits or track.misses > self.max_misses:
+                continue
+            bbox = track.predict(frame_index)
+            predictions.append({
+                'class': track.class_name,
+                'confidence': track.confidence,
+                'bbox': bbox.tolist(),
+                'track_id': track.track_id
+            })
+        return predictions
+
+    def summary(self):
+        """按轨迹统计去重后的人数"""
+        tracks = [t for t in self.finished_tracks + self.tracks if t.hits >= self.min_hits]
+        with_helmet = sum(1 for t in tracks if t.majority_class() == 'with_helmet')
+        without_helmet = sum(1 for t in tracks if t.majority_class() == 'without_helmet')
+        return {
+            'unique_people': len(tracks),
+            'unique_with_helmet': with_helmet,
+            'unique_without_helmet': without_helmet
+        }
@@ -0,0 +1,336 @@
+"""
+训练任务队列：任务持久化到数据库，由独立的训练进程执行（不与请求处理争用GIL和CPU），限制并发数量并绑定CPU核心，
+支持取消和从 last.pt 继续训练
+"""
+from datetime import datetime, timedelta
+from config import Config
+from extensions import db
+from models import TrainingJob, Model
+from utils.training_progress import training_progress, parse_metrics
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+
+
+class TrainingCancelled(Exception):
+    """训练被取消（在每轮训练结束的回调中抛出）"""
+
+
+def last_checkpoint(model_id):
+    """训练中断后可用于继续训练的 last.pt"""
+    path = Config.MODELS_FOLDER / 'runs' / f'model_{model_id}' / 'weights' / 'last.pt'
+    return path if path.exists() else None
+
+
+def _finish_job(job, status, error=None):
+    """结束任务；取消时恢复模型在训练前的状态，失败时标记模型失败（不提交）"""
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    model = Model.query.get(job.model_id)
+    if model is None or model.status != 'training':
+        return
+    if status == 'cancelled':
+        model.status = job.previous_model_status or 'pending'
+    elif status == 'failed':
+        model.status = 'failed'
+        model.set_metrics({'error': error or '训练失败'})
+
+
+class TrainingJobManager:
+    """在 Web 进程中调度训练任务：认领排队的任务、启动训练进程、处理取消和进程异常退出"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Config.TRAINING_MAX_CONCURRENT
+        self._app = None
+        self._procs = {}  # job_id -> (进程, CPU槽位)
+        self._cancel_seen = {}  # job_id -> 发现取消请求的时间
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        # 训练进程使用 spawn 启动，不继承 Web 进程的线程和数据库连接
+        self._ctx = multiprocessing.get_context('spawn')
+        self._events = None  # 训练进程 -> 调度进程的进度事件队列
+
+    def init_app(self, app):
+        self._app = app
+
+        @app.before_request
+        def start_training_dispatcher():
+            # 在实际处理请求的进程中启动调度（避免调试模式下 reloader 父进程重复执行）
+            if self._thread is None:
+                self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._events = self._ctx.Queue()
+            self._thread = threading.Thread(target=self._run, name='training-dispatcher', daemon=True)
+            self._thread.start()
+            threading.Thread(target=self._relay_events, name='training-events', daemon=True).start()
+        atexit.register(self.shutdown)
+
+    def enqueue(self, model, dataset_id, params, resume=False):
+        """创建排队中的训练任务并将模型标记为训练中"""
+        job = TrainingJob(
+            model_id=model.id,
+            dataset_id=dataset_id,
+            status='queued',
+            resume=resume,
+            previous_model_status=model.status if model.status != 'training' else 'pending',
+            epochs_total=params.get('epochs') or 0
+        )
+        job.set_params(params)
+        model.status = 'training'
+        db.session.add(job)
+        db.session.commit()
+        self._wake.set()
+        return job
+
+    def active_job(self, model_id):
+        return TrainingJob.query.filter(
+            TrainingJob.model_id == model_id,
+            TrainingJob.status.in_(['queued', 'running'])
+        ).first()
+
+    def cancel(self, job):
+        """请求取消任务：排队中的任务直接取消，运行中的任务在当前轮次结束后停止"""
+        job.cancel_requested = True
+        if job.status == 'queued':
+            _finish_job(job, 'cancelled')
+        db.session.commit()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            with self._app.app_context():
+                try:
+                    self._reap()
+                    self._handle_cancellations()
+                    self._requeue_stale()
+                    self._start_queued()
+                except Exception as e:
+                    import traceback
+                    print(f"Training dispatcher error: {str(e)}")
+                    print(traceback.format_exc())
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            self._wake.wait(Config.TRAINING_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _relay_events(self):
+        """把训练进程推送的进度事件转发到进程内事件总线"""
+        while True:
+            try:
+                event = self._events.get()
+            except (EOFError, OSError):
+                return
+            training_progress.publish(event['model_id'], event)
+
+    def _reap(self):
+        """回收已退出的训练进程，进程异常退出时由调度器更新任务状态"""
+        for job_id, (proc, _) in list(self._procs.items()):
+            if proc.is_alive():
+                continue
+            proc.join()
+            with self._lock:
+                self._procs.pop(job_id, None)
+            self._cancel_seen.pop(job_id, None)
+            job = TrainingJob.query.get(job_id)
+            if job is None or job.status != 'running':
+                continue
+            if job.cancel_requested:
+                _finish_job(job, 'cancelled')
+            else:
+                _finish_job(job, 'failed', f'训练进程异常退出（退出码 {proc.exitcode}）')
+            db.session.commit()
+            training_progress.publish(job.model_id, {'type': 'status', 'model_id': job.model_id, 'job': job.to_dict()})
+            print(f"Training job {job_id} worker exited with code {proc.exitcode}, marked as {job.status}")
+
+    def _handle_cancellations(self):
+        """训练进程在每轮结束时检查取消请求，超过等待时间仍未结束则强制终止"""
+        if not self._procs:
+            return
+        cancelled = TrainingJob.query.filter(
+            TrainingJob.id.in_(list(self._procs)),
+            TrainingJob.cancel_requested.is_(True)
+        ).all()
+        now = time.monotonic()
+        for job in cancelled:
+            seen = self._cancel_seen.setdefault(job.id, now)
+            if now - seen > Config.TRAINING_CANCEL_GRACE:
+                proc = self._procs[job.id][0]
+                if proc.is_alive():
+                    print(f"Training job {job.id} did not stop within {Config.TRAINING_CANCEL_GRACE}s, terminating")
+                    proc.terminate()
+
+    def _requeue_stale(self):
+        """心跳超时的运行中任务（例如服务重启导致训练进程退出）重新排队，从 last.pt 继续训练"""
+        deadline = datetime.utcnow() - timedelta(seconds=Config.TRAINING_HEARTBEAT_TIMEOUT)
+        stale = TrainingJob.query.filter(
+            TrainingJob.status == 'running',
+            db.or_(TrainingJob.heartbeat_at.is_(None), TrainingJob.heartbeat_at < deadline)
+        ).all()
+        for job in stale:
+            if job.id in self._procs:
+                continue
+            if job.cancel_requested:
+                _finish_job(job, 'cancelled')
+            else:
+                job.status = 'queued'
+                job.resume = last_checkpoint(job.model_id) is not None
+                job.worker_pid = None
+                print(f"Training job {job.id} lost its worker, requeued (resume={job.resume})")
+        if stale:
+            db.session.commit()
+
+    def _free_slot(self):
+        used = {slot for _, slot in self._procs.values()}
+        return next(slot for slot in range(self.max_workers) if slot not in used)
+
+    def _slot_cpus(self, slot, threads):
+        """槽位对应的CPU核心（每个训练进程固定使用不同的核心）"""
+        if not Config.TRAINING_PIN_CPUS or not hasattr(os, 'sched_setaffinity'):
+            return None
+        cpu_count = os.cpu_count() or 1
+        return sorted({(slot * threads + k) % cpu_count for k in range(threads)})
+
+    def _start_queued(self):
+        threads = Config.TRAINING_CPU_THREADS or max(1, (os.cpu_count() or 1) // self.max_workers)
+        while len(self._procs) < self.max_workers:
+            job = TrainingJob.query.filter_by(status='queued').order_by(TrainingJob.id).first()
+            if job is None:
+                return
+            # 原子认领：多个 Web 进程同时调度时只有一个能把任务改为运行中
+            now = datetime.utcnow()
+            claimed = TrainingJob.query.filter_by(id=job.id, status='queued').update({
+                'status': 'running',
+                'started_at': now,
+                'heartbeat_at': now,
+                'attempts': TrainingJob.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+
+            slot = self._free_slot()
+            cpus = self._slot_cpus(slot, threads)
+            proc = self._ctx.Process(
+                target=run_training_worker,
+                args=(job.id, threads, cpus, self._events),
+                name=f'training-job-{job.id}'
+            )
+            proc.start()
+            with self._lock:
+                self._procs[job.id] = (proc, slot)
+            TrainingJob.query.filter_by(id=job.id).update({'worker_pid': proc.pid}, synchronize_session=False)
+            db.session.commit()
+            print(f"Training job {job.id} started in process {proc.pid} (threads={threads}, cpus={cpus})")
+
+    def running_count(self):
+        with self._lock:
+            return len(self._procs)
+
+    def shutdown(self):
+        """Web 进程退出时结束训练进程，任务在下次启动时从 last.pt 继续"""
+        with self._lock:
+            procs = [proc for proc, _ in self._procs.values()]
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join(timeout=10)
+
+
+def run_training_worker(job_id, cpu_threads, cpu_ids, events=None):
+    """训练进程入口"""
+    # 在导入 torch 之前限制线程数并绑定CPU核心
+    os.environ['OMP_NUM_THREADS'] = str(cpu_threads)
+    os.environ['MKL_NUM_THREADS'] = str(cpu_threads)
+    if cpu_ids and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpu_ids)
+
+    # 只初始化配置和数据库，不启动 Web 进程的后台服务
+    from app import create_worker_app
+    app = create_worker_app()
+    with app.app_context():
+        _execute_job(app, job_id, cpu_threads, events)
+
+
+def _execute_job(app, job_id, cpu_threads, events=None):
+    from routes.models import train_model_async
+    import torch
+    torch.set_num_threads(cpu_threads)
+
+    job = TrainingJob.query.get(job_id)
+    if job is None:
+        return
+    params = job.get_params()
+    resume_path = last_checkpoint(job.model_id) if job.resume else None
+    model_id, dataset_id = job.model_id, job.dataset_id
+
+    stop_heartbeat = threading.Event()
+
+    def push(event):
+        # 进度推送失败不影响训练，客户端会从 results.csv 补齐
+        if events is not None:
+            try:
+                events.put_nowait(dict(event, model_id=model_id, job_id=job_id))
+            except Exception:
+                pass
+
+    def heartbeat():
+        while not stop_heartbeat.wait(Config.TRAINING_HEARTBEAT_INTERVAL):
+            with app.app_context():
+                TrainingJob.query.filter_by(id=job_id).update(
+                    {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+
+    def on_fit_epoch_end(trainer):
+        # 每轮训练（含验证和保存 last.pt）结束后更新进度并检查取消请求
+        TrainingJob.query.filter_by(id=job_id).update({
+            'epochs_done': trainer.epoch + 1,
+            'heartbeat_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        # 与 results.csv 中该轮的数据相同：训练损失 + 验证指标（含验证损失）
+        values = {**trainer.label_loss_items(trainer.tloss, prefix='train'), **(trainer.metrics or {})}
+        push({'type': 'epoch', 'epoch': trainer.epoch + 1, 'epochs_total': trainer.epochs,
+              **parse_metrics({k.strip(): float(v) for k, v in values.items()})})
+        if db.session.query(TrainingJob.cancel_requested).filter_by(id=job_id).scalar():
+            raise TrainingCancelled()
+
+    threading.Thread(target=heartbeat, name='training-heartbeat', daemon=True).start()
+    status, error = 'failed', None
+    try:
+        train_model_async(app, model_id, dataset_id, params.get('epochs'), params.get('batch'), params.get('imgsz'),
+                          params.get('base_model'), params.get('device', 'cpu'),
+                          callbacks={'on_fit_epoch_end': on_fit_epoch_end}, resume_path=resume_path)
+        # 训练结果由 train_model_async 在自己的会话中提交，这里重新读取
+        db.session.rollback()
+        model = Model.query.get(model_id)
+        if model is not None and model.status == 'completed':
+            status = 'completed'
+        else:
+            error = ((model.get_metrics() or {}).get('error') if model else None) or '训练失败'
+    except TrainingCancelled:
+        status = 'cancelled'
+        print(f"Training job {job_id} cancelled")
+    except Exception as e:
+        error = str(e)
+    finally:
+        stop_heartbeat.set()
+        db.session.rollback()
+        job = TrainingJob.query.get(job_id)
+        _finish_job(job, status, error)
+        db.session.commit()
+        push({'type': 'status', 'job': job.to_dict()})
+        print(f"Training job {job_id} finished: {status}")
+
+
+# 进程级单例
+training_job_manager = TrainingJobManager()
@@ -0,0 +1,180 @@
+"""
+训练进度：训练进程每轮结束时推送指标（经调度进程转发到进程内事件总线，供 SSE 订阅），
+并提供 results.csv 的增量读取（记住文件偏移，每次只解析新增的行）
+"""
+from pathlib import Path
+from config import Config
+import csv
+import queue
+import threading
+
+SERIES_KEYS = ['epochs', 'train_loss', 'val_loss', 'map', 'precision', 'recall']
+TRAIN_LOSS_KEYS = ['train/box_loss', 'train/cls_loss', 'train/dfl_loss']
+VAL_LOSS_KEYS = ['val/box_loss', 'val/cls_loss', 'val/dfl_loss']
+METRIC_KEYS = {
+    'map': ['metrics/mAP50(B)', 'metrics/mAP50'],
+    'precision': ['metrics/precision(B)', 'metrics/precision'],
+    'recall': ['metrics/recall(B)', 'metrics/recall']
+}
+
+
+def parse_metrics(values):
+    """把一轮训练的指标（列名 -> 数值，列名已去除空格）转换为训练曲线的一个点（总损失 = box + cls + dfl）"""
+    def first(keys):
+        for key in keys:
+            if values.get(key) is not None:
+                return values[key]
+        return 0.0
+
+    entry = {
+        'train_loss': sum(values.get(key) or 0.0 for key in TRAIN_LOSS_KEYS),
+        'val_loss': sum(values.get(key) or 0.0 for key in VAL_LOSS_KEYS)
+    }
+    for name, keys in METRIC_KEYS.items():
+        entry[name] = first(keys)
+    return entry
+
+
+def results_csv_path(model_id):
+    """训练结果文件：训练输出到 runs/model_{id}，旧版本的训练结果可能在其子目录中"""
+    runs_dir = Config.MODELS_FOLDER / 'runs' / f'model_{model_id}'
+    direct_csv = runs_dir / 'results.csv'
+    if direct_csv.exists() or not runs_dir.exists():
+        return direct_csv
+    train_dirs = sorted([d for d in runs_dir.iterdir() if d.is_dir()], key=lambda x: x.stat().st_mtime, reverse=True)
+    for train_dir in train_dirs:
+        csv_path = train_dir / 'results.csv'
+        if csv_path.exists():
+            return csv_path
+    return direct_csv
+
+
+class ResultsTail:
+    """增量读取 results.csv：列索引只在读取表头时解析一次，之后从上次的偏移继续读取完整的新行"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._inode = inode
+        self._offset = 0
+        self._columns = None  # 去除空格后的列名 -> 列索引
+        self.series = {key: [] for key in SERIES_KEYS}
+
+    def _parse_header(self, line):
+        header = next(csv.reader([line]))
+        self._columns = {name.strip(): i for i, name in enumerate(header)}
+
+    def _parse_row(self, line):
+        row = next(csv.reader([line]))
+        values = {}
+        for name, i in self._columns.items():
+            try:
+                values[name] = float(row[i])
+            except (IndexError, ValueError):
+                pass
+        entry = parse_metrics(values)
+        self.series['epochs'].append(len(self.series['epochs']) + 1)
+        for key in SERIES_KEYS[1:]:
+            self.series[key].append(entry[key])
+
+    def read(self):
+        """读取新增的行，返回文件是否存在；文件被替换或截断时从头读取"""
+        with self._lock:
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                self._reset(None)
+                return False
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset(stat.st_ino)
+            if stat.st_size == self._offset:
+                return True
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(stat.st_size - self._offset)
+            # 训练进程可能正在写入最后一行，只处理以换行结尾的完整行
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                return True
+            self._offset += end
+            for line in data[:end].decode('utf-8', errors='replace').splitlines():
+                if not line.strip():
+                    continue
+                if self._columns is None:
+                    self._parse_header(line)
+                else:
+                    self._parse_row(line)
+            return True
+
+    def entries(self, since=0):
+        """返回第 since 轮之后的训练曲线数据（按轮次）"""
+        with self._lock:
+            epochs = self.series['epochs'][since:]
+            return [
+                {'epoch': epoch, **{key: self.series[key][since + i] for key in SERIES_KEYS[1:]}}
+                for i, epoch in enumerate(epochs)
+            ]
+
+    def snapshot(self, since=0):
+        """返回第 since 轮之后的训练曲线数据（按指标分列）"""
+        with self._lock:
+            return {key: values[since:] for key, values in self.series.items()}
+
+
+class TrainingProgress:
+    """每个模型的 results.csv 增量读取器，以及训练进度事件的订阅与发布"""
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or Config.TRAINING_STREAM_QUEUE_SIZE
+        self._tails = {}
+        self._subscribers = {}  # model_id -> [queue]
+        self._lock = threading.Lock()
+
+    def tail(self, model_id):
+        path = results_csv_path(model_id)
+        with self._lock:
+            tail = self._tails.get(model_id)
+            if tail is None or tail.path != path:
+                tail = self._tails[model_id] = ResultsTail(path)
+        tail.read()
+        return tail
+
+    def forget(self, model_id):
+        """模型被删除后释放读取器"""
+        with self._lock:
+            self._tails.pop(model_id, None)
+
+    def subscribe(self, model_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(model_id, []).append(q)
+        return q
+
+    def unsubscribe(self, model_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(model_id, [])
+            if q in subscribers:
+                subscribers.remove(q)
+            if not subscribers:
+                self._subscribers.pop(model_id, None)
+
+    def publish(self, model_id, event):
+        """向订阅该模型的客户端推送事件，队列已满的慢客户端丢弃事件（之后通过 results.csv 补齐）"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(model_id, []))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+# 进程级单例
+training_progress = TrainingProgress()
@@ -0,0 +1,250 @@
+"""
+异步视频检测任务：提交后立即返回任务ID，由有界线程池在后台处理，支持进度查询和取消
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime, timedelta
+from config import Config
+from extensions import db
+from models import VideoJob, Detection
+from utils.rollups import record_detection
+from utils.box_store import box_store
+import json
+import threading
+import time
+
+
+class VideoJobManager:
+    """管理视频检测任务的线程池、取消信号和重启恢复"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Config.VIDEO_JOB_WORKERS
+        self._executor = None
+        self._app = None
+        self._cancel_events = {}  # job_id -> threading.Event
+        self._lock = threading.Lock()
+        self._resumed = False
+
+    def init_app(self, app):
+        self._app = app
+
+        @app.before_request
+        def resume_video_jobs():
+            # 在实际处理请求的进程中恢复任务（避免调试模式下 reloader 父进程重复执行）
+            if not self._resumed:
+                self.resume_unfinished()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='video-job')
+            return self._executor
+
+    def pending_count(self):
+        """排队中和运行中的任务数量"""
+        return VideoJob.query.filter(VideoJob.status.in_(['queued', 'running'])).count()
+
+    def submit(self, job_id):
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        self._get_executor().submit(self._run_job, job_id)
+
+    def cancel(self, job):
+        """请求取消任务：排队中的任务直接取消，运行中的任务在下一帧停止"""
+        job.cancel_requested = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        with self._lock:
+            event = self._cancel_events.get(job.id)
+        if event is not None:
+            event.set()
+
+    def resume_unfinished(self):
+        """
+        启动后重新提交未完成的任务：心跳超时的运行中任务（处理进程已退出）重新排队并从头处理，
+        其他进程仍在处理的任务不受影响；排队中的任务由认领决定哪个进程处理
+        """
+        with self._lock:
+            if self._resumed:
+                return
+            self._resumed = True
+        deadline = datetime.utcnow() - timedelta(seconds=Config.VIDEO_JOB_HEARTBEAT_TIMEOUT)
+        requeued = VideoJob.query.filter(
+            VideoJob.status == 'running',
+            db.or_(VideoJob.heartbeat_at.is_(None), VideoJob.heartbeat_at < deadline)
+        ).update({'status': 'queued', 'frames_done': 0, 'fps': 0}, synchronize_session=False)
+        db.session.commit()
+        if requeued:
+            print(f"Requeued {requeued} video job(s) whose worker stopped")
+
+        jobs = VideoJob.query.filter_by(status='queued').order_by(VideoJob.id).all()
+        for job in jobs:
+            if not Path(job.input_path).exists():
+                job.status = 'failed'
+                job.error = '原始视频文件不存在，无法恢复任务'
+                job.finished_at = datetime.utcnow()
+                self._cleanup_files(job)
+        db.session.commit()
+        for job in jobs:
+            if job.status == 'queued':
+                print(f"Resuming video job {job.id}")
+                self.submit(job.id)
+
+    def _run_job(self, job_id):
+        with self._app.app_context():
+            try:
+                self._process(job_id)
+            except Exception as e:
+                import traceback
+                print(f"Video job {job_id} failed: {str(e)}")
+                print(traceback.format_exc())
+                db.session.rollback()
+                job = VideoJob.query.get(job_id)
+                if job:
+                    job.status = 'failed'
+                    job.error = str(e)
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                    self._cleanup_files(job)
+            finally:
+                with self._lock:
+                    self._cancel_events.pop(job_id, None)
+                db.session.remove()
+
+    def _heartbeat(self, job_id, stop_event):
+        """处理任务期间定期更新心跳，其他进程据此判断任务是否仍在处理"""
+        while not stop_event.wait(Config.VIDEO_JOB_HEARTBEAT_INTERVAL):
+            with self._app.app_context():
+                VideoJob.query.filter_by(id=job_id, status='running').update(
+                    {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+                db.session.remove()
+
+    def _process(self, job_id):
+        job = VideoJob.query.get(job_id)
+        if not job or job.status != 'queued':
+            return
+        if job.cancel_requested:
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        # 原子认领：多个 Web 进程同时提交同一个任务时只有一个能把任务改为运行中
+        now = datetime.utcnow()
+        claimed = VideoJob.query.filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'started_at': now,
+            'heartbeat_at': now,
+            'error': None
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        db.session.refresh(job)
+
+        stop_heartbeat = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stop_heartbeat),
+                         name=f'video-job-{job_id}-heartbeat', daemon=True).start()
+        try:
+            self._detect(job)
+        finally:
+            stop_heartbeat.set()
+
+    def _detect(self, job):
+        from routes.detect import get_detection_service
+        from utils.video_pipeline import PipelineCancelled
+
+        job_id = job.id
+
+        with self._lock:
+            cancel_event = self._cancel_events.setdefault(job_id, threading.Event())
+
+        started = time.monotonic()
+        last_update = {'time': 0.0}
+
+        def on_progress(frames_done, frames_total):
+            # 在流水线写入线程中调用，控制数据库写入频率
+            now = time.monotonic()
+            if now - last_update['time'] < Config.VIDEO_JOB_PROGRESS_INTERVAL and frames_done < frames_total:
+                return
+            last_update['time'] = now
+            elapsed = now - started
+            # 写入线程没有应用上下文，使用独立的上下文和会话更新进度
+            with self._app.app_context():
+                VideoJob.query.filter_by(id=job_id).update({
+                    'frames_done': frames_done,
+                    'frames_total': max(frames_total, frames_done),
+                    'fps': frames_done / elapsed if elapsed > 0 else 0
+                }, synchronize_session=False)
+                db.session.commit()
+                # 取消请求可能来自其他进程，通过数据库同步
+                cancel_requested = db.session.query(VideoJob.cancel_requested).filter_by(id=job_id).scalar()
+            if cancel_requested:
+                cancel_event.set()
+
+        service = get_detection_service(job.model_id)
+        service.confidence_threshold = float(job.confidence)
+        try:
+            result = service.detect_video(job.input_path, job.output_path, detection_fps=job.detection_fps,
+                                          progress_callback=on_progress, cancel_event=cancel_event,
+                                          detections_callback=box_store.video_callback(job.model_id, job.user_id))
+        except PipelineCancelled:
+            db.session.refresh(job)
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            print(f"Video job {job_id} cancelled")
+            self._cleanup_files(job)
+            return
+
+        db.session.refresh(job)
+        
+        # 关键帧较大，结果写入JSON文件而不是数据库
+        result_path = Config.UPLOAD_FOLDER / 'results' / f'job_{job_id}.json'
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+
+        detection = Detection(
+            user_id=job.user_id,
+            model_id=job.model_id,
+            detection_type='video',
+            with_helmet=result['summary']['with_helmet'],
+            without_helmet=result['summary']['without_helmet'],
+            total=result['summary']['total_detections']
+        )
+        record_detection(detection)
+
+        job.result_path = str(result_path)
+        job.frames_done = result['summary']['total_frames']
+        job.frames_total = result['summary']['total_frames']
+        job.status = 'completed'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Video job {job_id} completed")
+        self._cleanup_input(job)
+
+    def _cleanup_input(self, job):
+        input_path = Path(job.input_path)
+        if input_path.exists():
+            input_path.unlink()
+
+    def _cleanup_files(self, job):
+        """任务失败或取消后删除上传的视频和未完成的输出视频"""
+        self._cleanup_input(job)
+        if job.output_path:
+            output_path = Path(job.output_path)
+            if output_path.exists():
+                output_path.unlink()
+
+    def load_result(self, job):
+        if not job.result_path or not Path(job.result_path).exists():
+            return None
+        with open(job.result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+# 进程级单例
+video_job_manager = VideoJobManager()
@@ -0,0 +1,199 @@
+"""
+视频检测流水线：解码、推理、标注写入分别在不同阶段运行，阶段之间通过有界队列连接
+"""
+from config import Config
+import queue
+import threading
+import time
+
+_SENTINEL = object()
+
+
+class PipelineCancelled(Exception):
+    """流水线被外部取消"""
+    pass
+
+
+class VideoPipeline:
+    """
+    三阶段视频处理流水线：
+    - 解码线程：read_fn() 逐帧读取，按 frame_skip 标记需要检测的帧；static_fn(frame) 返回 True 的检测帧（静止画面）不推理
+    - 推理阶段（调用线程）：累积需要检测的帧，批量调用 infer_fn(frames)
+    - 写入线程：按原始帧顺序调用 write_fn(index, frame, detections, reused)，未检测的帧 detections 为 None，
+      静止画面的检测帧复用上一个推理帧的结果（reused 为 True）
+    队列有界，下游变慢时上游自动阻塞（背压）；各阶段均按 FIFO 处理，输出帧顺序与输入一致
+    """
+
+    def __init__(self, read_fn, infer_fn, write_fn, frame_skip=1, batch_size=None, queue_size=None,
+                 progress_fn=None, cancel_event=None, static_fn=None):
+        self.read_fn = read_fn
+        self.infer_fn = infer_fn
+        self.write_fn = write_fn
+        # progress_fn(frames_written) 在写入线程中每写完一帧调用一次
+        self.progress_fn = progress_fn
+        # cancel_event 被设置后流水线尽快停止，run() 抛出 PipelineCancelled
+        self.cancel_event = cancel_event
+        self.cancelled = False
+        self.static_fn = static_fn
+        self.frame_skip = max(1, int(frame_skip))
+        self.batch_size = max(1, batch_size or Config.VIDEO_INFERENCE_BATCH_SIZE)
+        queue_size = queue_size or Config.VIDEO_PIPELINE_QUEUE_SIZE
+        self._decode_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self.timings = {
+            'decode': 0.0,
+            'inference': 0.0,
+            'write': 0.0,
+            'total': 0.0
+        }
+        self.frames_read = 0
+        self.frames_inferred = 0
+        self.frames_static = 0  # 静止画面复用结果的检测帧数
+        self.batches = 0
+        self._last_result = None  # 最近一个推理帧的结果（按帧顺序）
+
+    def stop(self):
+        """请求提前停止流水线"""
+        self._stop.set()
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, q, item):
+        """带停止检查的阻塞写入，返回是否写入成功"""
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+
+    def _get(self, q):
+        """带停止检查的阻塞读取，停止后返回结束标记"""
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _SENTINEL
+
+    def _decode_stage(self):
+        try:
+            index = 0
+            while not self._stop.is_set():
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    self.cancelled = True
+                    self._stop.set()
+                    break
+                start = time.perf_counter()
+                ret, frame = self.read_fn()
+                self.timings['decode'] += time.perf_counter() - start
+                if not ret:
+                    break
+                index += 1
+                self.frames_read = index
+                detect = index % self.frame_skip == 0
+                # 在解码线程中比较画面变化，不占用推理阶段的时间
+                static = detect and self.static_fn is not None and self.static_fn(frame)
+                if not self._put(self._decode_queue, (index, frame, detect and not static, static)):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self._decode_queue, _SENTINEL)
+
+    def _write_stage(self):
+        try:
+            while True:
+                item = self._get(self._write_queue)
+                if item is _SENTINEL:
+                    break
+                index, frame, detections, reused = item
+                start = time.perf_counter()
+                self.write_fn(index, frame, detections, reused)
+                self.timings['write'] += time.perf_counter() - start
+                if self.progress_fn is not None:
+                    self.progress_fn(index)
+        except Exception as e:
+            self._fail(e)
+
+    def _flush(self, pending):
+        """对累积的帧批量推理，再按原始顺序交给写入线程"""
+        frames = [frame for _, frame, detect, _ in pending if detect]
+        results = []
+        if frames:
+            start = time.perf_counter()
+            results = self.infer_fn(frames)
+            self.timings['inference'] += time.perf_counter() - start
+            self.frames_inferred += len(frames)
+            self.batches += 1
+        results = iter(results)
+        for index, frame, detect, static in pending:
+            reused = False
+            if detect:
+                detections = self._last_result = next(results)
+            elif static and self._last_result is not None:
+                detections = self._last_result
+                reused = True
+                self.frames_static += 1
+            else:
+                detections = None
+            if not self._put(self._write_queue, (index, frame, detections, reused)):
+                return False
+        return True
+
+    def _infer_stage(self):
+        pending = []
+        detect_count = 0
+        while True:
+            item = self._get(self._decode_queue)
+            if item is _SENTINEL:
+                if pending and not self._stop.is_set():
+                    self._flush(pending)
+                break
+            pending.append(item)
+            if item[2]:
+                detect_count += 1
+            if detect_count >= self.batch_size:
+                if not self._flush(pending):
+                    break
+                pending = []
+                detect_count = 0
+
+    def run(self):
+        """运行流水线直到视频读取完毕，返回各阶段耗时（秒）"""
+        start = time.perf_counter()
+        decode_thread = threading.Thread(target=self._decode_stage, name='video-decode', daemon=True)
+        write_thread = threading.Thread(target=self._write_stage, name='video-write', daemon=True)
+        decode_thread.start()
+        write_thread.start()
+        try:
+            self._infer_stage()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self._write_queue, _SENTINEL)
+            decode_thread.join()
+            write_thread.join()
+        self.timings['total'] = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        if self.cancelled:
+            raise PipelineCancelled('视频检测已取消')
+
+        total = self.timings['total']
+        return {
+            'decode': round(self.timings['decode'], 3),
+            'inference': round(self.timings['inference'], 3),
+            'write': round(self.timings['write'], 3),
+            'total': round(total, 3),
+            'inference_batches': self.batches,
+            'static_frames': self.frames_static,
+            'fps': round(self.frames_read / total, 2) if total > 0 else 0
+        }
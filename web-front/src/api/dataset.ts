@@ -11,9 +11,42 @@ export interface Dataset {
   val_count?: number
   test_count?: number
   error_reason?: string  // 验证失败原因
+  index?: DatasetIndex | null  // 数据集索引摘要
   created_at: string
 }
 
+export interface DatasetSplitStats {
+  images: number
+  labeled: number
+  boxes: number
+  missing_labels: number
+  empty_labels: number
+  invalid_labels: number
+}
+
+export interface DatasetIndex {
+  image_count: number
+  box_count: number
+  splits: Record<'train' | 'val' | 'test', DatasetSplitStats>
+  classes: Record<string, { boxes: number; images: number }>
+  max_class_id: number | null
+  unreadable_images: number
+  image_size: { min_width: number; max_width: number; min_height: number; max_height: number }
+  box_size: { small: number; medium: number; large: number }
+  box_scale_histogram: { edges: number[]; counts: number[] }
+  built_at: string
+  build_seconds: number
+}
+
+export interface DatasetIndexImage {
+  path: string
+  split: 'train' | 'val' | 'test'
+  width: number
+  height: number
+  boxes: number
+  label_status: number  // 0 正常，1 缺少标签，2 空标签，3 格式错误
+}
+
 export interface DatasetImage {
   filename: string
   size: number
@@ -25,6 +58,26 @@ export interface DatasetImagesResponse {
   total: number
 }
 
+export interface DatasetIngestJob {
+  id: number
+  dataset_id: number
+  status: 'queued' | 'running' | 'completed' | 'failed'
+  archive_name?: string
+  archive_size: number
+  archive_sha256?: string
+  keep_archive: boolean
+  files_done: number
+  files_total: number
+  bytes_done: number
+  bytes_total: number
+  progress: number
+  result?: any
+  error?: string
+  created_at?: string
+  started_at?: string
+  finished_at?: string
+}
+
 export const datasetApi = {
   getDatasets: () => api.get<Dataset[]>('/datasets'),
   getDataset: (id: number) => api.get<Dataset>(`/datasets/${id}`),
@@ -35,6 +88,17 @@ export const datasetApi = {
     headers: { 'Content-Type': 'multipart/form-data' },
     timeout: 300000
   }),
+  // 后台导入，返回导入任务，通过 getIngestJob 查询进度
+  ingestDataset: (id: number, formData: FormData) => api.post<{ message: string; job: DatasetIngestJob }>(`/datasets/${id}/ingest`, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+    timeout: 0
+  }),
+  getIngestJobs: (id: number) => api.get<DatasetIngestJob[]>(`/datasets/${id}/ingest`),
+  getIngestJob: (jobId: number) => api.get<DatasetIngestJob>(`/datasets/ingest-jobs/${jobId}`),
+  getDatasetIndex: (id: number) => api.get<DatasetIndex>(`/datasets/${id}/index`),
+  rebuildDatasetIndex: (id: number) => api.post<DatasetIndex>(`/datasets/${id}/index`),
+  getDatasetIndexImages: (id: number, params?: { split?: string; label_status?: number; page?: number; per_page?: number }) =>
+    api.get<{ items: DatasetIndexImage[]; total: number; page: number; per_page: number }>(`/datasets/${id}/index/images`, { params }),
   getDatasetImages: (id: number) => api.get<DatasetImagesResponse>(`/datasets/${id}/images`),
   getDatasetImageUrl: (id: number, filename: string) => `/api/datasets/${id}/images/${filename}`,
   deleteDatasetImage: (id: number, filename: string) => api.delete(`/datasets/${id}/images/${filename}`)
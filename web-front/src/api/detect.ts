@@ -7,13 +7,22 @@ export interface DetectRequest {
 }
 
 export interface DetectResult {
-  image: string // base64 encoded image
+  image: string | null // base64 encoded image（请求参数 annotate=false 时为 null）
   detections: Detection[]
   stats: {
     total: number
     with_helmet: number
     without_helmet: number
   }
+  boxes?: DetectionBoxes  // 检测框的按列紧凑格式，第 i 个元素对应 detections[i]
+  image_scale?: number  // 预览图相对原图的缩放比例（请求 preview 时返回，检测框为原图坐标）
+  cached?: boolean  // 命中检测结果缓存
+}
+
+export interface DetectionBoxes {
+  class_id: number[]  // 0: with_helmet, 1: without_helmet
+  confidence: number[]
+  xyxy: [number, number, number, number][]
 }
 
 export interface Detection {
@@ -30,24 +39,92 @@ export interface VideoDetectResult {
     total_detections: number
     with_helmet: number
     without_helmet: number
+    skipped_frames?: number  // 画面静止、复用检测结果的帧数
   }
 }
 
+export interface BatchDetectResult {
+  results: (DetectResult & { filename: string })[]
+  errors: { filename: string; message: string }[]
+  summary: {
+    total: number
+    with_helmet: number
+    without_helmet: number
+  }
+}
+
+export interface VideoJob {
+  id: number
+  user_id: number | null
+  model_id: number | null
+  status: 'queued' | 'running' | 'completed' | 'failed' | 'cancelled'
+  confidence: number
+  detection_fps: number
+  frames_done: number
+  frames_total: number
+  progress: number
+  fps: number
+  eta: number | null
+  cancel_requested: boolean
+  error: string | null
+  created_at: string
+  started_at: string | null
+  finished_at: string | null
+}
+
+export interface ResultCacheStats {
+  enabled: boolean
+  entries: number
+  memory_mb: number
+  disk_enabled: boolean
+  disk_mb: number | null
+  hits: number
+  misses: number
+  hit_rate: number
+  models: Record<string, { hits: number; disk_hits: number; misses: number; hit_rate: number }>
+}
+
+// 响应格式：json（base64 标注图片）、boxes（只返回检测框，由前端绘制）；
+// jpeg/multipart 为二进制响应，需要直接读取响应头和响应体，不经过 api 实例
+export type DetectResponseFormat = 'json' | 'boxes' | 'jpeg' | 'multipart'
+export type PreviewSize = 'small' | 'medium' | 'large'
+
+export interface DetectOutputOptions {
+  format?: 'json' | 'boxes'
+  preview?: PreviewSize
+}
+
 export const detectApi = {
-  detectImage: (formData: FormData) => api.post<DetectResult>('/detect/image', formData, {
+  detectImage: (formData: FormData, options?: DetectOutputOptions) => api.post<DetectResult>('/detect/image', formData, {
+    params: options,
+    headers: { 'Content-Type': 'multipart/form-data' }
+  }),
+  detectBatch: (formData: FormData, options?: DetectOutputOptions) => api.post<BatchDetectResult>('/detect/batch', formData, {
+    params: options,
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
+  getResultCacheStats: () => api.get<ResultCacheStats>('/detect/cache'),
+  clearResultCache: () => api.delete('/detect/cache'),
   detectVideo: (formData: FormData) => api.post<VideoDetectResult>('/detect/video', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
     timeout: 300000 // 5 minutes for video processing
   }),
-  startRealtime: (modelId?: number, confidence?: number, fps?: number) => api.post('/detect/realtime/start', { 
+  submitVideoJob: (formData: FormData) => api.post<{ message: string; job: VideoJob }>('/detect/video/jobs', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' }
+  }),
+  getVideoJobs: () => api.get<VideoJob[]>('/detect/video/jobs'),
+  getVideoJob: (jobId: number) => api.get<VideoJob>(`/detect/video/jobs/${jobId}`),
+  cancelVideoJob: (jobId: number) => api.post(`/detect/video/jobs/${jobId}/cancel`),
+  getVideoJobResult: (jobId: number) => api.get<VideoDetectResult>(`/detect/video/jobs/${jobId}/result`),
+  startRealtime: (modelId?: number, confidence?: number, fps?: number, sessionId?: string) => api.post('/detect/realtime/start', { 
     model_id: modelId,
     confidence: confidence,
-    fps: fps
+    fps: fps,
+    session_id: sessionId
   }),
-  stopRealtime: () => api.post('/detect/realtime/stop'),
-  detectRealtimeFrame: (formData: FormData) => api.post<{ image: string; detections: Detection[] }>('/detect/realtime/frame', formData, {
+  stopRealtime: (sessionId?: string) => api.post('/detect/realtime/stop', { session_id: sessionId }),
+  detectRealtimeFrame: (formData: FormData, options?: DetectOutputOptions) => api.post<{ image?: string | null; detections: Detection[]; boxes?: DetectionBoxes; image_scale?: number; throttled?: boolean; skipped?: boolean }>('/detect/realtime/frame', formData, {
+    params: options,
     headers: { 'Content-Type': 'multipart/form-data' }
   })
 }
@@ -35,6 +35,23 @@ export interface ModelTrainingData {
   recall: number[]
 }
 
+export interface TrainingJob {
+  id: number
+  model_id: number
+  dataset_id?: number
+  status: 'queued' | 'running' | 'completed' | 'failed' | 'cancelled'
+  resume: boolean
+  epochs_done: number
+  epochs_total: number
+  progress: number
+  cancel_requested: boolean
+  attempts: number
+  error?: string
+  created_at?: string
+  started_at?: string
+  finished_at?: string
+}
+
 export const modelApi = {
   getModels: (search?: string, status?: string) => {
     const params: any = {}
@@ -52,9 +69,18 @@ export const modelApi = {
   deleteModel: (id: number) => api.delete(`/models/${id}`),
   trainModel: (data: { model_id: number; dataset_id?: number; epochs?: number; batch?: number; imgsz?: number; base_model?: string; device?: 'cpu' | 'gpu' }) => 
     api.post('/models/train', data),
+  resumeTraining: (id: number) => api.post(`/models/${id}/train/resume`),
+  getTrainingJobs: (params?: { model_id?: number; status?: string }) =>
+    api.get<TrainingJob[]>('/models/training-jobs', { params }),
+  getTrainingJob: (jobId: number) => api.get<TrainingJob>(`/models/training-jobs/${jobId}`),
+  cancelTrainingJob: (jobId: number) => api.post(`/models/training-jobs/${jobId}/cancel`),
   publishModel: (id: number) => api.post(`/models/${id}/publish`),
   unpublishModel: (id: number) => api.post(`/models/${id}/unpublish`),
-  getModelTrainingData: (id: number) => api.get<ModelTrainingData>(`/models/${id}/training`),
+  getModelTrainingData: (id: number, since?: number) =>
+    api.get<ModelTrainingData>(`/models/${id}/training`, { params: since ? { since } : undefined }),
+  // 训练进度推送（SSE），事件：epoch（每轮指标）、status（训练结束）
+  streamTraining: (id: number, since = 0) =>
+    new EventSource(`/api/models/${id}/training/stream?token=${encodeURIComponent(localStorage.getItem('token') || '')}&since=${since}`),
   getModelMetrics: (id: number) => api.get(`/models/${id}/metrics`)
 }
 
@@ -5,17 +5,58 @@ export interface Statistics {
   with_helmet: number
   without_helmet: number
   detection_rate: number
+  granularity: 'hour' | 'day' | 'week'
+  start: string
+  end: string
   daily_stats: {
     date: string
     count: number
+    with_helmet: number
+    without_helmet: number
     image: number
     video: number
     realtime: number
   }[]
 }
 
+export interface StatisticsQuery {
+  days?: number
+  start?: string
+  end?: string
+  granularity?: 'hour' | 'day' | 'week'
+}
+
+export interface DetectionRecord {
+  id: number
+  user_id: number | null
+  model_id: number | null
+  detection_type: 'image' | 'video' | 'realtime'
+  with_helmet: number
+  without_helmet: number
+  total: number
+  created_at: string
+}
+
+export interface DetectionHistoryQuery {
+  days?: number
+  limit?: number
+  cursor?: string
+  model_id?: number
+  user_id?: number
+  type?: 'image' | 'video' | 'realtime'
+  class?: 'with_helmet' | 'without_helmet'
+}
+
+export interface DetectionHistoryPage {
+  items: DetectionRecord[]
+  next_cursor: string | null
+}
+
 export const statisticsApi = {
-  getStatistics: () => api.get<Statistics>('/statistics'),
-  getDetectionHistory: (days?: number) => api.get('/statistics/history', { params: { days } })
+  getStatistics: (params?: StatisticsQuery) => api.get<Statistics>('/statistics', { params }),
+  getDetectionHistory: (params?: DetectionHistoryQuery) =>
+    api.get<DetectionHistoryPage>('/statistics/history', { params }),
+  exportDetectionHistory: (params?: Omit<DetectionHistoryQuery, 'limit' | 'cursor'> & { format?: 'ndjson' | 'csv' }) =>
+    api.get('/statistics/history/export', { params, responseType: 'blob' })
 }
 